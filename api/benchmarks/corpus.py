@@ -0,0 +1,89 @@
+import random
+
+from typing import Dict, List, Tuple
+
+FIELDS:Dict[str, List[str]] = {
+    'physics': ['quantum', 'particle', 'entropy', 'relativity', 'boson', 'lattice', 'spin', 'plasma', 'photon', 'gravity'],
+    'biology': ['protein', 'genome', 'cell', 'enzyme', 'mutation', 'tissue', 'receptor', 'neuron', 'bacteria', 'evolution'],
+    'computer science': ['algorithm', 'compiler', 'network', 'database', 'kernel', 'cache', 'graph', 'parser', 'scheduler', 'index'],
+    'economics': ['market', 'inflation', 'labour', 'pricing', 'auction', 'equilibrium', 'trade', 'credit', 'tax', 'growth'],
+    'chemistry': ['catalyst', 'polymer', 'reaction', 'solvent', 'molecule', 'oxidation', 'crystal', 'ligand', 'acid', 'bond'],
+}
+COMMON_WORDS:List[str] = [
+    'the', 'of', 'and', 'a', 'we', 'results', 'method', 'model', 'analysis', 'data', 'study', 'shows', 'using',
+    'proposed', 'approach', 'effect', 'these', 'between', 'experiment', 'observed', 'significant', 'framework',
+]
+LAST_NAMES:List[str] = ['Martin', 'Nguyen', 'Smith', 'Garcia', 'Kowalski', 'Dubois', 'Tanaka', 'Okafor', 'Rossi', 'Silva']
+
+def _escape(text:str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def _wrap(text:str, width:int=90) -> List[str]:
+    lines:List[str] = []
+    current = ''
+    for word in text.split():
+        if current and len(current) + len(word) + 1 > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f'{current} {word}' if current else word
+    if current:
+        lines.append(current)
+    return lines
+
+def make_pdf(pages:List[str]) -> bytes:
+    # minimal pdf 1.4 writer, one helvetica text block per page, enough for PdfReader.extract_text
+    nb_pages = len(pages)
+    font_id = 3 + 2 * nb_pages
+    objects = [
+        '<< /Type /Catalog /Pages 2 0 R >>',
+        f"<< /Type /Pages /Kids [{' '.join(f'{3 + 2 * index} 0 R' for index in range(nb_pages))}] /Count {nb_pages} >>",
+    ]
+    for index, page in enumerate(pages):
+        lines = ' T* '.join(f'({_escape(line)}) Tj' for line in _wrap(page))
+        stream = f'BT /F1 10 Tf 12 TL 50 760 Td {lines} ET'
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * index} 0 R /Resources << /Font << /F1 {font_id} 0 R >> >> >>')
+        objects.append(f'<< /Length {len(stream.encode())} >>\nstream\n{stream}\nendstream')
+    objects.append('<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    output = b'%PDF-1.4\n'
+    offsets:List[int] = []
+    for index, content in enumerate(objects):
+        offsets.append(len(output))
+        output += f'{index + 1} 0 obj\n{content}\nendobj\n'.encode()
+    xref_offset = len(output)
+    output += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    for offset in offsets:
+        output += f'{offset:010d} 00000 n \n'.encode()
+    output += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode()
+    return output
+
+def make_article_pages(rng:random.Random, nb_pages:int, words_per_page:int) -> Tuple[str, List[str]]:
+    field = rng.choice(list(FIELDS))
+    vocabulary = FIELDS[field]
+    authors = ', '.join(f'{rng.choice("ABCDEFGHJKLMNPRST")}. {rng.choice(LAST_NAMES)}' for _ in range(rng.randint(1, 4)))
+    title = ' '.join(rng.choice(vocabulary).capitalize() for _ in range(rng.randint(3, 7)))
+    pages:List[str] = []
+    for page_index in range(nb_pages):
+        words = [rng.choice(vocabulary) if rng.random() < 0.3 else rng.choice(COMMON_WORDS) for _ in range(words_per_page)]
+        header = f'{title} {authors} {rng.randint(1995, 2024)}' if page_index == 0 else f'page {page_index + 1}'
+        pages.append(f'{header} {" ".join(words)}')
+    return field, pages
+
+def make_corpus(nb_documents:int, min_pages:int, max_pages:int, words_per_page:int, seed:int) -> List[Tuple[str, bytes]]:
+    rng = random.Random(seed)
+    documents:List[Tuple[str, bytes]] = []
+    for index in range(nb_documents):
+        _, pages = make_article_pages(rng, rng.randint(min_pages, max_pages), words_per_page)
+        # the index keeps every document unique, so that none is deduplicated
+        pages[0] = f'document {seed}-{index} {pages[0]}'
+        documents.append((f'synthetic-{index:05d}.pdf', make_pdf(pages)))
+    return documents
+
+def make_queries(nb_queries:int, seed:int) -> List[str]:
+    rng = random.Random(seed + 1)
+    queries:List[str] = []
+    for _ in range(nb_queries):
+        vocabulary = FIELDS[rng.choice(list(FIELDS))]
+        queries.append(' '.join(rng.sample(vocabulary, k=rng.randint(2, 4))))
+    return queries
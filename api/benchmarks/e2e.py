@@ -0,0 +1,288 @@
+# run from api/ so that the application packages resolve: python -m benchmarks.e2e --help
+import json
+import time
+import asyncio
+import contextlib
+
+import click
+import httpx
+import numpy as np
+
+from qdrant_client import AsyncQdrantClient
+
+from benchmarks.corpus import make_corpus, make_queries
+from benchmarks.fake_openai import FakeAsyncOpenAI, FakeLatency
+
+from log_handler.log import configure_logging, stop_logging
+from mapper.mapper import Mapper
+from metrics.metrics import metrics
+from routers.article import Article
+from routers.monitoring import Monitoring
+from server.server import ApiServer
+
+from settings.server_settings import ServerSettings, ExtractorSettings
+from settings.openai_settings import OpenAiSettings
+from settings.qdrant_settings import QdrantSettings
+from settings.ingestion_settings import IngestionSettings
+from settings.cache_settings import EmbeddingCacheSettings, SearchCacheSettings
+from settings.collection_settings import CollectionSettings
+from settings.log_settings import LogSettings
+
+from typing import Any, Dict, List, Optional, Tuple
+
+# (metric path, True when higher is better)
+COMPARED_METRICS:List[Tuple[str, bool]] = [
+    ('ingest.documents_per_second', True),
+    ('ingest.p50_ms', False),
+    ('ingest.p95_ms', False),
+    ('search.queries_per_second', True),
+    ('search.p50_ms', False),
+    ('search.p95_ms', False),
+    ('search.p99_ms', False),
+]
+
+def percentiles(latencies:List[float]) -> Dict[str, float]:
+    if not latencies:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    values = np.asarray(latencies) * 1000
+    return {f'p{q}_ms': round(float(np.percentile(values, q)), 2) for q in (50, 95, 99)}
+
+def stage_snapshot() -> Dict[str, Tuple[int, float]]:
+    return {
+        labelvalues[0]: (sum(counts), metrics.stage_duration.sums[labelvalues])
+        for labelvalues, counts in metrics.stage_duration.counts.items()
+    }
+
+def stage_breakdown(before:Dict[str, Tuple[int, float]], after:Dict[str, Tuple[int, float]]) -> Dict[str, Dict[str, float]]:
+    breakdown:Dict[str, Dict[str, float]] = {}
+    for stage, (count, total) in after.items():
+        previous_count, previous_total = before.get(stage, (0, 0.0))
+        if count == previous_count:
+            continue
+        breakdown[stage] = {
+            'count': count - previous_count,
+            'total_s': round(total - previous_total, 4),
+            'mean_ms': round((total - previous_total) / (count - previous_count) * 1000, 2),
+        }
+    return breakdown
+
+@contextlib.asynccontextmanager
+async def benchmark_app(fake_openai:FakeAsyncOpenAI, qdrant_path:Optional[str], embedding_cache:bool, search_cache:bool):
+    # the application is wired like runner.run_services, only openai and the qdrant server are replaced
+    ingestion_settings = IngestionSettings()
+    collection_settings = CollectionSettings()
+    mapper = Mapper(
+        openai_settings=OpenAiSettings(OPENAI_API_KEY='benchmark'),
+        qdrant_settings=QdrantSettings(QDRANT_HOST=':memory:', QDRANT_PORT=6333),
+        extractor_settings=ExtractorSettings(),
+        cache_settings=EmbeddingCacheSettings(EMBEDDING_CACHE_MEMORY_ENABLED=embedding_cache, EMBEDDING_CACHE_DISK_ENABLED=False),
+        search_cache_settings=SearchCacheSettings(SEARCH_CACHE_ENABLED=search_cache),
+    )
+    async with mapper as context_mapper:
+        await context_mapper.shared_openai_client.close()
+        context_mapper.shared_openai_client = fake_openai
+        if qdrant_path is not None:
+            await context_mapper.shared_qdrant_client.close()
+            context_mapper.shared_qdrant_client = AsyncQdrantClient(path=qdrant_path)
+
+        server = ApiServer(server_settings=ServerSettings(HOST='127.0.0.1', PORT=0))
+        article_router = Article(mapper=context_mapper, ingestion_settings=ingestion_settings, collection_settings=collection_settings)
+        server.add_router(target_router=article_router.router)
+        server.add_router(target_router=Monitoring(mapper=context_mapper).router)
+        server.add_lifespan_callbacks(on_startup=context_mapper.warm_up)
+        server.add_lifespan_callbacks(on_startup=article_router.start, on_shutdown=article_router.stop)
+
+        async with server.api.router.lifespan_context(server.api):
+            transport = httpx.ASGITransport(app=server.api)
+            async with httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=None) as client:
+                yield client
+
+async def ingest_jobs(client:httpx.AsyncClient, documents:List[Tuple[str, bytes]], concurrency:int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def submit(filename:str, content:bytes) -> str:
+        async with semaphore:
+            while True:
+                response = await client.post('/v1/article/add', files={'file': (filename, content, 'application/pdf')})
+                # a full ingestion queue answers 503, the client backs off like a real uploader would
+                if response.status_code == 503:
+                    await asyncio.sleep(0.05)
+                    continue
+                response.raise_for_status()
+                return response.json()['job_id']
+
+    start = time.perf_counter()
+    job_ids = set(await asyncio.gather(*[submit(filename, content) for filename, content in documents]))
+    while True:
+        jobs = (await client.get('/v1/article/jobs', params={'limit': len(documents)})).json()
+        finished = [job for job in jobs if job['job_id'] in job_ids and job['stage'] in ('done', 'failed')]
+        if len(finished) == len(job_ids):
+            break
+        await asyncio.sleep(0.05)
+    seconds = time.perf_counter() - start
+
+    latencies = [job['history'][-1]['at'] - job['history'][0]['at'] for job in finished]
+    nb_failed = sum(job['stage'] == 'failed' for job in finished)
+    return {
+        'mode': 'jobs',
+        'nb_documents': len(documents),
+        'nb_failed': nb_failed,
+        'seconds': round(seconds, 3),
+        'documents_per_second': round((len(documents) - nb_failed) / seconds, 3),
+        **percentiles(latencies),
+    }
+
+async def ingest_batches(client:httpx.AsyncClient, documents:List[Tuple[str, bytes]], concurrency:int, batch_size:int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies:List[float] = []
+
+    async def send(batch:List[Tuple[str, bytes]]) -> int:
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post('/v1/article/add-batch', files=[('files', (filename, content, 'application/pdf')) for filename, content in batch])
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+            return response.json()['nb_failure']
+
+    start = time.perf_counter()
+    batches = [documents[index:index + batch_size] for index in range(0, len(documents), batch_size)]
+    nb_failed = sum(await asyncio.gather(*[send(batch) for batch in batches]))
+    seconds = time.perf_counter() - start
+    return {
+        'mode': 'batch',
+        'batch_size': batch_size,
+        'nb_documents': len(documents),
+        'nb_failed': nb_failed,
+        'seconds': round(seconds, 3),
+        'documents_per_second': round((len(documents) - nb_failed) / seconds, 3),
+        **percentiles(latencies),
+    }
+
+async def run_searches(client:httpx.AsyncClient, queries:List[str], concurrency:int, mode:str, nb_neighbors:int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies:List[float] = []
+    nb_errors = 0
+
+    async def search(query:str):
+        nonlocal nb_errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post('/v1/article/search', json={'query': query, 'mode': mode, 'nb_neighbors': nb_neighbors})
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                nb_errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[search(query) for query in queries])
+    seconds = time.perf_counter() - start
+    return {
+        'mode': mode,
+        'nb_queries': len(queries),
+        'nb_errors': nb_errors,
+        'seconds': round(seconds, 3),
+        'queries_per_second': round(len(latencies) / seconds, 3),
+        **percentiles(latencies),
+    }
+
+def _lookup(results:Dict[str, Any], path:str) -> Optional[float]:
+    value:Any = results
+    for key in path.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+def compare_to_baseline(results:Dict[str, Any], baseline:Dict[str, Any], max_regression:float) -> Dict[str, Any]:
+    comparison:Dict[str, Any] = {}
+    for path, higher_is_better in COMPARED_METRICS:
+        current, previous = _lookup(results, path), _lookup(baseline, path)
+        if not current or not previous:
+            continue
+        change = (current - previous) / previous
+        regression = -change if higher_is_better else change
+        comparison[path] = {
+            'current': current,
+            'baseline': previous,
+            'change': round(change, 4),
+            'regressed': regression > max_regression,
+        }
+    return comparison
+
+async def run_benchmark(options:Dict[str, Any]) -> Dict[str, Any]:
+    fake_openai = FakeAsyncOpenAI(
+        chat_latency=FakeLatency(options['chat_latency_ms'], options['chat_latency_per_1k_ms'], options['jitter'], options['seed']),
+        embedding_latency=FakeLatency(options['embedding_latency_ms'], 0.0, options['jitter'], options['seed'] + 1),
+    )
+    documents = make_corpus(options['nb_documents'], options['min_pages'], options['max_pages'], options['words_per_page'], options['seed'])
+    queries = make_queries(options['nb_queries'] + options['warmup_queries'], options['seed'])
+    results:Dict[str, Any] = {'config': options, 'stages': {}}
+
+    async with benchmark_app(fake_openai, options['qdrant_path'], options['embedding_cache'], options['search_cache']) as client:
+        before = stage_snapshot()
+        if options['ingest_mode'] == 'batch':
+            results['ingest'] = await ingest_batches(client, documents, options['concurrency'], options['batch_size'])
+        else:
+            results['ingest'] = await ingest_jobs(client, documents, options['concurrency'])
+        results['stages']['ingest'] = stage_breakdown(before, stage_snapshot())
+
+        await run_searches(client, queries[:options['warmup_queries']], options['concurrency'], options['search_mode'], options['nb_neighbors'])
+        before = stage_snapshot()
+        results['search'] = await run_searches(client, queries[options['warmup_queries']:], options['concurrency'], options['search_mode'], options['nb_neighbors'])
+        results['stages']['search'] = stage_breakdown(before, stage_snapshot())
+
+    results['openai_calls'] = {'chat': fake_openai.nb_chat_calls, 'embeddings': fake_openai.nb_embedding_calls}
+    return results
+
+@click.command()
+@click.option('--nb-documents', default=100, type=int)
+@click.option('--min-pages', default=1, type=int)
+@click.option('--max-pages', default=8, type=int)
+@click.option('--words-per-page', default=400, type=int)
+@click.option('--nb-queries', default=500, type=int)
+@click.option('--warmup-queries', default=20, type=int, help='searches sent before the measured ones')
+@click.option('--concurrency', default=16, type=int, help='in-flight client requests')
+@click.option('--ingest-mode', type=click.Choice(['jobs', 'batch']), default='jobs')
+@click.option('--batch-size', default=16, type=int, help='documents per /add-batch request')
+@click.option('--search-mode', type=click.Choice(['fast', 'enriched', 'speculative', 'sparse', 'hybrid']), default='fast')
+@click.option('--nb-neighbors', default=10, type=int)
+@click.option('--chat-latency-ms', default=400.0, type=float)
+@click.option('--chat-latency-per-1k-ms', default=20.0, type=float, help='extra chat latency per 1000 tokens')
+@click.option('--embedding-latency-ms', default=60.0, type=float)
+@click.option('--jitter', default=0.2, type=float, help='relative latency jitter of the fake openai')
+@click.option('--qdrant-path', default=None, help='on-disk local qdrant directory, in memory if missing')
+@click.option('--embedding-cache/--no-embedding-cache', default=False)
+@click.option('--search-cache/--no-search-cache', default=False)
+@click.option('--seed', default=0, type=int)
+@click.option('--output', default=None, help='path of the json results, printed on stdout if missing')
+@click.option('--baseline', default=None, help='json results of a previous run to compare with')
+@click.option('--max-regression', default=0.1, type=float, help='relative regression tolerated against the baseline')
+def main(**options):
+    # the other settings (workers, batch sizes, collection profile...) come from the environment like for the server
+    baseline_path = options.pop('baseline')
+    output = options.pop('output')
+    max_regression = options['max_regression']
+
+    configure_logging(LogSettings(LOG_LEVEL='WARNING', LOG_FILE=None))
+    try:
+        results = asyncio.run(run_benchmark(options))
+    finally:
+        stop_logging()
+
+    regressed = False
+    if baseline_path is not None:
+        with open(baseline_path) as fp:
+            results['comparison'] = compare_to_baseline(results, json.load(fp), max_regression)
+        regressed = any(entry['regressed'] for entry in results['comparison'].values())
+
+    serialized = json.dumps(results, indent=2)
+    if output is None:
+        print(serialized)
+    else:
+        with open(output, 'w') as fp:
+            fp.write(serialized)
+    if regressed:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import json
+import time
+import random
+import asyncio
+import hashlib
+
+import numpy as np
+
+from openai.types import CreateEmbeddingResponse, Embedding, Model
+from openai.types.chat import ChatCompletion
+from openai.types.chat.chat_completion import Choice
+from openai.types.chat.chat_completion_message import ChatCompletionMessage
+from openai.types.completion_usage import CompletionUsage
+from openai.types.create_embedding_response import Usage
+
+from benchmarks.corpus import FIELDS
+
+from typing import Any, Dict, List, Optional
+
+def _estimate_tokens(text:str) -> int:
+    return len(text) // 4 + 1
+
+def _stable_seed(text:str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], 'little')
+
+def fake_embedding(text:str, dimensions:int) -> List[float]:
+    # hashed bag of words plus a little noise: deterministic, and texts sharing words end up close
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in text.lower().split():
+        seed = _stable_seed(word)
+        vector[seed % dimensions] += 1.0 if (seed >> 32) & 1 else -1.0
+    vector += np.random.default_rng(_stable_seed(text)).standard_normal(dimensions).astype(np.float32) * 0.05
+    norm = float(np.linalg.norm(vector)) or 1.0
+    return (vector / norm).tolist()
+
+def fake_article(text:str) -> Dict[str, Any]:
+    words = text.replace('#', ' ').split()
+    if words and words[0] == 'article:':
+        words = words[1:]
+    counts = {field: sum(word in vocabulary for word in words) for field, vocabulary in FIELDS.items()}
+    return {
+        'title': ' '.join(words[:8]),
+        'field': max(counts, key=counts.get),
+        'authors': [f'Author {_stable_seed(text) % 97}'],
+        'publication_date': f'{2000 + _stable_seed(text) % 25}-01-01',
+        'summary': ' '.join(words[:60]),
+    }
+
+class FakeLatency:
+    def __init__(self, base_ms:float, per_1k_tokens_ms:float=0.0, jitter:float=0.0, seed:int=0):
+        self.base_ms = base_ms
+        self.per_1k_tokens_ms = per_1k_tokens_ms
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+
+    async def wait(self, nb_tokens:int):
+        delay_ms = self.base_ms + self.per_1k_tokens_ms * nb_tokens / 1000
+        if self.jitter:
+            delay_ms *= 1.0 + self.rng.uniform(-self.jitter, self.jitter)
+        if delay_ms > 0:
+            await asyncio.sleep(delay_ms / 1000)
+
+class FakeRawResponse:
+    def __init__(self, parsed:Any, headers:Dict[str, str]):
+        self.parsed = parsed
+        self.headers = headers
+
+    def parse(self) -> Any:
+        return self.parsed
+
+class _RawEndpoint:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+
+    async def create(self, **kwargs) -> FakeRawResponse:
+        parsed = await self.endpoint.create(**kwargs)
+        return FakeRawResponse(parsed, self.endpoint.client.rate_limit_headers())
+
+class FakeChatCompletions:
+    def __init__(self, client:'FakeAsyncOpenAI', latency:FakeLatency):
+        self.client = client
+        self.latency = latency
+        self.with_raw_response = _RawEndpoint(self)
+
+    async def create(self, messages:List[Dict[str, str]], model:str, response_format:Optional[Dict[str, str]]=None, **kwargs) -> ChatCompletion:
+        prompt_tokens = sum(_estimate_tokens(message['content']) for message in messages)
+        user_content = messages[-1]['content']
+        if response_format is not None and response_format.get('type') == 'json_object':
+            content = json.dumps(fake_article(user_content))
+        else:
+            content = ' '.join(user_content.replace('#', ' ').split()[:60])
+        completion_tokens = _estimate_tokens(content)
+        await self.latency.wait(prompt_tokens + completion_tokens)
+        self.client.nb_chat_calls += 1
+        return ChatCompletion(
+            id=f'chatcmpl-fake-{self.client.nb_chat_calls}',
+            object='chat.completion',
+            created=int(time.time()),
+            model=model,
+            choices=[Choice(index=0, finish_reason='stop', message=ChatCompletionMessage(role='assistant', content=content))],
+            usage=CompletionUsage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, total_tokens=prompt_tokens + completion_tokens),
+        )
+
+class FakeChat:
+    def __init__(self, client:'FakeAsyncOpenAI', latency:FakeLatency):
+        self.completions = FakeChatCompletions(client, latency)
+
+class FakeEmbeddings:
+    def __init__(self, client:'FakeAsyncOpenAI', latency:FakeLatency):
+        self.client = client
+        self.latency = latency
+        self.with_raw_response = _RawEndpoint(self)
+
+    async def create(self, input:List[str], model:str, dimensions:Optional[int]=None, **kwargs) -> CreateEmbeddingResponse:
+        texts = [input] if isinstance(input, str) else input
+        nb_tokens = sum(_estimate_tokens(text) for text in texts)
+        await self.latency.wait(nb_tokens)
+        dimensions = dimensions or self.client.default_dimensions
+        # hashing thousands of texts is cpu work, it must not stall the server loop being measured
+        vectors = await asyncio.to_thread(lambda: [fake_embedding(text, dimensions) for text in texts])
+        self.client.nb_embedding_calls += 1
+        return CreateEmbeddingResponse(
+            object='list',
+            model=model,
+            data=[Embedding(object='embedding', index=index, embedding=vector) for index, vector in enumerate(vectors)],
+            usage=Usage(prompt_tokens=nb_tokens, total_tokens=nb_tokens),
+        )
+
+class FakeModels:
+    async def retrieve(self, model:str, **kwargs) -> Model:
+        return Model(id=model, created=0, object='model', owned_by='benchmark')
+
+class FakeAsyncOpenAI:
+    # drop-in for the AsyncOpenAI attributes used by Mapper: chat, embeddings, models and close
+    def __init__(
+        self,
+        chat_latency:Optional[FakeLatency]=None,
+        embedding_latency:Optional[FakeLatency]=None,
+        default_dimensions:int=1536,
+        requests_per_minute:int=1_000_000,
+        tokens_per_minute:int=1_000_000_000,
+    ):
+        self.default_dimensions = default_dimensions
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.nb_chat_calls = 0
+        self.nb_embedding_calls = 0
+        self.chat = FakeChat(self, chat_latency or FakeLatency(0))
+        self.embeddings = FakeEmbeddings(self, embedding_latency or FakeLatency(0))
+        self.models = FakeModels()
+
+    def rate_limit_headers(self) -> Dict[str, str]:
+        return {
+            'x-ratelimit-limit-requests': str(self.requests_per_minute),
+            'x-ratelimit-limit-tokens': str(self.tokens_per_minute),
+        }
+
+    async def close(self):
+        pass
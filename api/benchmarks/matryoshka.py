@@ -0,0 +1,141 @@
+import json
+import time
+from uuid import uuid4
+
+import click
+import numpy as np
+
+from qdrant_client import QdrantClient, models
+
+from typing import Dict, List
+
+FULL_VECTOR = 'full'
+PREFIX_VECTOR = 'prefix'
+
+def make_corpus(nb_points:int, dimensions:int, seed:int) -> np.ndarray:
+    # variance decays with the dimension index, so that prefixes carry most of the signal like matryoshka embeddings do
+    rng = np.random.default_rng(seed)
+    scales = 1.0 / np.sqrt(1.0 + np.arange(dimensions) / 32.0)
+    vectors = rng.standard_normal((nb_points, dimensions)).astype(np.float32) * scales
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def make_queries(corpus:np.ndarray, nb_queries:int, noise:float, seed:int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    picked = corpus[rng.integers(0, len(corpus), nb_queries)]
+    queries = picked + noise * rng.standard_normal(picked.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def normalize(vectors:np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def percentiles(latencies:List[float]) -> Dict[str, float]:
+    values = np.asarray(latencies) * 1000
+    return {f'p{q}_ms': float(np.percentile(values, q)) for q in (50, 95, 99)}
+
+def recall(found:List[List[int]], expected:np.ndarray) -> float:
+    hits = [len(set(ids) & set(truth.tolist())) / len(truth) for ids, truth in zip(found, expected)]
+    return float(np.mean(hits))
+
+def upload(client:QdrantClient, collection_name:str, corpus:np.ndarray, prefix_size:int, two_stage:bool, batch_size:int=256):
+    prefixes = normalize(corpus[:, :prefix_size])
+    for start in range(0, len(corpus), batch_size):
+        points = []
+        for index in range(start, min(start + batch_size, len(corpus))):
+            vector = corpus[index].tolist()
+            if two_stage:
+                vector = {FULL_VECTOR: vector, PREFIX_VECTOR: prefixes[index].tolist()}
+            points.append(models.PointStruct(id=index, vector=vector))
+        client.upsert(collection_name=collection_name, points=points, wait=True)
+
+def run_single_stage(client:QdrantClient, corpus:np.ndarray, queries:np.ndarray, limit:int):
+    collection_name = f'bench_single_{uuid4().hex[:8]}'
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(size=corpus.shape[1], distance=models.Distance.COSINE),
+    )
+    upload(client, collection_name, corpus, prefix_size=0, two_stage=False)
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        response = client.query_points(collection_name=collection_name, query=query.tolist(), limit=limit)
+        latencies.append(time.perf_counter() - start)
+        found.append([point.id for point in response.points])
+    client.delete_collection(collection_name=collection_name)
+    return latencies, found
+
+def run_two_stage(client:QdrantClient, corpus:np.ndarray, queries:np.ndarray, limit:int, prefix_size:int, oversampling:int):
+    collection_name = f'bench_two_stage_{uuid4().hex[:8]}'
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config={
+            PREFIX_VECTOR: models.VectorParams(size=prefix_size, distance=models.Distance.COSINE),
+            FULL_VECTOR: models.VectorParams(
+                size=corpus.shape[1],
+                distance=models.Distance.COSINE,
+                hnsw_config=models.HnswConfigDiff(m=0),
+            ),
+        },
+    )
+    upload(client, collection_name, corpus, prefix_size=prefix_size, two_stage=True)
+    query_prefixes = normalize(queries[:, :prefix_size])
+    latencies, found = [], []
+    for query, query_prefix in zip(queries, query_prefixes):
+        start = time.perf_counter()
+        response = client.query_points(
+            collection_name=collection_name,
+            prefetch=models.Prefetch(query=query_prefix.tolist(), using=PREFIX_VECTOR, limit=limit * oversampling),
+            query=query.tolist(),
+            using=FULL_VECTOR,
+            limit=limit,
+        )
+        latencies.append(time.perf_counter() - start)
+        found.append([point.id for point in response.points])
+    client.delete_collection(collection_name=collection_name)
+    return latencies, found
+
+@click.command()
+@click.option('--location', default=':memory:', help='qdrant url, or :memory: for the in-process engine')
+@click.option('--nb-points', default=20_000, type=int)
+@click.option('--nb-queries', default=200, type=int)
+@click.option('--dimensions', default=1024, type=int)
+@click.option('--prefix-size', default=256, type=int)
+@click.option('--oversampling', default=4, type=int)
+@click.option('--limit', default=10, type=int)
+@click.option('--seed', default=0, type=int)
+@click.option('--output', default=None, help='path of the json report, printed on stdout if missing')
+def main(location:str, nb_points:int, nb_queries:int, dimensions:int, prefix_size:int, oversampling:int, limit:int, seed:int, output:str):
+    client = QdrantClient(location=location)
+    corpus = make_corpus(nb_points, dimensions, seed)
+    queries = make_queries(corpus, nb_queries, noise=0.5, seed=seed)
+    expected = np.argsort(-(queries @ corpus.T), axis=1)[:, :limit]
+
+    single_latencies, single_found = run_single_stage(client, corpus, queries, limit)
+    two_stage_latencies, two_stage_found = run_two_stage(client, corpus, queries, limit, prefix_size, oversampling)
+
+    # raw float32 vector bytes: the graph is built on the searched vector only
+    report = {
+        'location': location,
+        'nb_points': nb_points,
+        'dimensions': dimensions,
+        'prefix_size': prefix_size,
+        'single_stage': {
+            'recall': recall(single_found, expected),
+            'indexed_vector_bytes': nb_points * dimensions * 4,
+            **percentiles(single_latencies),
+        },
+        'two_stage': {
+            'recall': recall(two_stage_found, expected),
+            'indexed_vector_bytes': nb_points * prefix_size * 4,
+            'rescoring_vector_bytes': nb_points * dimensions * 4,
+            **percentiles(two_stage_latencies),
+        },
+    }
+    serialized = json.dumps(report, indent=2)
+    if output is None:
+        print(serialized)
+    else:
+        with open(output, 'w') as fp:
+            fp.write(serialized)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+import io
+import tarfile
+
+from typing import List, Tuple
+
+ARCHIVE_CONTENT_TYPES = ('application/x-tar', 'application/gzip', 'application/x-gzip', 'application/x-gtar')
+ARCHIVE_EXTENSIONS = ('.tar', '.tar.gz', '.tgz')
+
+def is_archive(filename:str, content_type:str) -> bool:
+    return content_type in ARCHIVE_CONTENT_TYPES or (filename or '').lower().endswith(ARCHIVE_EXTENSIONS)
+
+def unpack_pdfs(content:bytes) -> List[Tuple[str, bytes]]:
+    documents:List[Tuple[str, bytes]] = []
+    with tarfile.open(fileobj=io.BytesIO(content), mode='r:*') as archive:
+        for member in archive:
+            if not member.isfile() or not member.name.lower().endswith('.pdf'):
+                continue
+            documents.append((member.name, archive.extractfile(member).read()))
+    return documents
@@ -0,0 +1,149 @@
+import os
+import asyncio
+import tempfile
+
+from collections import deque
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from PyPDF2 import PdfReader
+
+from log_handler.log import logger
+from metrics.metrics import metrics
+
+from settings.server_settings import ExtractorSettings
+
+from typing import AsyncIterator, Deque, List, Optional
+
+class ExtractionError(Exception):
+    pass
+
+def worker_pid() -> int:
+    return os.getpid()
+
+def count_pages(file_path:str) -> int:
+    reader = PdfReader(file_path)
+    return len(reader.pages)
+
+def extract_page_range(file_path:str, start:int, stop:int) -> List[str]:
+    # runs inside a pool worker: every worker opens the temp file on its own, only the path is pickled
+    reader = PdfReader(file_path)
+    return [reader.pages[index].extract_text() or '' for index in range(start, stop)]
+
+class PdfExtractor:
+    def __init__(self, extractor_settings:ExtractorSettings):
+        self.extractor_settings = extractor_settings
+        self.pool:Optional[ProcessPoolExecutor] = None
+
+    def __make_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.extractor_settings.pool_size,
+            mp_context=get_context('spawn')
+        )
+
+    def start(self):
+        self.pool = self.__make_pool()
+        logger.debug(f'Pdf extractor started with {self.extractor_settings.pool_size} workers')
+
+    async def warm_up(self):
+        # spawned workers start lazily and each one re-imports the application, the first upload must not pay for it
+        if self.pool is None:
+            return
+        pids = await asyncio.gather(*[self.__run(worker_pid) for _ in range(self.extractor_settings.pool_size)])
+        logger.debug(f'Pdf extractor warmed up {len(set(pids))} workers')
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def __dump_to_tmp_file(self, content:bytes) -> str:
+        with tempfile.NamedTemporaryFile(suffix='.pdf', dir=self.extractor_settings.tmp_dir, delete=False) as fp:
+            fp.write(content)
+        return fp.name
+
+    def __replace_pool(self, pool:ProcessPoolExecutor):
+        if self.pool is not pool:
+            return
+        self.pool = self.__make_pool()
+        # the worker stuck on a page cannot be told apart from the others: the old pool is terminated as a whole,
+        # the tasks it still held fail with BrokenProcessPool and are run again on the new one
+        for process in list(pool._processes.values()):
+            process.terminate()
+        pool.shutdown(wait=False)
+        logger.warning('Pdf extractor workers replaced')
+
+    async def __run(self, fn, *args, timeout:Optional[float]=None):
+        while True:
+            pool = self.pool
+            if pool is None:
+                raise ExtractionError('Pdf extractor is not started')
+            try:
+                future = pool.submit(fn, *args)
+                return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+            except asyncio.TimeoutError:
+                # wait_for only gives up on the result, a task already handed to a worker would keep it busy forever
+                if not future.cancel() and not future.done():
+                    self.__replace_pool(pool)
+                raise ExtractionError(f'Pdf extraction exceeded {timeout:g}s')
+            except BrokenProcessPool:
+                if self.pool is not pool:
+                    continue
+                # a worker crashed on its own, the next documents get a working pool
+                self.__replace_pool(pool)
+                raise ExtractionError('Pdf extractor worker crashed')
+
+    async def iter_pages(self, content:bytes) -> AsyncIterator[str]:
+        if self.pool is None:
+            raise ExtractionError('Pdf extractor is not started')
+
+        file_path = await asyncio.to_thread(self.__dump_to_tmp_file, content)
+        futures:Deque[asyncio.Future] = deque()
+        loop = asyncio.get_running_loop()
+        # only the time spent waiting on the pool counts, not the time the consumer takes between two pages
+        remaining = self.extractor_settings.document_timeout
+
+        def range_timeout() -> float:
+            if remaining <= 0:
+                raise ExtractionError(f'Pdf extraction exceeded {self.extractor_settings.document_timeout:g}s for the document')
+            return min(self.extractor_settings.timeout, remaining)
+
+        try:
+            started = loop.time()
+            with metrics.track_stage('pdf_extract'):
+                nb_pages = await self.__run(count_pages, file_path, timeout=range_timeout())
+            remaining -= loop.time() - started
+            if nb_pages > self.extractor_settings.max_pages:
+                logger.warning(f'Pdf has {nb_pages} pages, only the first {self.extractor_settings.max_pages} will be extracted')
+                nb_pages = self.extractor_settings.max_pages
+
+            step = self.extractor_settings.pages_per_task
+            starts = iter(range(0, nb_pages, step))
+
+            def schedule_next_range():
+                start = next(starts, None)
+                if start is not None:
+                    futures.append(asyncio.ensure_future(
+                        self.__run(extract_page_range, file_path, start, min(start + step, nb_pages), timeout=range_timeout())
+                    ))
+
+            # only pool_size page ranges are extracted ahead of the consumer, so the pages held stay bounded
+            for _ in range(self.extractor_settings.pool_size):
+                schedule_next_range()
+            while futures:
+                started = loop.time()
+                with metrics.track_stage('pdf_extract'):
+                    pages = await futures.popleft()
+                remaining -= loop.time() - started
+                schedule_next_range()
+                for page in pages:
+                    yield page
+        finally:
+            for future in futures:
+                future.cancel()
+            os.remove(file_path)
+
+    async def extract(self, content:bytes) -> str:
+        return '\n'.join([page async for page in self.iter_pages(content)])
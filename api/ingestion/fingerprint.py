@@ -0,0 +1,48 @@
+import hashlib
+
+from uuid import UUID, uuid5
+
+from typing import Optional
+
+ARTICLE_NAMESPACE = UUID('6f1c2a9e-3d4b-5e8f-9a0b-1c2d3e4f5a6b')
+
+def fingerprint_bytes(content:bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+class TextFingerprint:
+    # hashes the whitespace collapsed and lowercased text page by page, without holding the whole document
+    def __init__(self):
+        self.hash = hashlib.sha256()
+        self.empty = True
+
+    def update(self, text:str):
+        words = text.split()
+        if not words:
+            return
+        normalized = ' '.join(words).lower()
+        self.hash.update((normalized if self.empty else ' ' + normalized).encode())
+        self.empty = False
+
+    def hexdigest(self) -> str:
+        return self.hash.hexdigest()
+
+def fingerprint_text(text:str) -> str:
+    fingerprint = TextFingerprint()
+    fingerprint.update(text)
+    return fingerprint.hexdigest()
+
+def article_id_from_fingerprint(fingerprint:str, tenant:Optional[str]=None) -> str:
+    # the same document uploaded by two tenants gives two articles, the default tenant keeps the ids from before tenancy
+    if tenant is None:
+        return str(uuid5(ARTICLE_NAMESPACE, fingerprint))
+    return str(uuid5(ARTICLE_NAMESPACE, f'{tenant}\x00{fingerprint}'))
+
+def passage_id(article_id:str, chunk_index:int) -> str:
+    return str(uuid5(ARTICLE_NAMESPACE, f'{article_id}:{chunk_index}'))
+
+def normalize_article_id(article_id:str) -> str:
+    # article ids are uuids, anything else would only be refused by qdrant; the canonical form is the one it returns
+    try:
+        return str(UUID(article_id))
+    except ValueError:
+        raise ValueError(f'`{article_id}` is not a valid article id, a uuid is expected')
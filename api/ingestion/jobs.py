@@ -0,0 +1,267 @@
+import os
+import time
+import sqlite3
+import asyncio
+
+import zmq
+import zmq.asyncio as aiozmq
+
+from uuid import uuid4
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from log_handler.log import logger
+
+from mapper.mapper import Mapper
+from settings.ingestion_settings import IngestionSettings
+from schemas.job_schemas import JobStage, JobEvent, JobStatus
+
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+StageCallback = Callable[[JobStage], None]
+JobHandler = Callable[[bytes, bool, Optional[str], StageCallback], Awaitable[Tuple[str, bool]]]
+
+class QueueFullError(Exception):
+    pass
+
+class JobRegistry:
+    def __init__(self, max_size:int):
+        self.max_size = max_size
+        self.jobs:Dict[str, JobStatus] = OrderedDict()
+
+    def create(self, filename:str, tenant:Optional[str]=None) -> JobStatus:
+        job = JobStatus(job_id=str(uuid4()), filename=filename, tenant=tenant)
+        job.history.append(JobEvent(stage=JobStage.QUEUED, at=time.time()))
+        self.jobs[job.job_id] = job
+        while len(self.jobs) > self.max_size:
+            self.jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id:str) -> Optional[JobStatus]:
+        return self.jobs.get(job_id)
+
+    def list(self, limit:int, stage:Optional[JobStage]=None, tenant:Optional[str]=None) -> List[JobStatus]:
+        jobs = [
+            job for job in reversed(self.jobs.values())
+            if (stage is None or job.stage == stage) and job.tenant == tenant
+        ]
+        return jobs[:limit]
+
+    def save(self, job:JobStatus):
+        # the jobs are updated in place in memory
+        pass
+
+    async def fetch(self, job_id:str) -> Optional[JobStatus]:
+        return self.get(job_id)
+
+    async def fetch_list(self, limit:int, stage:Optional[JobStage]=None, tenant:Optional[str]=None) -> List[JobStatus]:
+        return self.list(limit, stage, tenant)
+
+    def close(self):
+        pass
+
+    def update(self, job_id:str, stage:JobStage, article_id:Optional[str]=None, error:Optional[str]=None, duplicate:bool=False):
+        job = self.get(job_id)
+        if job is None:
+            return
+        job.stage = stage
+        job.history.append(JobEvent(stage=stage, at=time.time()))
+        if article_id is not None:
+            job.article_id = article_id
+        if error is not None:
+            job.error = error
+        job.duplicate = duplicate
+        self.save(job)
+
+class SqliteJobRegistry(JobRegistry):
+    # shared by the server workers: a job is processed by the worker that accepted it, but polled on any of them
+    FINAL_STAGES = (JobStage.DONE.value, JobStage.FAILED.value)
+
+    def __init__(self, max_size:int, path:str):
+        # the jobs of this process stay in memory too, their stage changes are applied without waiting on the file
+        super().__init__(max_size)
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=5.0, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS jobs (seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT UNIQUE NOT NULL, pid INTEGER, tenant TEXT, stage TEXT NOT NULL, data TEXT NOT NULL)'
+        )
+        # one thread owns the connection: the queries leave the event loop, and a read sees the writes queued before it
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='job-registry')
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.connection.close()
+
+    def __submit(self, fn, *args) -> Future:
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(self.__log_error)
+        return future
+
+    @staticmethod
+    def __log_error(future:Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f'Error while writing to the job registry: {str(future.exception())}')
+
+    def __insert(self, job_id:str, pid:int, tenant:Optional[str], stage:str, data:str):
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO jobs (job_id, pid, tenant, stage, data) VALUES (?, ?, ?, ?, ?)',
+                (job_id, pid, tenant, stage, data)
+            )
+            self.connection.execute('DELETE FROM jobs WHERE seq <= ?', (cursor.lastrowid - self.max_size,))
+
+    def __write(self, stage:str, data:str, job_id:str):
+        with self.connection:
+            self.connection.execute('UPDATE jobs SET stage = ?, data = ? WHERE job_id = ?', (stage, data, job_id))
+
+    def __read(self, job_id:str) -> Optional[JobStatus]:
+        row = self.connection.execute('SELECT data FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return JobStatus.model_validate_json(row[0]) if row is not None else None
+
+    def __read_list(self, limit:int, stage:Optional[JobStage], tenant:Optional[str]) -> List[JobStatus]:
+        rows = self.connection.execute(
+            'SELECT data FROM jobs WHERE tenant IS ? AND (? IS NULL OR stage = ?) ORDER BY seq DESC LIMIT ?',
+            (tenant, stage and stage.value, stage and stage.value, limit)
+        ).fetchall()
+        return [JobStatus.model_validate_json(data) for data, in rows]
+
+    def create(self, filename:str, tenant:Optional[str]=None) -> JobStatus:
+        job = super().create(filename, tenant)
+        self.__submit(self.__insert, job.job_id, os.getpid(), tenant, job.stage.value, job.model_dump_json())
+        return job
+
+    def get(self, job_id:str) -> Optional[JobStatus]:
+        job = super().get(job_id)
+        if job is not None:
+            return job
+        return self.__submit(self.__read, job_id).result()
+
+    def list(self, limit:int, stage:Optional[JobStage]=None, tenant:Optional[str]=None) -> List[JobStatus]:
+        return self.__submit(self.__read_list, limit, stage, tenant).result()
+
+    def save(self, job:JobStatus):
+        # serialized now, written in order by the registry thread
+        self.__submit(self.__write, job.stage.value, job.model_dump_json(), job.job_id)
+
+    async def fetch(self, job_id:str) -> Optional[JobStatus]:
+        job = super().get(job_id)
+        if job is not None:
+            return job
+        return await asyncio.wrap_future(self.__submit(self.__read, job_id))
+
+    async def fetch_list(self, limit:int, stage:Optional[JobStage]=None, tenant:Optional[str]=None) -> List[JobStatus]:
+        return await asyncio.wrap_future(self.__submit(self.__read_list, limit, stage, tenant))
+
+    def __unfinished(self, pid:Optional[int]) -> List[str]:
+        rows = self.connection.execute(
+            f"SELECT job_id FROM jobs WHERE stage NOT IN ({','.join('?' * len(self.FINAL_STAGES))}) AND (? IS NULL OR pid = ?)",
+            (*self.FINAL_STAGES, pid, pid)
+        ).fetchall()
+        return [job_id for job_id, in rows]
+
+    def fail_unfinished(self, error:str, pid:Optional[int]=None) -> int:
+        # the jobs of a stopped worker (or of a previous server run) will never finish, their pollers are told so
+        job_ids = self.__submit(self.__unfinished, pid).result()
+        for job_id in job_ids:
+            self.update(job_id, JobStage.FAILED, error=error)
+        return len(job_ids)
+
+class IngestionQueue:
+    def __init__(self, mapper:Mapper, ingestion_settings:IngestionSettings, handler:JobHandler):
+        self.mapper = mapper
+        self.ingestion_settings = ingestion_settings
+        self.handler = handler
+        if ingestion_settings.jobs_path is not None:
+            self.registry:JobRegistry = SqliteJobRegistry(max_size=ingestion_settings.jobs_history, path=ingestion_settings.jobs_path)
+        else:
+            self.registry = JobRegistry(max_size=ingestion_settings.jobs_history)
+        self.push_socket:Optional[aiozmq.Socket] = None
+        self.workers:List[asyncio.Task] = []
+        self.accepting = False
+        self.nb_pending = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    async def start(self):
+        self.push_socket = self.mapper.shared_ctx.socket(zmq.PUSH)
+        self.push_socket.setsockopt(zmq.SNDHWM, self.ingestion_settings.queue_size)
+        self.push_socket.setsockopt(zmq.LINGER, 0)
+        self.push_socket.bind(self.ingestion_settings.queue_address)
+        for worker_id in range(self.ingestion_settings.nb_workers):
+            # sockets are connected before the tasks run so that the first submit already finds its peers
+            pull_socket = self.mapper.shared_ctx.socket(zmq.PULL)
+            pull_socket.setsockopt(zmq.RCVHWM, 1)
+            pull_socket.setsockopt(zmq.LINGER, 0)
+            pull_socket.connect(self.ingestion_settings.queue_address)
+            task = asyncio.create_task(
+                self.__worker(worker_id, pull_socket),
+                name=f'{Mapper.BLOCKED_TASK}ingestion-worker-{worker_id}'
+            )
+            self.workers.append(task)
+        self.accepting = True
+        logger.debug(f'Ingestion queue started with {self.ingestion_settings.nb_workers} workers on {self.ingestion_settings.queue_address}')
+
+    async def drain(self):
+        self.accepting = False
+        if self.nb_pending == 0:
+            return
+        logger.info(f'Draining {self.nb_pending} ingestion jobs (timeout {self.ingestion_settings.drain_timeout}s)...')
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout=self.ingestion_settings.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f'{self.nb_pending} ingestion jobs were not finished before the drain timeout')
+
+    async def stop(self):
+        await self.drain()
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        if self.push_socket is not None:
+            self.push_socket.close()
+            self.push_socket = None
+        self.registry.close()
+
+    async def submit(self, filename:str, content:bytes, force:bool=False, tenant:Optional[str]=None) -> JobStatus:
+        if not self.accepting:
+            raise QueueFullError('Ingestion queue is not accepting jobs, the server is shutting down')
+        job = self.registry.create(filename, tenant)
+        try:
+            frames = [job.job_id.encode(), b'1' if force else b'0', (tenant or '').encode(), content]
+            await self.push_socket.send_multipart(frames, flags=zmq.NOBLOCK, copy=False)
+        except zmq.Again:
+            self.registry.update(job.job_id, JobStage.FAILED, error='ingestion queue is full')
+            raise QueueFullError(f'Ingestion queue is full ({self.ingestion_settings.queue_size} pending jobs)')
+        self.nb_pending += 1
+        self.idle.clear()
+        return job
+
+    async def __worker(self, worker_id:int, pull_socket:aiozmq.Socket):
+        try:
+            while True:
+                job_id, force, tenant, content = await pull_socket.recv_multipart()
+                try:
+                    await self.__process(job_id.decode(), force == b'1', tenant.decode() or None, content)
+                finally:
+                    self.nb_pending -= 1
+                    if self.nb_pending == 0:
+                        self.idle.set()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            pull_socket.close()
+            logger.debug(f'Ingestion worker {worker_id} stopped')
+
+    async def __process(self, job_id:str, force:bool, tenant:Optional[str], content:bytes):
+        def on_stage(stage:JobStage):
+            self.registry.update(job_id, stage)
+
+        try:
+            article_id, duplicate = await self.handler(content, force, tenant, on_stage)
+            self.registry.update(job_id, JobStage.DONE, article_id=article_id, duplicate=duplicate)
+        except asyncio.CancelledError:
+            self.registry.update(job_id, JobStage.FAILED, error='ingestion was interrupted')
+            raise
+        except Exception as e:
+            logger.error(f"Error while processing ingestion job {job_id}: {str(e)}")
+            self.registry.update(job_id, JobStage.FAILED, error=str(e))
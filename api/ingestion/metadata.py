@@ -0,0 +1,36 @@
+import re
+
+from datetime import date, datetime
+
+from typing import Optional
+
+DATE_FORMATS = (
+    '%Y-%m-%d', '%Y/%m/%d', '%Y.%m.%d', '%Y-%m', '%Y/%m', '%Y',
+    '%B %Y', '%b %Y', '%b. %Y', '%d %B %Y', '%d %b %Y', '%B %d, %Y', '%b %d, %Y', '%B %d %Y', '%b %d %Y',
+)
+YEAR_PATTERN = re.compile(r'\b(1[89]\d\d|20\d\d)\b')
+
+def normalize_publication_date(value:Optional[str]) -> Optional[date]:
+    # the llm copies the date as printed in the paper: "2021", "March 2021", "2021-03-15T00:00:00"...
+    if not value:
+        return None
+    text = ' '.join(str(value).replace(',', ', ').split()).strip(' .').replace(' ,', ',')
+    if re.match(r'\d{4}-\d{2}-\d{2}T', text):
+        text = text[:10]
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    # anything else that names a year is kept at the year resolution
+    match = YEAR_PATTERN.search(text)
+    return date(int(match.group(1)), 1, 1) if match else None
+
+def with_publication_fields(payload:dict) -> dict:
+    # `published_at` (rfc 3339) and `publication_year` are the indexed forms, `publication_date` stays as extracted
+    published = normalize_publication_date(payload.get('publication_date'))
+    if published is None:
+        return payload
+    payload['published_at'] = f'{published.isoformat()}T00:00:00Z'
+    payload['publication_year'] = published.year
+    return payload
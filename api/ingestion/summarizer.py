@@ -0,0 +1,174 @@
+import json
+import asyncio
+
+from log_handler.log import logger
+
+from mapper.mapper import Mapper
+from mapper.governor import Priority
+from metrics.metrics import metrics
+from settings.ingestion_settings import IngestionSettings
+from settings.system_settings import article_summarizer_prompt, chunk_summarizer_prompt, partial_summaries_header
+
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+SUMMARY_MODEL:str = 'gpt-4o-mini'
+
+class Chunk:
+    def __init__(self, index:int, first_page:int, last_page:int, text:str):
+        self.index = index
+        self.first_page = first_page
+        self.last_page = last_page
+        self.text = text
+
+class Passage:
+    def __init__(self, index:int, first_page:int, last_page:int, summary:str):
+        self.index = index
+        self.first_page = first_page
+        self.last_page = last_page
+        self.summary = summary
+
+    def to_payload(self, article_id:str) -> dict:
+        return {
+            'article_id': article_id,
+            'chunk_index': self.index,
+            'first_page': self.first_page,
+            'last_page': self.last_page,
+            'summary': self.summary,
+        }
+
+def split_text(text:str, max_tokens:int) -> List[str]:
+    # a single page bigger than the budget is cut on characters, with the same estimate as Mapper.estimate_tokens
+    max_chars = max_tokens * 4
+    return [text[start:start + max_chars] for start in range(0, len(text), max_chars)] or ['']
+
+def group_texts(texts:List[str], max_tokens:int) -> List[List[str]]:
+    groups:List[List[str]] = []
+    current:List[str] = []
+    current_tokens = 0
+    for text in texts:
+        nb_tokens = Mapper.estimate_tokens(text)
+        if current and current_tokens + nb_tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += nb_tokens
+    if current:
+        groups.append(current)
+    return groups
+
+async def chunk_pages(pages:AsyncIterator[str], max_tokens:int) -> AsyncIterator[Chunk]:
+    # always yields at least one chunk, an empty document is summarized like before
+    parts:List[str] = []
+    nb_tokens = 0
+    index = 0
+    first_page = last_page = 1
+    page_number = 0
+    async for page in pages:
+        page_number += 1
+        for piece in split_text(page, max_tokens):
+            piece_tokens = Mapper.estimate_tokens(piece)
+            if parts and nb_tokens + piece_tokens > max_tokens:
+                yield Chunk(index, first_page, last_page, '\n'.join(parts))
+                parts, nb_tokens = [], 0
+                index += 1
+                first_page = page_number
+            parts.append(piece)
+            nb_tokens += piece_tokens
+            last_page = page_number
+    yield Chunk(index, first_page, last_page, '\n'.join(parts))
+
+def parse_article_json(content:str) -> dict:
+    json_doc = content.strip()
+    mark0 = json_doc.index('{')
+    mark1 = json_doc[-1::-1].index('}')
+    json_doc = json_doc[mark0:len(json_doc) - mark1]
+    return json.loads(json_doc)
+
+class Summarizer:
+    def __init__(self, mapper:Mapper, ingestion_settings:IngestionSettings):
+        self.mapper = mapper
+        self.max_tokens = ingestion_settings.summary_chunk_tokens
+        self.concurrency = ingestion_settings.summary_concurrency
+
+    async def __complete(self, system_prompt:str, user_content:str, **kwargs) -> str:
+        completion_res = await self.mapper.chat_completion(
+            model=SUMMARY_MODEL,
+            messages=[
+                {'role': 'system', 'content': system_prompt},
+                {'role': 'user', 'content': user_content}
+            ],
+            priority=Priority.BULK,
+            stream=False,
+            **kwargs
+        )
+        return completion_res.choices[0].message.content
+
+    async def parse_article(self, text:str) -> dict:
+        with metrics.track_stage('llm_summary'):
+            content = await self.__complete(
+                article_summarizer_prompt,
+                f'article: ###\n{text}\n###',
+                response_format={'type': 'json_object'}
+            )
+        return parse_article_json(content)
+
+    async def __summarize_section(self, text:str) -> str:
+        with metrics.track_stage('llm_summary_chunk'):
+            return await self.__complete(chunk_summarizer_prompt, f'section: ###\n{text}\n###', max_output_tokens=512)
+
+    async def __map_chunk(self, semaphore:asyncio.Semaphore, chunk:Chunk) -> Passage:
+        try:
+            summary = await self.__summarize_section(chunk.text)
+            return Passage(chunk.index, chunk.first_page, chunk.last_page, summary)
+        finally:
+            semaphore.release()
+
+    async def __dispatch(self, semaphore:asyncio.Semaphore, tasks:List[asyncio.Task], chunk:Chunk):
+        # the slot is taken before the task exists: extraction waits instead of piling up chunks in memory
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(self.__map_chunk(semaphore, chunk)))
+
+    async def __reduce(self, summaries:List[str]) -> dict:
+        # summaries that do not fit in one prompt are merged level by level
+        while len(summaries) > 1 and sum(Mapper.estimate_tokens(summary) for summary in summaries) > self.max_tokens:
+            groups = group_texts(summaries, self.max_tokens)
+            if len(groups) == len(summaries):
+                # every summary fills a prompt on its own, merging again would not shrink anything
+                logger.warning(f'Partial summaries exceed {self.max_tokens} tokens, the end of the article is truncated')
+                break
+            logger.debug(f'Reducing {len(summaries)} partial summaries in {len(groups)} groups')
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def merge(group:List[str]) -> str:
+                async with semaphore:
+                    return await self.__summarize_section('\n\n'.join(group))
+
+            summaries = await asyncio.gather(*[merge(group) for group in groups])
+        text = '\n\n'.join(summaries)[:self.max_tokens * 4]
+        return await self.parse_article(partial_summaries_header + '\n\n' + text)
+
+    async def summarize(self, pages:AsyncIterator[str], on_extracted:Callable[[], Awaitable[bool]]) -> Optional[Tuple[dict, List[Passage]]]:
+        # on_extracted runs once every page is read, before the final summary: returning False aborts it
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks:List[asyncio.Task] = []
+        last_chunk:Optional[Chunk] = None
+        try:
+            # the map step starts with the second chunk, a document that fits in one prompt keeps a single call
+            async for chunk in chunk_pages(pages, self.max_tokens):
+                if last_chunk is not None:
+                    await self.__dispatch(semaphore, tasks, last_chunk)
+                last_chunk = chunk
+
+            if not await on_extracted():
+                return None
+            if not tasks:
+                return await self.parse_article(last_chunk.text), []
+
+            await self.__dispatch(semaphore, tasks, last_chunk)
+            last_chunk = None
+            passages:List[Passage] = await asyncio.gather(*tasks)
+            logger.debug(f'Reducing the summaries of {len(passages)} chunks')
+            return await self.__reduce([passage.summary for passage in passages]), passages
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -1,8 +1,22 @@
+import os
+import copy
+import json
+import time
+import queue
+import random
 import logging
+import logging.handlers
+import multiprocessing
 from colorlog import ColoredFormatter
 
+from settings.log_settings import LogSettings
+
+from typing import Dict, List, Optional, Tuple
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
+# third party libraries may configure the root logger, records must not be printed twice
+logger.propagate = False
 
 formatter = ColoredFormatter(
     '%(log_color)s%(asctime)-15s %(levelname)-8s [%(filename)s:%(lineno)-4d] %(message)s',
@@ -19,24 +33,171 @@ formatter = ColoredFormatter(
     style='%'
 )
 
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(formatter)
-
-file_handler = logging.FileHandler('log_handler/app.log')
-file_handler.setLevel(logging.DEBUG)
-
 file_formatter = logging.Formatter(
     '%(asctime)s - %(levelname)-8s [%(filename)s:%(lineno)-4d] %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S'
 )
-file_handler.setFormatter(file_formatter)
 
+class JsonFormatter(logging.Formatter):
+    def format(self, record:logging.LogRecord) -> str:
+        document = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'process': record.process,
+            'file': record.filename,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            document['exception'] = record.exc_text
+        return json.dumps(document, ensure_ascii=False)
+
+class ThreadQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record:logging.LogRecord) -> logging.LogRecord:
+        # the message is merged on the caller thread, the traceback stays apart so that formatters can place it
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = file_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class DebugSampler(logging.Filter):
+    # keeps a fraction of the DEBUG records and at most `rate_limit` per second for every call site
+    def __init__(self, sample_rate:float=1.0, rate_limit:float=0.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.rate_limit = rate_limit
+        self.buckets:Dict[Tuple[str, int], Tuple[float, float]] = {}
+
+    def filter(self, record:logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        if self.rate_limit <= 0:
+            return True
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        level, updated_at = self.buckets.get(site, (self.rate_limit, now))
+        level = min(self.rate_limit, level + (now - updated_at) * self.rate_limit)
+        if level < 1.0:
+            self.buckets[site] = (level, now)
+            return False
+        self.buckets[site] = (level - 1.0, now)
+        return True
+
+console_handler = logging.StreamHandler()
+console_handler.setFormatter(formatter)
+
+# until configure_logging runs, records go straight to the console and no file is opened
 logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+
+_listener:Optional[logging.handlers.QueueListener] = None
+_listener_pid:Optional[int] = None
+# set by the process that writes the log files, the workers it forks send their records there instead of rotating the same files
+_process_queue:Optional[multiprocessing.Queue] = None
+_process_queue_pid:Optional[int] = None
+
+def _make_file_handler(log_settings:LogSettings) -> logging.Handler:
+    directory = os.path.dirname(log_settings.file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if log_settings.rotation == 'time':
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            log_settings.file_path,
+            when=log_settings.rotation_when,
+            backupCount=log_settings.backup_count,
+            encoding='utf-8',
+        )
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_settings.file_path,
+            maxBytes=log_settings.max_bytes,
+            backupCount=log_settings.backup_count,
+            encoding='utf-8',
+        )
+    file_handler.setFormatter(JsonFormatter() if log_settings.file_format == 'json' else file_formatter)
+    return file_handler
+
+def _apply_levels(log_settings:LogSettings):
+    logger.setLevel(log_settings.level.upper())
+    for pair in filter(None, (item.strip() for item in log_settings.levels.split(','))):
+        name, _, level = pair.partition('=')
+        logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+def _install_queue_handler(log_queue, log_settings:LogSettings):
+    queue_handler = ThreadQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSampler(log_settings.debug_sample_rate, log_settings.debug_rate_limit))
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    _apply_levels(log_settings)
+
+def _restore_console_handler():
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(console_handler)
+
+def configure_logging(log_settings:LogSettings, for_workers:bool=False):
+    # records are only queued on the caller thread, formatting and disk writes happen on the listener thread
+    global _listener, _listener_pid, _process_queue, _process_queue_pid
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    # a forked process inherits the listener of its parent without its thread, it is simply dropped
+    _listener = None
+
+    if _process_queue is not None and _process_queue_pid != os.getpid():
+        # a worker forked by the process that owns the files: the records are forwarded to its listener
+        _install_queue_handler(_process_queue, log_settings)
+        return
+
+    handlers:List[logging.Handler] = []
+    if log_settings.console_format == 'json':
+        json_console_handler = logging.StreamHandler()
+        json_console_handler.setFormatter(JsonFormatter())
+        handlers.append(json_console_handler)
+    else:
+        handlers.append(console_handler)
+    if log_settings.file_path:
+        handlers.append(_make_file_handler(log_settings))
+
+    # the records of the forked workers cross a process boundary, ThreadQueueHandler already makes them picklable
+    log_queue = multiprocessing.Queue() if for_workers else queue.SimpleQueue()
+    _install_queue_handler(log_queue, log_settings)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+    if for_workers:
+        _process_queue = log_queue
+        _process_queue_pid = _listener_pid
+
+def stop_logging():
+    # flushes the queued records, the console handler takes over again
+    global _listener, _process_queue
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+        for handler in _listener.handlers:
+            if handler is not console_handler:
+                handler.close()
+        _listener = None
+        if _process_queue is not None and _process_queue_pid == os.getpid():
+            _process_queue.close()
+            _process_queue = None
+    elif _process_queue is None or _process_queue_pid == os.getpid():
+        return
+    _restore_console_handler()
 
 if __name__ == '__main__':
+    configure_logging(LogSettings())
     logger.debug('This is a debugging message')
     logger.info('This is an information')
     logger.warning('This is a warning message')
     logger.error('This is an error')
     logger.critical('This is a critical message')
+    stop_logging()
@@ -1,12 +1,25 @@
+import sys
+import asyncio
 from multiprocessing import Process
 import click 
 from dotenv import load_dotenv
 
-from settings.server_settings import ServerSettings
+from settings.server_settings import ServerSettings, ExtractorSettings
 from settings.openai_settings import OpenAiSettings
 from settings.qdrant_settings import QdrantSettings
+from settings.ingestion_settings import IngestionSettings
+from settings.cache_settings import EmbeddingCacheSettings, SearchCacheSettings
+from settings.collection_settings import CollectionSettings
+from settings.log_settings import LogSettings
+from settings.reindex_settings import ReindexSettings
 
-from runner import run_event_loop
+from runner import run_event_loop, run_reindex
+from mapper.reindexer import ReindexError
+from server.supervisor import Supervisor
+from ingestion.jobs import SqliteJobRegistry
+from log_handler.log import configure_logging, stop_logging
+
+from typing import Optional
 
 @click.group(chain=False, invoke_without_command=True)
 @click.pass_context
@@ -15,16 +28,100 @@ def handler(ctx:click.core.Context):
     ctx.obj["server_settings"] = ServerSettings()
     ctx.obj["qdrand_settings"] = QdrantSettings()
     ctx.obj["openai_settings"] = OpenAiSettings()
+    ctx.obj["extractor_settings"] = ExtractorSettings()
+    ctx.obj["ingestion_settings"] = IngestionSettings()
+    ctx.obj["cache_settings"] = EmbeddingCacheSettings()
+    ctx.obj["search_cache_settings"] = SearchCacheSettings()
+    ctx.obj["collection_settings"] = CollectionSettings()
+    ctx.obj["log_settings"] = LogSettings()
+    ctx.obj["reindex_settings"] = ReindexSettings()
 
 @handler.command()
+@click.option('--workers', type=int, default=None, help='number of server processes, overrides WORKERS')
 @click.pass_context
-def launch_engine(ctx:click.core.Context):
+def launch_engine(ctx:click.core.Context, workers:int):
     server_settings:ServerSettings = ctx.obj["server_settings"]
     openai_settings:OpenAiSettings = ctx.obj["openai_settings"]
     qdrant_settings:QdrantSettings = ctx.obj["qdrand_settings"]
+    extractor_settings:ExtractorSettings = ctx.obj["extractor_settings"]
+    ingestion_settings:IngestionSettings = ctx.obj["ingestion_settings"]
+    cache_settings:EmbeddingCacheSettings = ctx.obj["cache_settings"]
+    search_cache_settings:SearchCacheSettings = ctx.obj["search_cache_settings"]
+    collection_settings:CollectionSettings = ctx.obj["collection_settings"]
+    log_settings:LogSettings = ctx.obj["log_settings"]
+
+    if workers is not None:
+        server_settings.workers = workers
+    args = [server_settings, openai_settings, qdrant_settings, extractor_settings, ingestion_settings, cache_settings, search_cache_settings, collection_settings, log_settings]
+
+    if server_settings.workers == 1:
+        server_process = Process(target=run_event_loop, args=args)
+        server_process.start()
+        return
+
+    # each worker is a process of its own: what the workers must agree on goes through the shared state file
+    if not ingestion_settings.queue_address.startswith('inproc://'):
+        raise click.UsageError(f'INGESTION_QUEUE_ADDRESS must be an inproc:// address with several workers, {ingestion_settings.queue_address} would be bound by each of them')
+    ingestion_settings.jobs_path = ingestion_settings.jobs_path or server_settings.state_path
+    search_cache_settings.version_path = search_cache_settings.version_path or server_settings.state_path
+
+    def fail_unfinished_jobs(error:str, pid:Optional[int]=None):
+        # a connection of its own each time, the workers are forked and must not inherit it
+        registry = SqliteJobRegistry(max_size=ingestion_settings.jobs_history, path=ingestion_settings.jobs_path)
+        try:
+            registry.fail_unfinished(error, pid=pid)
+        finally:
+            registry.close()
+
+    fail_unfinished_jobs('the server was restarted before the job finished')
+
+    supervisor = Supervisor(
+        target=run_event_loop,
+        args=args,
+        nb_workers=server_settings.workers,
+        shutdown_timeout=server_settings.graceful_timeout + ingestion_settings.drain_timeout + 5,
+        on_exit=lambda pid: fail_unfinished_jobs('the worker processing the job stopped', pid=pid)
+    )
+    # the supervisor alone writes and rotates the log files, the workers send it their records
+    configure_logging(log_settings=log_settings, for_workers=True)
+    try:
+        supervisor.run()
+    finally:
+        stop_logging()
+
+@handler.command()
+@click.option('--passages', is_flag=True, help='reindex the passage collection instead of the articles')
+@click.option('--target', type=str, default=None, help='name of the new collection, defaults to the next <name>_v<n>')
+@click.option('--reuse-vectors', is_flag=True, help='copy the stored vectors instead of re-embedding the summaries, when only the collection layout changes')
+@click.option('--no-switch', is_flag=True, help='stop once the new collection is validated, reads keep going to the current one')
+@click.option('--drop-legacy', is_flag=True, help='delete the current collection when it holds the served name, so that the name can become an alias')
+@click.pass_context
+def reindex(ctx:click.core.Context, passages:bool, target:str, reuse_vectors:bool, no_switch:bool, drop_legacy:bool):
+    openai_settings:OpenAiSettings = ctx.obj["openai_settings"]
+    qdrant_settings:QdrantSettings = ctx.obj["qdrand_settings"]
+    extractor_settings:ExtractorSettings = ctx.obj["extractor_settings"]
+    cache_settings:EmbeddingCacheSettings = ctx.obj["cache_settings"]
+    search_cache_settings:SearchCacheSettings = ctx.obj["search_cache_settings"]
+    collection_settings:CollectionSettings = ctx.obj["collection_settings"]
+    log_settings:LogSettings = ctx.obj["log_settings"]
+    reindex_settings:ReindexSettings = ctx.obj["reindex_settings"]
 
-    server_process = Process(target=run_event_loop, args=[server_settings, openai_settings, qdrant_settings])
-    server_process.start()
+    configure_logging(log_settings=log_settings)
+    try:
+        asyncio.run(run_reindex(
+            openai_settings, qdrant_settings, extractor_settings, cache_settings, search_cache_settings, collection_settings, reindex_settings,
+            passages=passages,
+            target=target,
+            reuse_vectors=reuse_vectors,
+            switch=not no_switch,
+            drop_legacy=drop_legacy,
+        ))
+    except ReindexError as e:
+        # the checkpoint is kept, the same command resumes once the cause is fixed
+        click.echo(f'Reindex stopped: {str(e)}', err=True)
+        sys.exit(1)
+    finally:
+        stop_logging()
 
 if __name__ == "__main__":
     load_dotenv()
@@ -0,0 +1,387 @@
+import copy
+import math
+import time
+import asyncio
+
+from qdrant_client import models
+
+from log_handler.log import logger
+
+from mapper.mapper import Mapper
+from metrics.metrics import metrics
+from mapper.tenancy import TENANT_KEY, TenantScope, validate_tenant
+from settings.collection_settings import CollectionSettings
+from search.sparse import SparseEncoder
+
+from typing import Any, Dict, List, Optional, Set, Union
+
+VectorInput = Union[List[float], Dict[str, Union[List[float], models.SparseVector]]]
+
+class CollectionManager:
+    DEFAULT_VECTOR:str=''
+    FULL_VECTOR:str='full'
+    PREFIX_VECTOR:str='prefix'
+    SPARSE_VECTOR:str='bm25'
+    PAYLOAD_INDEXES:Dict[str, models.PayloadSchemaType] = {
+        'field': models.PayloadSchemaType.KEYWORD,
+        'authors': models.PayloadSchemaType.KEYWORD,
+        'publication_date': models.PayloadSchemaType.KEYWORD,
+        'text_fingerprint': models.PayloadSchemaType.KEYWORD,
+        'published_at': models.PayloadSchemaType.DATETIME,
+        'publication_year': models.PayloadSchemaType.INTEGER,
+    }
+
+    def __init__(self, mapper:Mapper, collection_settings:CollectionSettings):
+        self.mapper = mapper
+        self.collection_settings = collection_settings
+        self.collection_name = collection_settings.name
+        self.vector_size = mapper.openai_settings.embedding_dimensions
+        self.two_stage = collection_settings.prefix_size is not None
+        self.sparse = collection_settings.sparse_vectors
+        self.sparse_encoder = SparseEncoder(
+            k1=collection_settings.bm25_k1,
+            b=collection_settings.bm25_b,
+            avg_length=collection_settings.bm25_avg_length,
+        )
+        self.tenancy = collection_settings.tenancy
+        self.shard_keys:Set[str] = set()
+        # the physical collection the checks below were made on, the name may be an alias
+        self.served_collection:Optional[str] = None
+        self.checked_at = 0.0
+        self.ready = False
+        self.lock = asyncio.Lock()
+
+    def for_collection(self, collection_name:str) -> 'CollectionManager':
+        # same layout and payload indexes, bound to another physical collection (used by the reindex)
+        manager = copy.copy(self)
+        manager.collection_name = collection_name
+        # the flags turned off for the current collection are set again, the new one is created with the configured layout
+        manager.sparse = self.collection_settings.sparse_vectors
+        manager.tenancy = self.collection_settings.tenancy
+        manager.shard_keys = set()
+        manager.served_collection = None
+        manager.ready = False
+        manager.lock = asyncio.Lock()
+        return manager
+
+    def hnsw_config(self) -> models.HnswConfigDiff:
+        if self.tenancy == 'payload':
+            # every query is filtered on one tenant: one graph per tenant, none for the whole collection
+            return models.HnswConfigDiff(
+                m=0,
+                payload_m=self.collection_settings.hnsw_m,
+                ef_construct=self.collection_settings.hnsw_ef_construct,
+                on_disk=self.collection_settings.on_disk_vectors,
+            )
+        return models.HnswConfigDiff(
+            m=self.collection_settings.hnsw_m,
+            ef_construct=self.collection_settings.hnsw_ef_construct,
+            on_disk=self.collection_settings.on_disk_vectors,
+        )
+
+    def payload_indexes(self) -> Dict[str, Union[models.PayloadSchemaType, models.KeywordIndexParams]]:
+        if self.tenancy != 'payload':
+            return self.PAYLOAD_INDEXES
+        # the tenant index also groups each tenant's points together on disk
+        return {**self.PAYLOAD_INDEXES, TENANT_KEY: models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True)}
+
+    def quantization_config(self) -> Optional[models.QuantizationConfig]:
+        if self.collection_settings.quantization == 'int8':
+            return models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(
+                    type=models.ScalarType.INT8,
+                    always_ram=self.collection_settings.quantization_always_ram,
+                )
+            )
+        if self.collection_settings.quantization == 'binary':
+            return models.BinaryQuantization(
+                binary=models.BinaryQuantizationConfig(always_ram=self.collection_settings.quantization_always_ram)
+            )
+        return None
+
+    def search_params(self) -> models.SearchParams:
+        quantization = None
+        if self.collection_settings.quantization != 'none':
+            quantization = models.QuantizationSearchParams(
+                rescore=self.collection_settings.quantization_rescore,
+                oversampling=self.collection_settings.quantization_oversampling,
+            )
+        return models.SearchParams(hnsw_ef=self.collection_settings.hnsw_ef, quantization=quantization)
+
+    def vectors_config(self) -> Union[models.VectorParams, Dict[str, models.VectorParams]]:
+        if not self.two_stage:
+            return models.VectorParams(
+                size=self.vector_size,
+                distance=models.Distance.COSINE,
+                on_disk=self.collection_settings.on_disk_vectors,
+            )
+        # the full vector is only used to rerank the prefix candidates, it does not need its own graph
+        return {
+            self.PREFIX_VECTOR: models.VectorParams(
+                size=self.collection_settings.prefix_size,
+                distance=models.Distance.COSINE,
+            ),
+            self.FULL_VECTOR: models.VectorParams(
+                size=self.vector_size,
+                distance=models.Distance.COSINE,
+                on_disk=self.collection_settings.on_disk_vectors,
+                hnsw_config=models.HnswConfigDiff(m=0),
+            ),
+        }
+
+    def sparse_vectors_config(self) -> Optional[Dict[str, models.SparseVectorParams]]:
+        if not self.sparse:
+            return None
+        # the idf is computed by qdrant over the collection, the stored values only hold the bm25 term frequencies
+        return {
+            self.SPARSE_VECTOR: models.SparseVectorParams(
+                index=models.SparseIndexParams(on_disk=self.collection_settings.sparse_on_disk),
+                modifier=models.Modifier.IDF,
+            )
+        }
+
+    @classmethod
+    def dense_vector(cls, vector:Any) -> Optional[List[float]]:
+        # a stored vector is read back as a list, or as a dict once the collection has named or sparse vectors
+        if isinstance(vector, dict):
+            return vector.get(cls.FULL_VECTOR, vector.get(cls.DEFAULT_VECTOR))
+        return vector
+
+    def make_vector(self, embedding:List[float], payload:Optional[dict]=None) -> VectorInput:
+        with_sparse = self.sparse and payload is not None
+        if not self.two_stage and not with_sparse:
+            return embedding
+        if not self.two_stage:
+            vectors = {self.DEFAULT_VECTOR: embedding}
+        else:
+            prefix = embedding[:self.collection_settings.prefix_size]
+            norm = math.sqrt(sum(value * value for value in prefix)) or 1.0
+            vectors = {
+                self.PREFIX_VECTOR: [value / norm for value in prefix],
+                self.FULL_VECTOR: embedding,
+            }
+        if with_sparse:
+            vectors[self.SPARSE_VECTOR] = self.sparse_encoder.encode_document(payload)
+        return vectors
+
+    async def query(self, embedding:List[float], limit:int, with_payload:bool=True, query_filter:Optional[models.Filter]=None, scope:Optional[TenantScope]=None) -> List[models.ScoredPoint]:
+        scope = scope or TenantScope()
+        with metrics.track_stage('qdrant_query'):
+            return await self.__query(embedding, limit, with_payload, scope.filter(query_filter), scope.shard_key)
+
+    async def __query(self, embedding:List[float], limit:int, with_payload:bool, query_filter:Optional[models.Filter], shard_key:Optional[str]) -> List[models.ScoredPoint]:
+        if not self.two_stage:
+            response = await self.mapper.shared_qdrant_client.query_points(
+                collection_name=self.collection_name,
+                query=embedding,
+                query_filter=query_filter,
+                limit=limit,
+                search_params=self.search_params(),
+                with_payload=with_payload,
+                shard_key_selector=shard_key
+            )
+            return response.points
+
+        vectors = self.make_vector(embedding)
+        response = await self.mapper.shared_qdrant_client.query_points(
+            collection_name=self.collection_name,
+            prefetch=models.Prefetch(
+                query=vectors[self.PREFIX_VECTOR],
+                using=self.PREFIX_VECTOR,
+                filter=query_filter,
+                limit=limit * self.collection_settings.prefix_oversampling,
+                params=self.search_params(),
+            ),
+            query=vectors[self.FULL_VECTOR],
+            using=self.FULL_VECTOR,
+            query_filter=query_filter,
+            limit=limit,
+            with_payload=with_payload,
+            shard_key_selector=shard_key,
+        )
+        return response.points
+
+    def __dense_prefetch(self, embedding:List[float], limit:int, query_filter:Optional[models.Filter]) -> models.Prefetch:
+        if not self.two_stage:
+            return models.Prefetch(query=embedding, filter=query_filter, limit=limit, params=self.search_params())
+        vectors = self.make_vector(embedding)
+        return models.Prefetch(
+            prefetch=models.Prefetch(
+                query=vectors[self.PREFIX_VECTOR],
+                using=self.PREFIX_VECTOR,
+                filter=query_filter,
+                limit=limit * self.collection_settings.prefix_oversampling,
+                params=self.search_params(),
+            ),
+            query=vectors[self.FULL_VECTOR],
+            using=self.FULL_VECTOR,
+            filter=query_filter,
+            limit=limit,
+        )
+
+    async def sparse_query(self, text:str, limit:int, with_payload:bool=True, query_filter:Optional[models.Filter]=None, scope:Optional[TenantScope]=None) -> List[models.ScoredPoint]:
+        # encoded in process, the only network call is the one to qdrant
+        sparse_vector = self.sparse_encoder.encode_query(text)
+        if not sparse_vector.indices:
+            return []
+        scope = scope or TenantScope()
+        with metrics.track_stage('qdrant_query'):
+            response = await self.mapper.shared_qdrant_client.query_points(
+                collection_name=self.collection_name,
+                query=sparse_vector,
+                using=self.SPARSE_VECTOR,
+                query_filter=scope.filter(query_filter),
+                limit=limit,
+                with_payload=with_payload,
+                shard_key_selector=scope.shard_key
+            )
+        return response.points
+
+    async def hybrid_query(self, embedding:List[float], text:str, limit:int, with_payload:bool=True, query_filter:Optional[models.Filter]=None, scope:Optional[TenantScope]=None) -> List[models.ScoredPoint]:
+        sparse_vector = self.sparse_encoder.encode_query(text)
+        if not sparse_vector.indices:
+            return await self.query(embedding, limit, with_payload, query_filter, scope)
+        scope = scope or TenantScope()
+        query_filter = scope.filter(query_filter)
+        # both candidate lists are fused by qdrant, a single round trip
+        nb_candidates = limit * self.collection_settings.hybrid_oversampling
+        with metrics.track_stage('qdrant_query'):
+            response = await self.mapper.shared_qdrant_client.query_points(
+                collection_name=self.collection_name,
+                prefetch=[
+                    self.__dense_prefetch(embedding, nb_candidates, query_filter),
+                    models.Prefetch(query=sparse_vector, using=self.SPARSE_VECTOR, filter=query_filter, limit=nb_candidates),
+                ],
+                query=models.FusionQuery(fusion=models.Fusion.RRF),
+                query_filter=query_filter,
+                limit=limit,
+                with_payload=with_payload,
+                shard_key_selector=scope.shard_key,
+            )
+        return response.points
+
+    async def __create_collection(self):
+        await self.mapper.shared_qdrant_client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=self.vectors_config(),
+            sparse_vectors_config=self.sparse_vectors_config(),
+            hnsw_config=self.hnsw_config(),
+            quantization_config=self.quantization_config(),
+            on_disk_payload=self.collection_settings.on_disk_payload,
+            sharding_method=models.ShardingMethod.CUSTOM if self.tenancy == 'shard_key' else None,
+            shard_number=self.collection_settings.shard_number,
+            replication_factor=self.collection_settings.replication_factor,
+            write_consistency_factor=self.collection_settings.write_consistency_factor,
+        )
+        logger.debug(f'Collection `{self.collection_name}` successfully created')
+
+    async def __update_collection(self):
+        await self.mapper.shared_qdrant_client.update_collection(
+            collection_name=self.collection_name,
+            hnsw_config=self.hnsw_config(),
+            quantization_config=self.quantization_config() or models.Disabled.DISABLED,
+        )
+        logger.debug(f'Collection `{self.collection_name}` storage profile updated')
+
+    async def __create_payload_indexes(self, collection_info:models.CollectionInfo):
+        for field_name, field_schema in self.payload_indexes().items():
+            if field_name in (collection_info.payload_schema or {}):
+                continue
+            await self.mapper.shared_qdrant_client.create_payload_index(
+                collection_name=self.collection_name,
+                field_name=field_name,
+                field_schema=field_schema,
+            )
+            logger.debug(f'Payload index on `{field_name}` created for `{self.collection_name}`')
+
+    async def __resolve_alias(self) -> str:
+        aliases = await self.mapper.shared_qdrant_client.get_aliases()
+        for alias in aliases.aliases:
+            if alias.alias_name == self.collection_name:
+                return alias.collection_name
+        return self.collection_name
+
+    def __refresh_due(self, refresh:bool) -> bool:
+        return refresh or time.monotonic() - self.checked_at >= self.collection_settings.config_refresh_interval
+
+    async def ensure(self, refresh:bool=False):
+        # `refresh` checks the served collection right away, writes must not build their points for a swapped out layout
+        if self.ready and not self.__refresh_due(refresh):
+            return
+        async with self.lock:
+            if self.ready:
+                if not self.__refresh_due(refresh):
+                    return
+                served_collection = await self.__resolve_alias()
+                self.checked_at = time.monotonic()
+                if served_collection == self.served_collection:
+                    return
+                logger.info(f'`{self.collection_name}` now serves `{served_collection}`, checking its configuration again')
+                # the cached results come from the previous collection, and its query embeddings may be from another model
+                self.mapper.search_cache.invalidate()
+                self.sparse = self.collection_settings.sparse_vectors
+                self.tenancy = self.collection_settings.tenancy
+                self.shard_keys = set()
+                self.ready = False
+            logger.debug(f'Checking for collection `{self.collection_name}`...')
+            collection_found = await self.mapper.shared_qdrant_client.collection_exists(collection_name=self.collection_name)
+            if not collection_found:
+                await self.__create_collection()
+            elif self.collection_settings.update_existing:
+                await self.__update_collection()
+            else:
+                logger.debug(f'Collection `{self.collection_name}` found!')
+            collection_info = await self.mapper.shared_qdrant_client.get_collection(collection_name=self.collection_name)
+            if self.sparse and self.SPARSE_VECTOR not in (collection_info.config.params.sparse_vectors or {}):
+                # sparse vectors cannot be added to an existing collection, it has to be rebuilt with `main.py reindex`
+                logger.warning(f'Collection `{self.collection_name}` has no sparse vectors, sparse and hybrid search stay disabled until it is reindexed')
+                self.sparse = False
+            if self.tenancy == 'shard_key' and collection_info.config.params.sharding_method != models.ShardingMethod.CUSTOM:
+                # the sharding method is fixed at creation, moving to shard keys takes a reindex
+                logger.warning(f'Collection `{self.collection_name}` is not sharded by key, tenants are partitioned by payload until it is reindexed')
+                self.tenancy = 'payload'
+            await self.__create_payload_indexes(collection_info)
+            self.served_collection = await self.__resolve_alias()
+            self.checked_at = time.monotonic()
+            self.ready = True
+
+    async def __ensure_shard_key(self, shard_key:str):
+        if shard_key in self.shard_keys:
+            return
+        async with self.lock:
+            if shard_key in self.shard_keys:
+                return
+            try:
+                await self.mapper.shared_qdrant_client.create_shard_key(
+                    collection_name=self.collection_name,
+                    shard_key=shard_key,
+                    shard_number=self.collection_settings.shard_number,
+                    replication_factor=self.collection_settings.replication_factor,
+                )
+                logger.info(f'Shard key `{shard_key}` created for `{self.collection_name}`')
+            except Exception as e:
+                # created by another server process, or before a restart
+                if 'already exists' not in str(e):
+                    raise
+            self.shard_keys.add(shard_key)
+
+    async def scope(self, tenant:Optional[str]=None, refresh:bool=False) -> TenantScope:
+        await self.ensure(refresh=refresh)
+        if self.tenancy == 'none':
+            return TenantScope()
+        default_tenant = self.collection_settings.default_tenant
+        tenant = validate_tenant(tenant or default_tenant)
+        if self.tenancy == 'payload':
+            return TenantScope(tenant, partitioned=True, legacy=tenant == default_tenant)
+        await self.__ensure_shard_key(tenant)
+        return TenantScope(tenant, shard_key=tenant, legacy=tenant == default_tenant)
+
+class PassageCollectionManager(CollectionManager):
+    PAYLOAD_INDEXES:Dict[str, models.PayloadSchemaType] = {
+        'article_id': models.PayloadSchemaType.KEYWORD,
+    }
+
+    def __init__(self, mapper:Mapper, collection_settings:CollectionSettings):
+        # passages are only searched with dense vectors
+        passage_settings = collection_settings.model_copy(update={'name': f"{collection_settings.name.rstrip('_')}_passages", 'sparse_vectors': False})
+        super().__init__(mapper=mapper, collection_settings=passage_settings)
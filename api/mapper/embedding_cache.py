@@ -0,0 +1,120 @@
+import os
+import re
+import sqlite3
+import asyncio
+import hashlib
+import threading
+
+from array import array
+from collections import OrderedDict
+
+from log_handler.log import logger
+
+from settings.cache_settings import EmbeddingCacheSettings
+
+from typing import Dict, List, Optional
+
+class EmbeddingCache:
+    def __init__(self, cache_settings:EmbeddingCacheSettings):
+        self.cache_settings = cache_settings
+        self.memory:Dict[str, array] = OrderedDict()
+        self.memory_bytes = 0
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+        self.evictions = 0
+        self.connection:Optional[sqlite3.Connection] = None
+        self.disk_lock = threading.Lock()
+
+    def open(self):
+        if not self.cache_settings.disk_enabled:
+            return
+        self.connection = sqlite3.connect(self.cache_settings.disk_path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)')
+        self.connection.commit()
+        logger.debug(f'Embedding cache opened at {self.cache_settings.disk_path}')
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    @staticmethod
+    def make_key(model:str, text:str, dimensions:Optional[int]) -> str:
+        normalized = re.sub(r'\s+', ' ', text).strip()
+        return hashlib.sha256(f'{model}\x00{dimensions}\x00{normalized}'.encode()).hexdigest()
+
+    def __memory_get(self, key:str) -> Optional[array]:
+        vector = self.memory.get(key)
+        if vector is not None:
+            self.memory.move_to_end(key)
+        return vector
+
+    def __memory_put(self, key:str, vector:array):
+        if not self.cache_settings.memory_enabled or key in self.memory:
+            return
+        self.memory[key] = vector
+        self.memory_bytes += vector.itemsize * len(vector)
+        while len(self.memory) > self.cache_settings.memory_max_entries:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= evicted.itemsize * len(evicted)
+            self.evictions += 1
+
+    def __disk_get(self, keys:List[str]) -> Dict[str, array]:
+        rows = []
+        with self.disk_lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows.extend(self.connection.execute(f'SELECT key, vector FROM embeddings WHERE key IN ({placeholders})', chunk).fetchall())
+        return {key: array('f', blob) for key, blob in rows}
+
+    def __disk_put(self, items:Dict[str, array]):
+        with self.disk_lock:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)',
+                [(key, vector.tobytes()) for key, vector in items.items()]
+            )
+            self.connection.commit()
+
+    async def get_many(self, keys:List[str]) -> List[Optional[List[float]]]:
+        found:Dict[str, array] = {}
+        if self.cache_settings.memory_enabled:
+            for key in keys:
+                vector = self.__memory_get(key)
+                if vector is not None:
+                    found[key] = vector
+                    self.hits['memory'] += 1
+
+        missing = list({key for key in keys if key not in found})
+        if missing and self.connection is not None:
+            from_disk = await asyncio.to_thread(self.__disk_get, missing)
+            for key, vector in from_disk.items():
+                self.__memory_put(key, vector)
+                found[key] = vector
+            self.hits['disk'] += len(from_disk)
+
+        self.misses += len([key for key in keys if key not in found])
+        return [found[key].tolist() if key in found else None for key in keys]
+
+    async def put_many(self, items:Dict[str, List[float]]):
+        vectors = {key: array('f', embedding) for key, embedding in items.items()}
+        for key, vector in vectors.items():
+            self.__memory_put(key, vector)
+        if vectors and self.connection is not None:
+            await asyncio.to_thread(self.__disk_put, vectors)
+
+    def stats(self) -> dict:
+        disk_bytes = 0
+        if self.connection is not None and os.path.exists(self.cache_settings.disk_path):
+            disk_bytes = os.path.getsize(self.cache_settings.disk_path)
+        return {
+            'hits': self.hits['memory'] + self.hits['disk'],
+            'memory_hits': self.hits['memory'],
+            'disk_hits': self.hits['disk'],
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'memory_entries': len(self.memory),
+            'memory_bytes': self.memory_bytes,
+            'disk_bytes': disk_bytes,
+        }
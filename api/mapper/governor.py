@@ -0,0 +1,162 @@
+import time
+import heapq
+import random
+import asyncio
+import itertools
+
+from enum import IntEnum
+
+import openai
+
+from log_handler.log import logger
+
+from settings.openai_settings import OpenAiSettings
+from metrics.metrics import metrics
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BULK = 1
+
+class TokenBucket:
+    def __init__(self, capacity:float, period:float=60.0):
+        self.capacity = capacity
+        self.period = period
+        self.level = capacity
+        self.updated_at = time.monotonic()
+
+    def __refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.capacity / self.period)
+        self.updated_at = now
+
+    async def acquire(self, amount:float, reserve:float=0.0):
+        while True:
+            self.__refill()
+            # a request bigger than what the reserve leaves waits for a full bucket instead of forever
+            needed = min(amount, max(self.capacity - reserve, 0.0))
+            if self.level - needed >= reserve:
+                self.level -= needed
+                return
+            missing = needed + reserve - self.level
+            await asyncio.sleep(max(missing * self.period / self.capacity, 0.01))
+
+    def update(self, limit:Optional[float], remaining:Optional[float]):
+        self.__refill()
+        if limit and limit != self.capacity:
+            # the bucket keeps its fill ratio, otherwise a raised limit would start almost empty
+            self.level = self.level * limit / self.capacity
+            self.capacity = limit
+        if remaining is not None:
+            self.level = min(self.level, remaining)
+
+class PrioritySemaphore:
+    def __init__(self, value:int):
+        self.value = value
+        self.counter = itertools.count()
+        self.waiters:List[Tuple[int, int, asyncio.Future]] = []
+
+    async def acquire(self, priority:Priority):
+        if self.value > 0 and not self.waiters:
+            self.value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.value += 1
+
+class ModelLimits:
+    def __init__(self, openai_settings:OpenAiSettings):
+        self.concurrency = PrioritySemaphore(openai_settings.max_concurrency)
+        self.requests = TokenBucket(openai_settings.requests_per_minute)
+        self.tokens = TokenBucket(openai_settings.tokens_per_minute)
+
+def _header_number(headers, name:str) -> Optional[float]:
+    value = headers.get(name) if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def _retry_after(error:Exception) -> Optional[float]:
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    retry_after_ms = _header_number(response.headers, 'retry-after-ms')
+    if retry_after_ms is not None:
+        return retry_after_ms / 1000
+    return _header_number(response.headers, 'retry-after')
+
+class OpenAiGovernor:
+    RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+    def __init__(self, openai_settings:OpenAiSettings):
+        self.openai_settings = openai_settings
+        self.limits:Dict[str, ModelLimits] = {}
+
+    def __get_limits(self, model:str) -> ModelLimits:
+        limits = self.limits.get(model)
+        if limits is None:
+            limits = self.limits[model] = ModelLimits(self.openai_settings)
+        return limits
+
+    def __adapt(self, limits:ModelLimits, headers):
+        limits.requests.update(
+            _header_number(headers, 'x-ratelimit-limit-requests'),
+            _header_number(headers, 'x-ratelimit-remaining-requests'),
+        )
+        limits.tokens.update(
+            _header_number(headers, 'x-ratelimit-limit-tokens'),
+            _header_number(headers, 'x-ratelimit-remaining-tokens'),
+        )
+
+    def __backoff(self, attempt:int, error:Exception) -> float:
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.openai_settings.backoff_base)
+        cap = min(self.openai_settings.backoff_max, self.openai_settings.backoff_base * 2 ** attempt)
+        return random.uniform(0, cap)
+
+    async def call(self, model:str, estimated_tokens:int, priority:Priority, request:Callable[[], Awaitable[Any]]) -> Any:
+        # `request` returns a raw response (with_raw_response) so that the rate limit headers can be read
+        limits = self.__get_limits(model)
+        # bulk traffic leaves a share of each bucket to interactive calls
+        reserve_share = self.openai_settings.interactive_reserve if priority == Priority.BULK else 0.0
+
+        attempt = 0
+        while True:
+            # the buckets are waited on before taking a concurrency slot, bulk calls held by an empty
+            # bucket must not keep the slots from interactive calls
+            await limits.requests.acquire(1, reserve=limits.requests.capacity * reserve_share)
+            await limits.tokens.acquire(estimated_tokens, reserve=limits.tokens.capacity * reserve_share)
+            await limits.concurrency.acquire(priority)
+            try:
+                raw_response = await request()
+                self.__adapt(limits, raw_response.headers)
+                return raw_response.parse()
+            except self.RETRYABLE_ERRORS as e:
+                response = getattr(e, 'response', None)
+                if response is not None:
+                    self.__adapt(limits, response.headers)
+                if attempt >= self.openai_settings.max_retries:
+                    raise
+                delay = self.__backoff(attempt, e)
+                metrics.openai_retries.inc(model, type(e).__name__)
+                logger.warning(f'{type(e).__name__} on {model}, retry {attempt + 1}/{self.openai_settings.max_retries} in {delay:.2f}s')
+                attempt += 1
+            finally:
+                limits.concurrency.release()
+            await asyncio.sleep(delay)
@@ -1,7 +1,10 @@
 import zmq.asyncio as aiozmq 
 
+import time
+import asyncio
 from asyncio import Lock, Event 
-from openai import AsyncOpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 
 from log_handler.log import logger 
 
@@ -9,30 +12,198 @@ import qdrant_client
 
 from settings.openai_settings import OpenAiSettings
 from settings.qdrant_settings import QdrantSettings
+from settings.server_settings import ExtractorSettings
+from settings.cache_settings import EmbeddingCacheSettings, SearchCacheSettings
+
+from ingestion.extractor import PdfExtractor
+from mapper.embedding_cache import EmbeddingCache
+from mapper.governor import OpenAiGovernor, Priority
+from search.response_cache import SearchCache
+from metrics.metrics import metrics
+
+from typing import Any, Dict, List
 
 class Mapper:
     BLOCKED_TASK:str='BLOCKED-TASK-'
-    def __init__(self, openai_settings:OpenAiSettings, qdrant_settings: QdrantSettings):
+    def __init__(self, openai_settings:OpenAiSettings, qdrant_settings: QdrantSettings, extractor_settings:ExtractorSettings, cache_settings:EmbeddingCacheSettings, search_cache_settings:SearchCacheSettings):
         self.openai_settings = openai_settings
         self.qdrant_settings = qdrant_settings
+        self.extractor_settings = extractor_settings
+        self.cache_settings = cache_settings
+        self.search_cache_settings = search_cache_settings
+    
+    @staticmethod
+    def estimate_tokens(text:str) -> int:
+        return len(text) // 4 + 1
+    
+    def __make_batches(self, texts:List[str]) -> List[List[int]]:
+        batches:List[List[int]] = []
+        current:List[int] = []
+        current_tokens = 0
+        for index, text in enumerate(texts):
+            nb_tokens = self.estimate_tokens(text)
+            too_many_tokens = current_tokens + nb_tokens > self.openai_settings.embedding_batch_tokens
+            too_many_inputs = len(current) >= self.openai_settings.embedding_batch_size
+            if current and (too_many_tokens or too_many_inputs):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(index)
+            current_tokens += nb_tokens
+        if current:
+            batches.append(current)
+        return batches
+    
+    async def __embed_batch(self, texts:List[str], priority:Priority) -> List[List[float]]:
+        with metrics.track_stage('embed'):
+            response = await self.openai_governor.call(
+                self.openai_settings.embedding_model,
+                sum(self.estimate_tokens(text) for text in texts),
+                priority,
+                lambda: self.shared_openai_client.embeddings.with_raw_response.create(
+                    input=texts,
+                    model=self.openai_settings.embedding_model,
+                    dimensions=self.openai_settings.embedding_dimensions
+                )
+            )
+        metrics.record_tokens(self.openai_settings.embedding_model, response.usage)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    
+    async def __compute_embeddings(self, texts:List[str], priority:Priority) -> List[List[float]]:
+        batches = self.__make_batches(texts)
+        responses = await asyncio.gather(*[self.__embed_batch([texts[index] for index in batch], priority) for batch in batches])
+        embeddings:List[List[float]] = [None] * len(texts)
+        for batch, batch_embeddings in zip(batches, responses):
+            for index, embedding in zip(batch, batch_embeddings):
+                embeddings[index] = embedding
+        return embeddings
+    
+    async def get_embeddings(self, texts:List[str], use_cache:bool=True, priority:Priority=Priority.INTERACTIVE) -> List[List[float]]:
+        texts = [text.replace("\n", " ") for text in texts]
+        if not use_cache:
+            return await self.__compute_embeddings(texts, priority)
+        
+        keys = [EmbeddingCache.make_key(self.openai_settings.embedding_model, text, self.openai_settings.embedding_dimensions) for text in texts]
+        embeddings = await self.embedding_cache.get_many(keys)
+        
+        # identical texts inside one call are only embedded once
+        missing:Dict[str, str] = {}
+        for key, text, embedding in zip(keys, texts, embeddings):
+            if embedding is None:
+                missing.setdefault(key, text)
+        if missing:
+            computed = dict(zip(missing.keys(), await self.__compute_embeddings(list(missing.values()), priority)))
+            await self.embedding_cache.put_many(computed)
+            embeddings = [embedding if embedding is not None else computed[key] for key, embedding in zip(keys, embeddings)]
+        return embeddings
+    
+    async def get_embedding(self, text:str, use_cache:bool=True, priority:Priority=Priority.INTERACTIVE):
+        embeddings = await self.get_embeddings([text], use_cache=use_cache, priority=priority)
+        return embeddings[0]
+    
+    async def chat_completion(self, model:str, messages:List[Dict[str, str]], priority:Priority=Priority.INTERACTIVE, max_output_tokens:int=1024, **kwargs) -> Any:
+        estimated_tokens = sum(self.estimate_tokens(message['content']) for message in messages) + max_output_tokens
+        response = await self.openai_governor.call(
+            model,
+            estimated_tokens,
+            priority,
+            lambda: self.shared_openai_client.chat.completions.with_raw_response.create(model=model, messages=messages, **kwargs)
+        )
+        metrics.record_tokens(model, response.usage)
+        return response
+    
+    def __make_openai_client(self) -> AsyncOpenAI:
+        http_client = DefaultAsyncHttpxClient(
+            http2=self.openai_settings.http2,
+            timeout=httpx.Timeout(self.openai_settings.timeout, connect=self.openai_settings.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=self.openai_settings.max_connections,
+                max_keepalive_connections=self.openai_settings.max_keepalive_connections,
+                keepalive_expiry=self.openai_settings.keepalive_expiry,
+            ),
+        )
+        # retries are owned by the governor so that they go through the rate limits
+        return AsyncOpenAI(api_key=self.openai_settings.api_key, max_retries=0, http_client=http_client)
+    
+    def __make_qdrant_client(self) -> qdrant_client.AsyncQdrantClient:
+        keepalive_ms = int(self.qdrant_settings.keepalive_expiry * 1000)
+        return qdrant_client.AsyncQdrantClient(
+            self.qdrant_settings.host,
+            port=self.qdrant_settings.port,
+            grpc_port=self.qdrant_settings.grpc_port,
+            prefer_grpc=self.qdrant_settings.prefer_grpc,
+            timeout=self.qdrant_settings.timeout,
+            limits=httpx.Limits(
+                max_connections=self.qdrant_settings.max_connections,
+                max_keepalive_connections=self.qdrant_settings.max_keepalive_connections,
+                keepalive_expiry=self.qdrant_settings.keepalive_expiry,
+            ),
+            grpc_options={
+                'grpc.keepalive_time_ms': keepalive_ms,
+                'grpc.keepalive_timeout_ms': min(keepalive_ms, 10_000),
+                'grpc.keepalive_permit_without_calls': 1,
+                'grpc.http2.max_pings_without_data': 0,
+            },
+        )
+    
+    async def __probe_qdrant(self):
+        await self.shared_qdrant_client.get_collections()
+    
+    async def __probe_openai(self):
+        await self.shared_openai_client.models.retrieve(self.openai_settings.embedding_model)
+    
+    async def warm_up(self):
+        # opens the pooled connections (tcp, tls, http2 or grpc channel) and spawns the pdf workers before the first request needs them
+        probes = [self.__probe_qdrant() for _ in range(self.qdrant_settings.warmup_connections)]
+        probes += [self.__probe_openai() for _ in range(self.openai_settings.warmup_connections)]
+        start = time.perf_counter()
+        extractor_result, results = await asyncio.gather(
+            self.pdf_extractor.warm_up(),
+            asyncio.gather(*probes, return_exceptions=True),
+            return_exceptions=True
+        )
+        if isinstance(extractor_result, Exception):
+            logger.warning(f'Pdf extractor warm-up failed: {type(extractor_result).__name__}: {str(extractor_result)}')
+        errors = [result for result in results if isinstance(result, Exception)]
+        for error in errors:
+            logger.warning(f'Connection warm-up failed: {type(error).__name__}: {str(error)}')
+        logger.info(f'Warmed up {len(results) - len(errors)}/{len(results)} connections in {(time.perf_counter() - start) * 1000:.0f}ms')
+    
+    async def __check(self, probe, timeout:float) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(probe(), timeout=timeout)
+        except Exception as e:
+            return {'ready': False, 'error': f'{type(e).__name__}: {str(e)}'}
+        return {'ready': True, 'latency_ms': round((time.perf_counter() - start) * 1000, 1)}
     
-    async def get_embedding(self, text:str):
-        print('start..embed')
-        text = text.replace("\n", " ")
-        response = await self.shared_openai_client.embeddings.create(input=[text], model="text-embedding-3-small")
-        print('end..embed')
-        return response.data[0].embedding
+    async def check_dependencies(self, timeout:float=2.0) -> Dict[str, Dict[str, Any]]:
+        qdrant_status, openai_status = await asyncio.gather(
+            self.__check(self.__probe_qdrant, timeout),
+            self.__check(self.__probe_openai, timeout),
+        )
+        return {'qdrant': qdrant_status, 'openai': openai_status}
     
     async def __aenter__(self):
         self.shared_ctx = aiozmq.Context()
         self.shared_lock = Lock()
         self.shared_event = Event()
-        self.shared_openai_client = AsyncOpenAI(api_key=self.openai_settings.api_key)
-        self.shared_qdrant_client = qdrant_client.AsyncQdrantClient(self.qdrant_settings.host)
+        self.shared_openai_client = self.__make_openai_client()
+        self.openai_governor = OpenAiGovernor(openai_settings=self.openai_settings)
+        self.shared_qdrant_client = self.__make_qdrant_client()
+        self.pdf_extractor = PdfExtractor(extractor_settings=self.extractor_settings)
+        self.pdf_extractor.start()
+        self.embedding_cache = EmbeddingCache(cache_settings=self.cache_settings)
+        self.embedding_cache.open()
+        self.search_cache = SearchCache(cache_settings=self.search_cache_settings)
         return self 
     
     async def __aexit__(self, exc_type, exc_value, traceback):
         if exc_type is not None:
             logger.warning(exc_value)
             logger.exception(traceback)
+        self.pdf_extractor.shutdown()
+        self.embedding_cache.close()
+        self.search_cache.close()
+        await self.shared_openai_client.close()
+        await self.shared_qdrant_client.close()
         self.shared_ctx.term() 
\ No newline at end of file
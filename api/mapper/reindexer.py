@@ -0,0 +1,328 @@
+import os
+import re
+import json
+import time
+import asyncio
+
+from enum import Enum
+
+from qdrant_client import models
+
+from log_handler.log import logger
+
+from mapper.mapper import Mapper
+from mapper.governor import Priority, TokenBucket
+from mapper.collection_manager import CollectionManager
+from mapper.tenancy import TENANT_KEY
+from ingestion.metadata import with_publication_fields
+from settings.reindex_settings import ReindexSettings
+
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_INDEXING_THRESHOLD:int = 20_000
+
+class ReindexError(Exception):
+    pass
+
+class ReindexPhase(str, Enum):
+    COPY='copy'
+    CATCH_UP='catch_up'
+    VALIDATE='validate'
+    VALIDATED='validated'
+    SWITCHED='switched'
+
+class Reindexer:
+    # reads are served under `alias`, the new collection is filled from the stored summaries then swapped in
+    def __init__(self, mapper:Mapper, manager:CollectionManager, reindex_settings:ReindexSettings, reuse_vectors:bool=False):
+        self.mapper = mapper
+        self.manager = manager
+        self.alias = manager.collection_name
+        self.reindex_settings = reindex_settings
+        self.reuse_vectors = reuse_vectors
+        self.throttle = TokenBucket(reindex_settings.tokens_per_minute)
+
+    @property
+    def client(self):
+        return self.mapper.shared_qdrant_client
+
+    def __load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.reindex_settings.checkpoint_path):
+            return None
+        with open(self.reindex_settings.checkpoint_path) as fp:
+            return json.load(fp)
+
+    def __save_checkpoint(self, state:Dict[str, Any]):
+        tmp_path = f'{self.reindex_settings.checkpoint_path}.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(state, fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+        # the rename is atomic, an interruption never leaves a truncated checkpoint behind
+        os.replace(tmp_path, self.reindex_settings.checkpoint_path)
+
+    def __clear_checkpoint(self):
+        if os.path.exists(self.reindex_settings.checkpoint_path):
+            os.remove(self.reindex_settings.checkpoint_path)
+
+    async def __resolve_source(self) -> Tuple[str, bool]:
+        # the collection currently served, and whether it still holds the alias name itself
+        aliases = await self.client.get_aliases()
+        for alias in aliases.aliases:
+            if alias.alias_name == self.alias:
+                return alias.collection_name, False
+        if await self.client.collection_exists(collection_name=self.alias):
+            return self.alias, True
+        raise ReindexError(f'Nothing to reindex, `{self.alias}` does not exist')
+
+    async def __next_target(self) -> str:
+        base = self.alias.rstrip('_')
+        collections = await self.client.get_collections()
+        versions = [
+            int(match.group(1))
+            for collection in collections.collections
+            if (match := re.fullmatch(rf'{re.escape(base)}_v(\d+)', collection.name))
+        ]
+        return f'{base}_v{max(versions, default=0) + 1}'
+
+    async def __start_or_resume(self, target:Optional[str]) -> Dict[str, Any]:
+        source, legacy = await self.__resolve_source()
+        embedding_model = self.mapper.openai_settings.embedding_model
+        embedding_dimensions = self.mapper.openai_settings.embedding_dimensions
+
+        state = self.__load_checkpoint()
+        if state is not None and state['alias'] == self.alias:
+            if state['phase'] == ReindexPhase.SWITCHED:
+                return state
+            if state['source'] != source:
+                raise ReindexError(f"The checkpoint was taken on `{state['source']}` but `{self.alias}` now serves `{source}`, remove {self.reindex_settings.checkpoint_path}")
+            if target is not None and target != state['target']:
+                raise ReindexError(f"A reindex into `{state['target']}` is in progress, resume it or remove {self.reindex_settings.checkpoint_path}")
+            started_with = (state['embedding_model'], state['embedding_dimensions'], state['reuse_vectors'])
+            if started_with != (embedding_model, embedding_dimensions, self.reuse_vectors):
+                # a target half filled with other vectors cannot be completed
+                raise ReindexError(f"The reindex into `{state['target']}` was started with {started_with}, remove {self.reindex_settings.checkpoint_path} and the collection to start over")
+            logger.info(f"Resuming the reindex of `{self.alias}` into `{state['target']}` at phase {state['phase']} ({state['nb_copied']} points copied)")
+            return state
+
+        target = target or await self.__next_target()
+        if target == source:
+            raise ReindexError(f'`{target}` is the collection being reindexed')
+        if await self.client.collection_exists(collection_name=target):
+            raise ReindexError(f'`{target}` already exists')
+        state = {
+            'alias': self.alias,
+            'source': source,
+            'legacy': legacy,
+            'target': target,
+            'phase': ReindexPhase.COPY.value,
+            'offset': None,
+            'nb_copied': 0,
+            'nb_skipped': 0,
+            'embedding_model': embedding_model,
+            'embedding_dimensions': embedding_dimensions,
+            'reuse_vectors': self.reuse_vectors,
+            'indexing_threshold': None,
+        }
+        self.__save_checkpoint(state)
+        logger.info(f'Reindexing `{self.alias}` from `{source}` into `{target}`')
+        return state
+
+    async def __prepare_target(self, target_manager:CollectionManager, state:Dict[str, Any]):
+        await target_manager.ensure()
+        if state['indexing_threshold'] is None:
+            info = await self.client.get_collection(collection_name=state['target'])
+            state['indexing_threshold'] = info.config.optimizer_config.indexing_threshold or DEFAULT_INDEXING_THRESHOLD
+            self.__save_checkpoint(state)
+        # building the hnsw graph while bulk loading is wasted work, it is built once the copy is over
+        await self.client.update_collection(
+            collection_name=state['target'],
+            optimizers_config=models.OptimizersConfigDiff(indexing_threshold=0),
+        )
+
+    async def __read(self, collection_name:str, offset:Any, with_vectors:bool=True) -> Tuple[List[models.Record], Any]:
+        return await self.client.scroll(
+            collection_name=collection_name,
+            limit=self.reindex_settings.page_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=self.reuse_vectors and with_vectors,
+        )
+
+    async def __vectors(self, target_manager:CollectionManager, points:List[models.Record]) -> List[List[float]]:
+        if self.reuse_vectors:
+            vectors = [CollectionManager.dense_vector(point.vector) for point in points]
+            if any(vector is None or len(vector) != target_manager.vector_size for vector in vectors):
+                raise ReindexError(f'The stored vectors do not fit a {target_manager.vector_size} dimensions collection, reindex without reusing them')
+            return vectors
+        texts = [point.payload['summary'] for point in points]
+        await self.throttle.acquire(sum(Mapper.estimate_tokens(text) for text in texts))
+        return await self.mapper.get_embeddings(texts, priority=Priority.BULK)
+
+    async def __write(self, target_manager:CollectionManager, points:List[models.Record]) -> Tuple[int, int]:
+        embeddable = [point for point in points if (point.payload or {}).get('summary')]
+        shard_keys:Dict[Any, List[int]] = {}
+        for index, point in enumerate(embeddable):
+            # payloads written before the normalized date fields or the tenancy get them on the way
+            scope = await target_manager.scope(point.payload.get(TENANT_KEY))
+            point.payload = scope.tag(with_publication_fields(point.payload))
+            shard_keys.setdefault(scope.shard_key, []).append(index)
+        if embeddable:
+            vectors = await self.__vectors(target_manager, embeddable)
+            # one upsert per shard key, a point is routed to the shard of its tenant
+            for shard_key, indices in shard_keys.items():
+                await self.client.upsert(
+                    collection_name=target_manager.collection_name,
+                    points=[
+                        models.PointStruct(id=embeddable[index].id, payload=embeddable[index].payload, vector=target_manager.make_vector(vectors[index], embeddable[index].payload))
+                        for index in indices
+                    ],
+                    wait=False,
+                    shard_key_selector=shard_key,
+                )
+        return len(embeddable), len(points) - len(embeddable)
+
+    async def __copy(self, target_manager:CollectionManager, state:Dict[str, Any]):
+        source = state['source']
+        total = (await self.client.count(collection_name=source, exact=True)).count
+        start, nb_start = time.monotonic(), state['nb_copied']
+        next_page = asyncio.ensure_future(self.__read(source, state['offset']))
+        try:
+            while True:
+                points, offset = await next_page
+                if offset is not None:
+                    # the next page is read from qdrant while this one is embedded
+                    next_page = asyncio.ensure_future(self.__read(source, offset))
+                nb_written, nb_skipped = await self.__write(target_manager, points)
+                state['offset'] = offset
+                state['nb_copied'] += nb_written
+                state['nb_skipped'] += nb_skipped
+                self.__save_checkpoint(state)
+                rate = (state['nb_copied'] - nb_start) / max(time.monotonic() - start, 1e-6)
+                logger.info(f"Reindexed {state['nb_copied'] + state['nb_skipped']}/{total} points ({rate:.0f}/s)")
+                if offset is None:
+                    break
+        finally:
+            if not next_page.done():
+                next_page.cancel()
+        if state['nb_skipped']:
+            logger.warning(f"{state['nb_skipped']} points of `{source}` have no summary and were not copied")
+
+    @staticmethod
+    def __is_stale(source_payload:Optional[dict], target_payload:Optional[dict]) -> bool:
+        # the copy only adds derived fields to a payload, every field of the source must be found unchanged in the target
+        if target_payload is None:
+            return True
+        return any(target_payload.get(key) != value for key, value in (source_payload or {}).items())
+
+    async def __catch_up(self, target_manager:CollectionManager, state:Dict[str, Any]):
+        # points ingested through the alias while the copy ran went to the source, new ones and re-ingested ones alike
+        source, offset, nb_added = state['source'], None, 0
+        while True:
+            points, offset = await self.__read(source, offset, with_vectors=False)
+            present = await self.client.retrieve(collection_name=state['target'], ids=[point.id for point in points], with_payload=True, with_vectors=False)
+            target_payloads = {str(point.id): point.payload for point in present}
+            stale = [point for point in points if self.__is_stale(point.payload, target_payloads.get(str(point.id)))]
+            if stale and self.reuse_vectors:
+                stale = await self.client.retrieve(collection_name=source, ids=[point.id for point in stale], with_payload=True, with_vectors=True)
+            if stale:
+                nb_written, _ = await self.__write(target_manager, stale)
+                nb_added += nb_written
+            if offset is None:
+                break
+        state['nb_copied'] += nb_added
+        self.__save_checkpoint(state)
+        if nb_added:
+            logger.info(f'Caught up {nb_added} points written or updated during the reindex')
+
+    async def __build_index(self, state:Dict[str, Any]):
+        await self.client.update_collection(
+            collection_name=state['target'],
+            optimizers_config=models.OptimizersConfigDiff(indexing_threshold=state['indexing_threshold']),
+        )
+        deadline = time.monotonic() + self.reindex_settings.green_timeout
+        while True:
+            info = await self.client.get_collection(collection_name=state['target'])
+            if info.status == models.CollectionStatus.GREEN:
+                return
+            if time.monotonic() > deadline:
+                raise ReindexError(f"`{state['target']}` is still {info.status.value} after {self.reindex_settings.green_timeout}s of indexing")
+            await asyncio.sleep(1.0)
+
+    async def __validate(self, target_manager:CollectionManager, state:Dict[str, Any]):
+        source_count = (await self.client.count(collection_name=state['source'], exact=True)).count
+        target_count = (await self.client.count(collection_name=state['target'], exact=True)).count
+        expected = source_count - state['nb_skipped']
+        if target_count < expected:
+            raise ReindexError(f"`{state['target']}` holds {target_count} points, {expected} expected")
+
+        # every sampled point must come back among the nearest neighbours of its own vector
+        samples, _ = await self.client.scroll(
+            collection_name=state['target'],
+            limit=self.reindex_settings.validation_samples,
+            with_payload=[TENANT_KEY],
+            with_vectors=[CollectionManager.FULL_VECTOR] if target_manager.two_stage else True,
+        )
+        nb_found = 0
+        for sample in samples:
+            # searched as its tenant would search it, through the partition or the shard it was written to
+            scope = await target_manager.scope((sample.payload or {}).get(TENANT_KEY))
+            neighbours = await target_manager.query(CollectionManager.dense_vector(sample.vector), limit=10, with_payload=False, scope=scope)
+            nb_found += any(str(point.id) == str(sample.id) for point in neighbours)
+        recall = nb_found / len(samples) if samples else 1.0
+        if recall < self.reindex_settings.min_recall:
+            raise ReindexError(f"Self recall of `{state['target']}` is {recall:.2f}, below {self.reindex_settings.min_recall}")
+        logger.info(f"`{state['target']}` validated: {target_count} points, self recall {recall:.2f}")
+
+    async def __switch(self, state:Dict[str, Any], drop_legacy:bool):
+        create_alias = models.CreateAliasOperation(
+            create_alias=models.CreateAlias(collection_name=state['target'], alias_name=self.alias)
+        )
+        if state['legacy']:
+            if not drop_legacy:
+                raise ReindexError(f"`{self.alias}` is a collection and not an alias yet, rerun with --drop-legacy to replace it with an alias on `{state['target']}`")
+            # qdrant refuses an alias named like an existing collection, reads fail between these two calls
+            logger.warning(f'Dropping the legacy collection `{self.alias}` to turn its name into an alias')
+            await self.client.delete_collection(collection_name=self.alias)
+            await self.client.update_collection_aliases(change_aliases_operations=[create_alias])
+        else:
+            # both operations are applied at once, readers see one collection or the other but never none
+            await self.client.update_collection_aliases(change_aliases_operations=[
+                models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=self.alias)),
+                create_alias,
+            ])
+        state['phase'] = ReindexPhase.SWITCHED.value
+        self.__save_checkpoint(state)
+        kept = '' if state['legacy'] else f", `{state['source']}` is kept for a rollback"
+        logger.info(f"`{self.alias}` now serves `{state['target']}`{kept}")
+
+    async def run(self, target:Optional[str]=None, switch:bool=True, drop_legacy:bool=False) -> Dict[str, Any]:
+        state = await self.__start_or_resume(target)
+        if state['phase'] == ReindexPhase.SWITCHED:
+            # interrupted right after the swap, there is nothing left to do
+            self.__clear_checkpoint()
+            return state
+        target_manager = self.manager.for_collection(state['target'])
+
+        if state['phase'] == ReindexPhase.COPY:
+            await self.__prepare_target(target_manager, state)
+            await self.__copy(target_manager, state)
+            state['phase'] = ReindexPhase.CATCH_UP.value
+            self.__save_checkpoint(state)
+        if state['phase'] == ReindexPhase.CATCH_UP:
+            await self.__catch_up(target_manager, state)
+            await self.__build_index(state)
+            state['phase'] = ReindexPhase.VALIDATE.value
+            self.__save_checkpoint(state)
+        if state['phase'] == ReindexPhase.VALIDATE:
+            await self.__validate(target_manager, state)
+            state['phase'] = ReindexPhase.VALIDATED.value
+            self.__save_checkpoint(state)
+
+        if not switch:
+            logger.info(f"`{state['target']}` is ready, `{self.alias}` keeps serving `{state['source']}` until the switch")
+            return state
+        # the last writes made during the validation are copied right before the swap
+        await self.__catch_up(target_manager, state)
+        await self.__switch(state, drop_legacy)
+        self.__clear_checkpoint()
+        return state
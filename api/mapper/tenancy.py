@@ -0,0 +1,49 @@
+import re
+
+from qdrant_client import models
+
+from typing import Optional
+
+TENANT_KEY:str = 'tenant'
+TENANT_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.-]{0,63}')
+
+class TenantError(Exception):
+    pass
+
+def validate_tenant(tenant:str) -> str:
+    if not TENANT_PATTERN.fullmatch(tenant):
+        raise TenantError(f'Invalid tenant `{tenant}`: 1 to 64 letters, digits, `_`, `.` or `-`')
+    return tenant
+
+class TenantScope:
+    # how the requests of one tenant reach its articles: a payload partition, a custom shard key, or nothing
+    def __init__(self, tenant:Optional[str]=None, partitioned:bool=False, shard_key:Optional[str]=None, legacy:bool=False):
+        self.tenant = tenant
+        self.partitioned = partitioned
+        self.shard_key = shard_key
+        # points written before the tenancy was enabled have no tenant, they belong to the default one
+        self.legacy = legacy
+        # the article ids of the default tenant are the ones from before tenancy
+        self.namespace = None if legacy else tenant
+
+    def condition(self) -> Optional[models.Filter]:
+        if not self.partitioned:
+            return None
+        match = models.FieldCondition(key=TENANT_KEY, match=models.MatchValue(value=self.tenant))
+        if not self.legacy:
+            return models.Filter(must=[match])
+        return models.Filter(should=[match, models.IsEmptyCondition(is_empty=models.PayloadField(key=TENANT_KEY))])
+
+    def filter(self, query_filter:Optional[models.Filter]=None) -> Optional[models.Filter]:
+        condition = self.condition()
+        if condition is None:
+            return query_filter
+        if query_filter is None:
+            return condition
+        return models.Filter(must=[condition, query_filter])
+
+    def tag(self, payload:dict) -> dict:
+        # the tenant is stored even with shard keys, a reindex needs it to route every point again
+        if self.tenant is not None:
+            payload[TENANT_KEY] = self.tenant
+        return payload
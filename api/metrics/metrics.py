@@ -0,0 +1,172 @@
+import time
+import bisect
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# per request list of (stage, seconds), only set when the Server-Timing header is enabled
+server_timings:ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar('server_timings', default=None)
+
+def _format_labels(labelnames:Tuple[str, ...], labelvalues:LabelValues, extra:str='') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Metric:
+    kind:str = ''
+
+    def __init__(self, name:str, documentation:str, labelnames:Tuple[str, ...]=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name:str, documentation:str, labelnames:Tuple[str, ...]=()):
+        super().__init__(name, documentation, labelnames)
+        self.values:Dict[LabelValues, float] = {}
+
+    def inc(self, *labelvalues:str, amount:float=1.0):
+        self.values[labelvalues] = self.values.get(labelvalues, 0.0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f'{self.name}{_format_labels(self.labelnames, labelvalues)} {value}'
+            for labelvalues, value in self.values.items()
+        ]
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labelvalues:str, amount:float=1.0):
+        self.inc(*labelvalues, amount=-amount)
+
+class Histogram(Metric):
+    kind = 'histogram'
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, name:str, documentation:str, labelnames:Tuple[str, ...]=(), buckets:Tuple[float, ...]=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        self.counts:Dict[LabelValues, List[int]] = {}
+        self.sums:Dict[LabelValues, float] = {}
+
+    def observe(self, value:float, *labelvalues:str):
+        counts = self.counts.get(labelvalues)
+        if counts is None:
+            counts = self.counts[labelvalues] = [0] * (len(self.buckets) + 1)
+            self.sums[labelvalues] = 0.0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[labelvalues] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labelvalues, counts in self.counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket_labels = _format_labels(self.labelnames, labelvalues, extra=f'le="{le}"')
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labelvalues)} {self.sums[labelvalues]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labelvalues)} {cumulative}')
+        return lines
+
+class Metrics:
+    def __init__(self):
+        self.stage_duration = Histogram('article_stage_duration_seconds', 'Duration of the pipeline stages', ('stage',))
+        self.stage_inflight = Gauge('article_stage_inflight', 'Pipeline stages currently running', ('stage',))
+        self.stage_errors = Counter('article_stage_errors_total', 'Pipeline stages that raised an error', ('stage',))
+        self.openai_tokens = Counter('openai_tokens_total', 'Tokens consumed on the openai api', ('model', 'kind'))
+        self.openai_retries = Counter('openai_retries_total', 'Openai calls retried by the governor', ('model', 'error'))
+        self.http_duration = Histogram('http_request_duration_seconds', 'Duration of the http requests', ('method', 'route', 'status'))
+        self.http_inflight = Gauge('http_requests_inflight', 'Http requests currently served')
+        self.registry:List[Metric] = [
+            self.stage_duration,
+            self.stage_inflight,
+            self.stage_errors,
+            self.openai_tokens,
+            self.openai_retries,
+            self.http_duration,
+            self.http_inflight,
+        ]
+
+    @contextmanager
+    def track_stage(self, stage:str) -> Iterator[None]:
+        self.stage_inflight.inc(stage)
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.stage_errors.inc(stage)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self.stage_inflight.dec(stage)
+            self.stage_duration.observe(duration, stage)
+            timings = server_timings.get()
+            if timings is not None:
+                timings.append((stage, duration))
+
+    def record_tokens(self, model:str, usage):
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, 'prompt_tokens', None) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', None) or 0
+        self.openai_tokens.inc(model, 'prompt', amount=prompt_tokens)
+        if completion_tokens:
+            self.openai_tokens.inc(model, 'completion', amount=completion_tokens)
+
+    def render(self) -> str:
+        lines:List[str] = []
+        for metric in self.registry:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+class MetricsMiddleware:
+    def __init__(self, app, server_timing:bool=False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        timings:List[Tuple[str, float]] = []
+        token = server_timings.set(timings if self.server_timing else None)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                if self.server_timing:
+                    total = time.perf_counter() - start
+                    entries = [f'{stage};dur={duration * 1000:.1f}' for stage, duration in timings]
+                    entries.append(f'total;dur={total * 1000:.1f}')
+                    headers = list(message.get('headers', []))
+                    headers.append((b'server-timing', ', '.join(entries).encode()))
+                    message = {**message, 'headers': headers}
+            await send(message)
+
+        metrics.http_inflight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.http_inflight.dec()
+            route = scope.get('route')
+            path = route.path if route is not None else 'unmatched'
+            metrics.http_duration.observe(time.perf_counter() - start, scope['method'], path, str(status_code))
+            server_timings.reset(token)
@@ -1,170 +1,604 @@
-import json
-from uuid import uuid4
-from PyPDF2 import PdfReader
+import asyncio
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, status
-from fastapi.responses import JSONResponse
+from contextlib import aclosing
+
+import orjson
+import openai
+
+from fastapi import APIRouter, HTTPException, UploadFile, File, Header, Query, Request, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from log_handler.log import logger 
 
 from mapper.mapper import Mapper 
-from settings.system_settings import article_summarizer_prompt
+from mapper.governor import Priority
 
 from qdrant_client import models
 
-from schemas.search_schemas import SemanticSearchReq
+from schemas.search_schemas import PassageSearchReq, SemanticSearchReq, SearchMode
+from schemas.job_schemas import JobStage, JobStatus, JobAccepted, DuplicateArticle
+from schemas.batch_schemas import BatchItemRes, BatchIngestRes
+from schemas.retrieval_schemas import RetrieveReq, ScrollReq, ScrollRes, FacetReq, FacetRes
+
+from settings.ingestion_settings import IngestionSettings
+from settings.collection_settings import CollectionSettings
+from mapper.collection_manager import CollectionManager, PassageCollectionManager
+from mapper.tenancy import TenantError, TenantScope
+from ingestion.jobs import IngestionQueue, QueueFullError, StageCallback
+from ingestion.archive import is_archive, unpack_pdfs
+from ingestion.fingerprint import TextFingerprint, fingerprint_bytes, article_id_from_fingerprint, normalize_article_id, passage_id
+from ingestion.summarizer import Passage, Summarizer
+from ingestion.metadata import with_publication_fields
+from search.fusion import reciprocal_rank_fusion
+from search.filters import FACET_KEYS, build_filter, payload_selector
+from metrics.metrics import metrics
+from server.responses import response_factory
+
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
 
 class Article:
-    def __init__(self, mapper:Mapper) -> None:
+    EXPORT_PAGE_SIZE:int=256
+    
+    def __init__(self, mapper:Mapper, ingestion_settings:IngestionSettings, collection_settings:CollectionSettings) -> None:
         self.router = APIRouter(
             prefix="/v1/article",
             tags=["Article"],
             responses={200: {"description": "Article router is used to add, get and delete articles in qdrant"}},
         )
         
-        self.collection_name = 'articles_'
+        self.collection_name = collection_settings.name
         self.mapper = mapper
+        self.collection_manager = CollectionManager(mapper=mapper, collection_settings=collection_settings)
+        self.ingestion_settings = ingestion_settings
+        self.summarizer = Summarizer(mapper=mapper, ingestion_settings=ingestion_settings)
+        self.passage_manager = PassageCollectionManager(mapper=mapper, collection_settings=collection_settings) if ingestion_settings.passage_vectors else None
+        self.ingestion_queue = IngestionQueue(
+            mapper=mapper,
+            ingestion_settings=ingestion_settings,
+            handler=self.__ingest
+        )
         
-        self.router.add_api_route("/add", endpoint=self.add_article, methods=["POST"])
+        self.router.add_api_route("/add", endpoint=self.add_article, methods=["POST"], status_code=status.HTTP_202_ACCEPTED, responses={200: {"model": DuplicateArticle}, 202: {"model": JobAccepted}})
+        self.router.add_api_route("/add-batch", endpoint=self.add_articles, methods=["POST"], response_model=BatchIngestRes)
+        self.router.add_api_route("/jobs", endpoint=self.list_jobs, methods=["GET"], response_model=List[JobStatus])
+        self.router.add_api_route("/jobs/{job_id}", endpoint=self.get_job, methods=["GET"], response_model=JobStatus)
         self.router.add_api_route("/get", endpoint=self.get_article, methods=["GET"])
+        self.router.add_api_route("/get-many", endpoint=self.get_articles, methods=["POST"])
+        self.router.add_api_route("/scroll", endpoint=self.scroll_articles, methods=["POST"], response_model=ScrollRes)
+        self.router.add_api_route("/export", endpoint=self.export_articles, methods=["GET"])
+        self.router.add_api_route("/facets", endpoint=self.facet_articles, methods=["POST"], response_model=FacetRes)
         self.router.add_api_route("/search", endpoint=self.semantic_search, methods=["POST"])
+        if self.passage_manager is not None:
+            self.router.add_api_route("/search-passages", endpoint=self.search_passages, methods=["POST"])
     
-    async def __create_collection(self):
-        await self.mapper.shared_qdrant_client.create_collection(
-            collection_name=self.collection_name,
-            vectors_config=models.VectorParams(size=1024, distance=models.Distance.COSINE)
-        )
-        logger.debug(f'Collection `{self.collection_name}` successfully created')
-                
-    async def __extact_txt_from_pdf(self, file_path: str):
-        reader = PdfReader(file_path)
-        pages = [page.extract_text() for page in reader.pages]
-        return '\n'.join(pages)
-    
-    async def __parse_article(self, text: str) -> dict:
-        print('start..llm')
-        completion_res = await self.mapper.shared_openai_client.chat.completions.create(
-            messages=[
-                {'role': 'system', 'content': article_summarizer_prompt},
-                {'role': 'user', 'content': f'article: ###\n{text}\n###'}
-            ],
-            stream=False,
-            model='gpt-4o-mini',
-            response_format={'type': 'json_object'}   
-        )
-        print('end llm')
-        json_doc = completion_res.choices[0].message.content.strip()
-        mark0 = json_doc.index('{')
-        mark1 = json_doc[-1::-1].index('}')
-        json_doc = json_doc[mark0:len(json_doc) - mark1]
-        return json.loads(json_doc)
-                
-    async def __add_vector(self, vector_id: str, metadata: dict) -> None:
-        logger.debug(f'Checking for collection `{self.collection_name}`...')
-        collection_found = await self.mapper.shared_qdrant_client.collection_exists(collection_name=self.collection_name)
-        if not collection_found:    
-            await self.__create_collection()
-        else:
-            logger.debug(f'Collection `{self.collection_name}` found!')
-        
-        summary = metadata['summary']
-        summary_embeddings = await self.mapper.get_embedding(text=summary)
-        await self.mapper.shared_qdrant_client.upsert(
-            collection_name=self.collection_name,
+    async def start(self):
+        await self.collection_manager.ensure()
+        if self.passage_manager is not None:
+            await self.passage_manager.ensure()
+        await self.ingestion_queue.start()
+    
+    async def stop(self):
+        await self.ingestion_queue.stop()
+    
+    async def __scope(self, tenant: Optional[str], manager: Optional[CollectionManager] = None, refresh: bool = False) -> TenantScope:
+        try:
+            return await (manager or self.collection_manager).scope(tenant, refresh=refresh)
+        except TenantError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+    
+    async def __add_vectors(self, points: List[models.PointStruct], scope: TenantScope) -> None:
+        step = self.ingestion_settings.upsert_batch_size
+        for start in range(0, len(points), step):
+            with metrics.track_stage('qdrant_upsert'):
+                await self.mapper.shared_qdrant_client.upsert(
+                    collection_name=self.collection_name,
+                    points=points[start:start + step],
+                    wait=True,
+                    shard_key_selector=scope.shard_key,
+                )
+        # only once the points are searchable, a search run in between would otherwise be cached without them
+        self.mapper.search_cache.invalidate()
+    
+    async def __add_vector(self, vector_id: str, metadata: dict, summary_embeddings: List[float], scope: TenantScope) -> None:
+        await self.__add_vectors(
             points=[
                 models.PointStruct(
                     id=vector_id,
                     payload=metadata,
-                    vector=summary_embeddings[:1024],
+                    vector=self.collection_manager.make_vector(summary_embeddings, metadata),
                 ),
             ],
+            scope=scope
+        )
+    
+    async def __retrieve(self, scope: TenantScope, ids: List[str], with_payload: Any, with_vectors: Any) -> List[models.Record]:
+        if scope.partitioned:
+            # retrieve takes no filter, the ids are looked up inside the partition of the tenant
+            points, _ = await self.mapper.shared_qdrant_client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=scope.filter(models.Filter(must=[models.HasIdCondition(has_id=ids)])),
+                limit=len(ids),
+                with_payload=with_payload,
+                with_vectors=with_vectors
+            )
+            return points
+        return await self.mapper.shared_qdrant_client.retrieve(
+            collection_name=self.collection_name,
+            ids=ids,
+            with_payload=with_payload,
+            with_vectors=with_vectors,
+            shard_key_selector=scope.shard_key
+        )
+    
+    async def __find_existing(self, article_ids: List[str], scope: TenantScope) -> Set[str]:
+        points = await self.__retrieve(scope, article_ids, with_payload=False, with_vectors=False)
+        return {str(point.id) for point in points}
+    
+    async def __find_by_text_fingerprint(self, text_fingerprint: str, scope: TenantScope) -> Optional[str]:
+        points, _ = await self.mapper.shared_qdrant_client.scroll(
+            collection_name=self.collection_name,
+            scroll_filter=scope.filter(models.Filter(
+                must=[models.FieldCondition(key='text_fingerprint', match=models.MatchValue(value=text_fingerprint))]
+            )),
+            limit=1,
+            with_payload=False,
+            with_vectors=False,
+            shard_key_selector=scope.shard_key
         )
+        return str(points[0].id) if points else None
+    
+    async def __add_passages(self, article_id: str, passages: List[Passage], tenant: Optional[str], wait: bool = True) -> None:
+        if self.passage_manager is None or not passages:
+            return
+        scope = await self.passage_manager.scope(tenant, refresh=True)
+        embeddings = await self.mapper.get_embeddings([passage.summary for passage in passages], priority=Priority.BULK)
+        points = [
+            models.PointStruct(
+                id=passage_id(article_id, passage.index),
+                payload=scope.tag(passage.to_payload(article_id)),
+                vector=self.passage_manager.make_vector(embedding),
+            )
+            for passage, embedding in zip(passages, embeddings)
+        ]
+        step = self.ingestion_settings.upsert_batch_size
+        for start in range(0, len(points), step):
+            with metrics.track_stage('qdrant_upsert'):
+                await self.mapper.shared_qdrant_client.upsert(
+                    collection_name=self.passage_manager.collection_name,
+                    points=points[start:start + step],
+                    wait=wait,
+                    shard_key_selector=scope.shard_key,
+                )
+    
+    async def __extract_and_parse(self, content: bytes, force: bool, on_stage: StageCallback, scope: TenantScope) -> Tuple[Optional[dict], List[Passage], Optional[str]]:
+        on_stage(JobStage.EXTRACTING)
+        # pages are fingerprinted and summarized while they are extracted, the full text is never built
+        text_fingerprint = TextFingerprint()
+        existing_id: Optional[str] = None
+        
+        async def fingerprinted_pages():
+            async with aclosing(self.mapper.pdf_extractor.iter_pages(content)) as pages:
+                async for page in pages:
+                    text_fingerprint.update(page)
+                    yield page
+        
+        async def on_extracted() -> bool:
+            nonlocal existing_id
+            if not force and self.ingestion_settings.dedup_by_text:
+                existing_id = await self.__find_by_text_fingerprint(text_fingerprint.hexdigest(), scope)
+                if existing_id is not None:
+                    return False
+            on_stage(JobStage.SUMMARIZING)
+            return True
+        
+        async with aclosing(fingerprinted_pages()) as pages:
+            summary = await self.summarizer.summarize(pages, on_extracted)
+        if summary is None:
+            return None, [], existing_id
+        article_metadata, passages = summary
+        article_metadata['fingerprint'] = fingerprint_bytes(content)
+        article_metadata['text_fingerprint'] = text_fingerprint.hexdigest()
+        return scope.tag(with_publication_fields(article_metadata)), passages, None
     
-    async def add_article(self, file: UploadFile = File()):
-        article_id = str(uuid4())
+    async def __ingest(self, content: bytes, force: bool, tenant: Optional[str], on_stage: StageCallback) -> Tuple[str, bool]:
+        scope = await self.collection_manager.scope(tenant, refresh=True)
+        article_id = article_id_from_fingerprint(fingerprint_bytes(content), scope.namespace)
+        if not force and article_id in await self.__find_existing([article_id], scope):
+            return article_id, True
+        
+        article_metadata, passages, existing_id = await self.__extract_and_parse(content, force, on_stage, scope)
+        if existing_id is not None:
+            return existing_id, True
+        on_stage(JobStage.EMBEDDING)
+        summary_embeddings = await self.mapper.get_embedding(text=article_metadata['summary'], priority=Priority.BULK)
+        on_stage(JobStage.INDEXING)
+        await self.__add_vector(article_id, article_metadata, summary_embeddings, scope)
+        await self.__add_passages(article_id, passages, scope.tenant)
+        return article_id, False
+    
+    async def add_article(self, file: UploadFile = File(), force: bool = False, x_tenant: Optional[str] = Header(default=None)):
         if file.content_type != "application/pdf":
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Only pdf files are accepted!"
             )
             
+        with metrics.track_stage('upload_read'):
+            content = await file.read()
+        scope = await self.__scope(x_tenant)
+        if not force:
+            article_id = article_id_from_fingerprint(fingerprint_bytes(content), scope.namespace)
+            if article_id in await self.__find_existing([article_id], scope):
+                return JSONResponse(
+                    status_code=status.HTTP_200_OK,
+                    content=DuplicateArticle(article_id=article_id).model_dump()
+                )
+        
         try:
-            article_text = await self.__extact_txt_from_pdf(file.file)
-            article_metadata = await self.__parse_article(article_text)
-            await self.__add_vector(article_id, article_metadata)
-            return JSONResponse(
-                status_code=status.HTTP_201_CREATED,
-                content={
-                    "message": f"Article ({article_id}) of '{self.collection_name}' successfully created",
-                }
-            )
-        except Exception as e:
-            logger.error(f"Error while creating a record: {str(e)}")
+            job = await self.ingestion_queue.submit(filename=file.filename, content=content, force=force, tenant=scope.tenant)
+        except QueueFullError as e:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail=str(e)
+            )
+        return JobAccepted(
+            job_id=job.job_id,
+            status_url=f"{self.router.prefix}/jobs/{job.job_id}"
         )
+    
+    async def __parse_batch_item(self, semaphore: asyncio.Semaphore, content: bytes, force: bool, scope: TenantScope) -> Tuple[Optional[dict], List[Passage], Optional[str]]:
+        async with semaphore:
+            return await self.__extract_and_parse(content, force, lambda stage: None, scope)
+    
+    async def ingest_batch(self, documents: List[Tuple[str, bytes]], force: bool = False, tenant: Optional[str] = None) -> BatchIngestRes:
+        scope = await self.__scope(tenant, refresh=True)
+        items = [BatchItemRes(filename=filename, success=False) for filename, _ in documents]
+        article_ids = [article_id_from_fingerprint(fingerprint_bytes(content), scope.namespace) for _, content in documents]
         
-    async def get_article(self, article_id: str):
-        try:
-            result = await self.mapper.shared_qdrant_client.retrieve(
-                collection_name=self.collection_name,
-                ids=[article_id],
-                with_payload=True,
-                with_vectors=False
+        # the same file sent twice in one batch, or already indexed, is not processed again
+        first_seen: Dict[str, int] = {}
+        existing = set() if force else await self.__find_existing(list(set(article_ids)), scope)
+        to_parse: List[int] = []
+        for index, article_id in enumerate(article_ids):
+            if article_id in first_seen or article_id in existing:
+                items[index].success, items[index].duplicate, items[index].article_id = True, True, article_id
+            else:
+                first_seen[article_id] = index
+                to_parse.append(index)
+        
+        semaphore = asyncio.Semaphore(self.ingestion_settings.batch_concurrency)
+        parsed = await asyncio.gather(
+            *[self.__parse_batch_item(semaphore, documents[index][1], force, scope) for index in to_parse],
+            return_exceptions=True
+        )
+        
+        pending: Dict[int, dict] = {}
+        pending_passages: Dict[int, List[Passage]] = {}
+        for index, result in zip(to_parse, parsed):
+            if isinstance(result, Exception):
+                logger.error(f"Error while parsing {items[index].filename}: {str(result)}")
+                items[index].error = str(result)
+                continue
+            metadata, passages, existing_id = result
+            if existing_id is not None:
+                items[index].success, items[index].duplicate, items[index].article_id = True, True, existing_id
+            else:
+                pending[index] = metadata
+                pending_passages[index] = passages
+        
+        if pending:
+            try:
+                indices = list(pending.keys())
+                embeddings = await self.mapper.get_embeddings([pending[index]['summary'] for index in indices], priority=Priority.BULK)
+                points = []
+                for index, embedding in zip(indices, embeddings):
+                    points.append(models.PointStruct(id=article_ids[index], payload=pending[index], vector=self.collection_manager.make_vector(embedding, pending[index])))
+                    items[index].article_id = article_ids[index]
+                await self.__add_vectors(points, scope)
+                for index in indices:
+                    await self.__add_passages(article_ids[index], pending_passages[index], scope.tenant, wait=False)
+                    items[index].success = True
+            except Exception as e:
+                logger.error(f"Error while indexing the batch: {str(e)}")
+                for index in pending:
+                    items[index].article_id = None
+                    items[index].error = str(e)
+        
+        nb_success = sum(item.success for item in items)
+        return BatchIngestRes(nb_success=nb_success, nb_failure=len(items) - nb_success, items=items)
+    
+    async def add_articles(self, files: List[UploadFile] = File(), force: bool = False, x_tenant: Optional[str] = Header(default=None)):
+        documents: List[Tuple[str, bytes]] = []
+        for file in files:
+            with metrics.track_stage('upload_read'):
+                content = await file.read()
+            if is_archive(file.filename, file.content_type):
+                try:
+                    documents.extend(await asyncio.to_thread(unpack_pdfs, content))
+                except Exception as e:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Unable to read archive {file.filename}: {str(e)}"
+                    )
+            elif file.content_type == "application/pdf":
+                documents.append((file.filename, content))
+            else:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Only pdf files and tar archives are accepted! ({file.filename})"
+                )
+        
+        if not documents:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No pdf file was found in the request"
             )
-            document = result[0]
-            return JSONResponse(
-                status_code=status.HTTP_200_OK,
-                content={
-                    "article": document.payload
-                }
+        return await self.ingest_batch(documents, force=force, tenant=x_tenant)
+    
+    async def list_jobs(self, limit: int = 50, stage: Optional[JobStage] = None, x_tenant: Optional[str] = Header(default=None)):
+        scope = await self.__scope(x_tenant)
+        return await self.ingestion_queue.registry.fetch_list(limit=limit, stage=stage, tenant=scope.tenant)
+    
+    async def get_job(self, job_id: str, x_tenant: Optional[str] = Header(default=None)):
+        scope = await self.__scope(x_tenant)
+        job = await self.ingestion_queue.registry.fetch(job_id)
+        if job is None or job.tenant != scope.tenant:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Job ({job_id}) was not found"
             )
-            
+        return job
+        
+    async def get_article(self, request: Request, article_id: str, fields: Optional[List[str]] = Query(default=None), x_tenant: Optional[str] = Header(default=None)):
+        try:
+            article_id = normalize_article_id(article_id)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=str(e)
+            )
+        scope = await self.__scope(x_tenant)
+        try:
+            result = await self.__retrieve(scope, [article_id], with_payload=payload_selector(fields), with_vectors=False)
         except Exception as e:
             logger.error(f"Error while getting the article: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=str(e)
             )
-            
-    async def semantic_search(self, incoming_req:SemanticSearchReq):
-        collection_found = await self.mapper.shared_qdrant_client.collection_exists(collection_name=self.collection_name)
-        if not collection_found:
+        if not result:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"{self.collection_name} was not found, can not apply semantic search in this collection"
+                detail=f"Article ({article_id}) was not found"
             )
-            
-        print("start..llm")
-        completion_res = await self.mapper.shared_openai_client.chat.completions.create(
-            messages=[
-                {'role': 'system', 'content': "You are a query enricher, your role will be to analyze the query and generate a more complete query for an article search. DO NOT ADD ANY NEW INFORMATION, ONLY ENRICH THE QUERY."},
-                {'role': 'user', 'content': f'{incoming_req.query}'}
-            ],
-            stream=False,
-            model="gpt-4o-mini", 
+        return response_factory.make(request, {"article": result[0].payload})
+    
+    def __export_vectors(self, with_vectors: bool):
+        # the prefix of a two-stage collection can be recomputed from the full vector
+        if with_vectors and self.collection_manager.two_stage:
+            return [CollectionManager.FULL_VECTOR]
+        return with_vectors
+    
+    @staticmethod
+    def __point_to_dict(point: models.Record) -> dict:
+        document = {"id": str(point.id), **(point.payload or {})}
+        if point.vector is not None:
+            document["vector"] = CollectionManager.dense_vector(point.vector)
+        return document
+    
+    async def get_articles(self, incoming_req: RetrieveReq, request: Request, x_tenant: Optional[str] = Header(default=None)):
+        scope = await self.__scope(x_tenant)
+        with metrics.track_stage('qdrant_retrieve'):
+            points = await self.__retrieve(
+                scope,
+                incoming_req.ids,
+                with_payload=payload_selector(incoming_req.fields),
+                with_vectors=self.__export_vectors(incoming_req.with_vectors)
+            )
+        found = {str(point.id): point for point in points}
+        return response_factory.make(request, {
+            "articles": [self.__point_to_dict(found[article_id]) for article_id in incoming_req.ids if article_id in found],
+            "missing": [article_id for article_id in incoming_req.ids if article_id not in found]
+        })
+    
+    async def scroll_articles(self, incoming_req: ScrollReq, x_tenant: Optional[str] = Header(default=None)):
+        scope = await self.__scope(x_tenant)
+        with metrics.track_stage('qdrant_scroll'):
+            points, next_offset = await self.mapper.shared_qdrant_client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=scope.filter(build_filter(incoming_req.filter)),
+                limit=incoming_req.limit,
+                offset=incoming_req.cursor,
+                with_payload=payload_selector(incoming_req.fields),
+                with_vectors=False,
+                shard_key_selector=scope.shard_key
+            )
+        return ScrollRes(
+            articles=[self.__point_to_dict(point) for point in points],
+            next_cursor=str(next_offset) if next_offset is not None else None
         )
-        print("end llm")
-        enhanced_query = completion_res.choices[0].message.content
-        logger.debug(enhanced_query)
-        query_embedding = await self.mapper.get_embedding(
-            text=enhanced_query
+    
+    async def __export_lines(self, with_vectors: bool, fields: Optional[List[str]], scope: TenantScope) -> AsyncIterator[bytes]:
+        # one scroll page is held at a time, whatever the size of the collection
+        offset = None
+        nb_points = 0
+        try:
+            while True:
+                points, offset = await self.mapper.shared_qdrant_client.scroll(
+                    collection_name=self.collection_name,
+                    scroll_filter=scope.filter(),
+                    limit=self.EXPORT_PAGE_SIZE,
+                    offset=offset,
+                    with_payload=payload_selector(fields),
+                    with_vectors=self.__export_vectors(with_vectors),
+                    shard_key_selector=scope.shard_key
+                )
+                nb_points += len(points)
+                yield b''.join(orjson.dumps(self.__point_to_dict(point)) + b'\n' for point in points)
+                if offset is None:
+                    break
+        except Exception as e:
+            # the status line is already sent, the truncated export is only visible in the logs
+            logger.error(f"Export interrupted after {nb_points} articles: {str(e)}")
+            raise
+        logger.debug(f"Exported {nb_points} articles")
+    
+    async def export_articles(self, with_vectors: bool = False, fields: Optional[List[str]] = Query(default=None), x_tenant: Optional[str] = Header(default=None)):
+        scope = await self.__scope(x_tenant)
+        return StreamingResponse(
+            self.__export_lines(with_vectors, fields, scope),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": f'attachment; filename="{self.collection_name}.ndjson"'}
         )
+    
+    async def __facet(self, key: str, incoming_req: FacetReq, scope: TenantScope):
+        with metrics.track_stage('qdrant_facet'):
+            response = await self.mapper.shared_qdrant_client.facet(
+                collection_name=self.collection_name,
+                key=FACET_KEYS[key],
+                facet_filter=scope.filter(build_filter(incoming_req.filter)),
+                limit=incoming_req.limit,
+                exact=incoming_req.exact,
+                shard_key_selector=scope.shard_key
+            )
+        return [{"value": hit.value, "count": hit.count} for hit in response.hits]
+    
+    async def facet_articles(self, incoming_req: FacetReq, x_tenant: Optional[str] = Header(default=None)):
+        # counted by qdrant on the payload indexes, no article is read out of it
+        scope = await self.__scope(x_tenant)
+        keys = list(dict.fromkeys(incoming_req.keys))
+        counts = await asyncio.gather(*[self.__facet(key, incoming_req, scope) for key in keys])
+        return FacetRes(facets=dict(zip(keys, counts)))
+    
+    async def __enrich_query(self, query: str) -> str:
+        with metrics.track_stage('llm_enrich'):
+            completion_res = await self.mapper.chat_completion(
+                model="gpt-4o-mini", 
+                messages=[
+                    {'role': 'system', 'content': "You are a query enricher, your role will be to analyze the query and generate a more complete query for an article search. DO NOT ADD ANY NEW INFORMATION, ONLY ENRICH THE QUERY."},
+                    {'role': 'user', 'content': f'{query}'}
+                ],
+                priority=Priority.INTERACTIVE,
+                max_output_tokens=256,
+                stream=False,
+            )
+        enhanced_query = completion_res.choices[0].message.content
+        logger.debug(f'Enriched query: {enhanced_query[:200]}')
+        return enhanced_query
+    
+    async def __search_text(self, text: str, limit: int, with_payload: bool = True, query_filter: Optional[models.Filter] = None, scope: Optional[TenantScope] = None, query_embedding: Optional[List[float]] = None) -> List[models.ScoredPoint]:
+        if query_embedding is None:
+            query_embedding = await self.mapper.get_embedding(text=text)
+        return await self.collection_manager.query(query_embedding, limit, with_payload=with_payload, query_filter=query_filter, scope=scope)
+    
+    async def __search_hybrid(self, text: str, limit: int, with_payload: bool = True, query_filter: Optional[models.Filter] = None, scope: Optional[TenantScope] = None, query_embedding: Optional[List[float]] = None) -> List[models.ScoredPoint]:
+        if query_embedding is None:
+            query_embedding = await self.mapper.get_embedding(text=text)
+        return await self.collection_manager.hybrid_query(query_embedding, text, limit, with_payload=with_payload, query_filter=query_filter, scope=scope)
+    
+    async def __search_enriched(self, query: str, limit: int, with_payload: bool = True, query_filter: Optional[models.Filter] = None, scope: Optional[TenantScope] = None) -> List[models.ScoredPoint]:
+        enhanced_query = await self.__enrich_query(query)
+        return await self.__search_text(enhanced_query, limit, with_payload, query_filter, scope)
+    
+    async def __search_speculative(self, query: str, limit: int, deadline_ms: int, with_payload: bool = True, query_filter: Optional[models.Filter] = None, scope: Optional[TenantScope] = None, query_embedding: Optional[List[float]] = None) -> Tuple[List[models.ScoredPoint], bool]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + deadline_ms / 1000
+        enriched_task = asyncio.create_task(self.__search_enriched(query, limit, with_payload, query_filter, scope))
+        try:
+            raw_points = await self.__search_text(query, limit, with_payload, query_filter, scope, query_embedding)
+        except BaseException:
+            enriched_task.cancel()
+            raise
         
-        points = await self.mapper.shared_qdrant_client.query_points(
-            collection_name=self.collection_name,
-            query=query_embedding[:1024],
-            limit=incoming_req.nb_neighbors
-        )
+        try:
+            enriched_points = await asyncio.wait_for(enriched_task, timeout=max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            logger.debug(f'Query enrichment missed its {deadline_ms}ms deadline, serving raw results')
+            return raw_points, False
+        except Exception as e:
+            logger.warning(f'Query enrichment failed, serving raw results: {str(e)}')
+            return raw_points, False
+        return reciprocal_rank_fusion([enriched_points, raw_points], limit=limit), True
+    
+    async def semantic_search(self, incoming_req:SemanticSearchReq, request:Request, x_tenant:Optional[str]=Header(default=None)):
+        try:
+            return response_factory.make(request, await self.__semantic_search(incoming_req, x_tenant))
+        except openai.RateLimitError as e:
+            logger.warning(f'Search rejected, openai rate limit still exceeded after retries: {str(e)}')
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail='The embedding provider is rate limited, retry later' + (' or use the sparse mode' if self.collection_manager.sparse else '')
+            )
+    
+    async def __semantic_search(self, incoming_req:SemanticSearchReq, tenant:Optional[str]) -> dict:
+        scope = await self.__scope(tenant)
+        if incoming_req.mode in (SearchMode.SPARSE, SearchMode.HYBRID) and not self.collection_manager.sparse:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"The {incoming_req.mode.value} mode needs sparse vectors, which collection `{self.collection_name}` does not have"
+            )
+        
+        query_embedding = None
+        if self.mapper.search_cache_settings.enabled:
+            search_filter = incoming_req.filter.model_dump_json(exclude_none=True) if incoming_req.filter is not None else None
+            params = (incoming_req.nb_neighbors, incoming_req.mode.value, incoming_req.ids_only, search_filter, scope.tenant)
+            cache_key = self.mapper.search_cache.make_key(incoming_req.query, params)
+            content = self.mapper.search_cache.get(cache_key)
+            # a sparse search must not wait for an embedding, even for the semantic cache
+            if content is None and self.mapper.search_cache_settings.semantic_enabled and incoming_req.mode != SearchMode.SPARSE:
+                query_embedding = await self.mapper.get_embedding(text=incoming_req.query)
+                content = self.mapper.search_cache.get_similar(query_embedding, params)
+            if content is not None:
+                return content
+            content = await self.mapper.search_cache.get_or_compute(
+                cache_key,
+                # the embedding of the semantic lookup is the one the raw query is searched with
+                lambda: self.__run_search(incoming_req, scope, query_embedding),
+                embedding=query_embedding
+            )
+        else:
+            content = await self.__run_search(incoming_req, scope)
+        
+        return content
+    
+    async def search_passages(self, incoming_req:PassageSearchReq, request:Request, x_tenant:Optional[str]=Header(default=None)):
+        scope = await self.__scope(x_tenant, self.passage_manager)
+        query_embedding = await self.mapper.get_embedding(text=incoming_req.query)
+        points = await self.passage_manager.query(query_embedding, incoming_req.nb_neighbors, with_payload=not incoming_req.ids_only, scope=scope)
+        if incoming_req.ids_only:
+            return response_factory.make(request, {"passages": [{"id": str(point.id), "score": point.score} for point in points]})
+        return response_factory.make(request, {"passages": [{**point.payload, "score": point.score} for point in points]})
+    
+    async def __run_search(self, incoming_req:SemanticSearchReq, scope:TenantScope, query_embedding:Optional[List[float]]=None) -> dict:
+        with_payload = not incoming_req.ids_only
+        query_filter = build_filter(incoming_req.filter)
+        if incoming_req.mode == SearchMode.FAST:
+            points, enriched = await self.__search_text(incoming_req.query, incoming_req.nb_neighbors, with_payload, query_filter, scope, query_embedding), False
+        elif incoming_req.mode == SearchMode.SPARSE:
+            points, enriched = await self.collection_manager.sparse_query(incoming_req.query, incoming_req.nb_neighbors, with_payload, query_filter, scope), False
+        elif incoming_req.mode == SearchMode.HYBRID:
+            points, enriched = await self.__search_hybrid(incoming_req.query, incoming_req.nb_neighbors, with_payload, query_filter, scope, query_embedding), False
+        elif incoming_req.mode == SearchMode.SPECULATIVE:
+            points, enriched = await self.__search_speculative(
+                incoming_req.query,
+                incoming_req.nb_neighbors,
+                incoming_req.enrichment_deadline_ms,
+                with_payload,
+                query_filter,
+                scope,
+                query_embedding
+            )
+        else:
+            points, enriched = await self.__search_enriched(incoming_req.query, incoming_req.nb_neighbors, with_payload, query_filter, scope), True
         
-        articles = []
-        if hasattr(points, 'points'):
-            for point in points.points:
-                articles.append(point.payload)
-                
-        return JSONResponse(
-            status_code=status.HTTP_200_OK,
-            content={
-                "articles": articles
+        if incoming_req.ids_only:
+            return {
+                "articles": [{"id": str(point.id), "score": point.score} for point in points],
+                "enriched": enriched
             }
-        )
\ No newline at end of file
+        return {
+            "articles": [point.payload for point in points],
+            "enriched": enriched
+        }
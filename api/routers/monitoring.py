@@ -0,0 +1,37 @@
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+
+from mapper.mapper import Mapper
+
+class Monitoring:
+    def __init__(self, mapper:Mapper) -> None:
+        self.router = APIRouter(
+            prefix="/v1/monitoring",
+            tags=["Monitoring"],
+            responses={200: {"description": "Monitoring router exposes runtime statistics of the shared resources"}},
+        )
+        self.mapper = mapper
+        self.router.add_api_route("/embedding-cache", endpoint=self.embedding_cache_stats, methods=["GET"])
+        self.router.add_api_route("/search-cache", endpoint=self.search_cache_stats, methods=["GET"])
+        self.router.add_api_route("/ready", endpoint=self.readiness, methods=["GET"])
+
+    async def embedding_cache_stats(self):
+        return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content=self.mapper.embedding_cache.stats()
+        )
+
+    async def search_cache_stats(self):
+        return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content=self.mapper.search_cache.stats()
+        )
+
+    async def readiness(self):
+        # unlike /health, every dependency is probed through the shared clients
+        dependencies = await self.mapper.check_dependencies()
+        ready = all(dependency['ready'] for dependency in dependencies.values())
+        return JSONResponse(
+            status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={'ready': ready, 'dependencies': dependencies}
+        )
@@ -2,34 +2,59 @@
 import asyncio 
 from mapper.mapper import Mapper
 
-from settings.server_settings import ServerSettings
+from settings.server_settings import ServerSettings, ExtractorSettings
 from settings.openai_settings import OpenAiSettings
 from settings.qdrant_settings import QdrantSettings
+from settings.ingestion_settings import IngestionSettings
+from settings.cache_settings import EmbeddingCacheSettings, SearchCacheSettings
+from settings.collection_settings import CollectionSettings
+from settings.log_settings import LogSettings
+from settings.reindex_settings import ReindexSettings
+
+from log_handler.log import configure_logging, stop_logging
 
 from routers._docs import APIDocumentation
 from routers.article import Article
+from routers.monitoring import Monitoring
 
 from server.server import ApiServer
 
+from mapper.collection_manager import CollectionManager, PassageCollectionManager
+from mapper.reindexer import Reindexer
+
+from typing import Optional
+
 async def run_services(
     server_settings:ServerSettings,
     openai_settings:OpenAiSettings, 
     qdrant_settings: QdrantSettings,
+    extractor_settings:ExtractorSettings,
+    ingestion_settings:IngestionSettings,
+    cache_settings:EmbeddingCacheSettings,
+    search_cache_settings:SearchCacheSettings,
+    collection_settings:CollectionSettings,
     ):
     
     mapper_ = Mapper(
         openai_settings=openai_settings,
         qdrant_settings=qdrant_settings,
+        extractor_settings=extractor_settings,
+        cache_settings=cache_settings,
+        search_cache_settings=search_cache_settings,
     )
     async with mapper_ as context_mapper:
         server = ApiServer(server_settings=server_settings)
         
         docs_router = APIDocumentation(mapper=context_mapper, server=server)
-        article_router = Article(mapper=context_mapper)
+        article_router = Article(mapper=context_mapper, ingestion_settings=ingestion_settings, collection_settings=collection_settings)
+        monitoring_router = Monitoring(mapper=context_mapper)
         
         # init the main server
         server.add_router(target_router=docs_router.router)
         server.add_router(target_router=article_router.router)
+        server.add_router(target_router=monitoring_router.router)
+        server.add_lifespan_callbacks(on_startup=context_mapper.warm_up)
+        server.add_lifespan_callbacks(on_startup=article_router.start, on_shutdown=article_router.stop)
 
 
         await server.run()
@@ -38,6 +63,48 @@ def run_event_loop(
     server_settings:ServerSettings,
     openai_settings:OpenAiSettings, 
     qdrant_settings: QdrantSettings,
+    extractor_settings:ExtractorSettings,
+    ingestion_settings:IngestionSettings,
+    cache_settings:EmbeddingCacheSettings,
+    search_cache_settings:SearchCacheSettings,
+    collection_settings:CollectionSettings,
+    log_settings:LogSettings,
+    ):
+    configure_logging(log_settings=log_settings)
+    try:
+        asyncio.run(main=run_services(server_settings, openai_settings, qdrant_settings, extractor_settings, ingestion_settings, cache_settings, search_cache_settings, collection_settings))
+    finally:
+        stop_logging()
+    
+
+async def run_reindex(
+    openai_settings:OpenAiSettings,
+    qdrant_settings: QdrantSettings,
+    extractor_settings:ExtractorSettings,
+    cache_settings:EmbeddingCacheSettings,
+    search_cache_settings:SearchCacheSettings,
+    collection_settings:CollectionSettings,
+    reindex_settings:ReindexSettings,
+    passages:bool=False,
+    target:Optional[str]=None,
+    reuse_vectors:bool=False,
+    switch:bool=True,
+    drop_legacy:bool=False,
     ):
-    asyncio.run(main=run_services(server_settings, openai_settings, qdrant_settings))
-    
\ No newline at end of file
+    
+    mapper_ = Mapper(
+        openai_settings=openai_settings,
+        qdrant_settings=qdrant_settings,
+        extractor_settings=extractor_settings,
+        cache_settings=cache_settings,
+        search_cache_settings=search_cache_settings,
+    )
+    async with mapper_ as context_mapper:
+        manager_class = PassageCollectionManager if passages else CollectionManager
+        reindexer = Reindexer(
+            mapper=context_mapper,
+            manager=manager_class(mapper=context_mapper, collection_settings=collection_settings),
+            reindex_settings=reindex_settings,
+            reuse_vectors=reuse_vectors,
+        )
+        await reindexer.run(target=target, switch=switch, drop_legacy=drop_legacy)
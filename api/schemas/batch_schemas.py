@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+
+from typing import List, Optional
+
+class BatchItemRes(BaseModel):
+    filename:str
+    success:bool
+    article_id:Optional[str]=None
+    duplicate:bool=False
+    error:Optional[str]=None
+
+class BatchIngestRes(BaseModel):
+    nb_success:int
+    nb_failure:int
+    items:List[BatchItemRes]
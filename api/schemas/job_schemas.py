@@ -0,0 +1,35 @@
+from enum import Enum
+from pydantic import BaseModel
+
+from typing import List, Optional
+
+class JobStage(str, Enum):
+    QUEUED='queued'
+    EXTRACTING='extracting'
+    SUMMARIZING='summarizing'
+    EMBEDDING='embedding'
+    INDEXING='indexing'
+    DONE='done'
+    FAILED='failed'
+
+class JobEvent(BaseModel):
+    stage:JobStage
+    at:float
+
+class JobStatus(BaseModel):
+    job_id:str
+    filename:str
+    tenant:Optional[str]=None
+    stage:JobStage=JobStage.QUEUED
+    article_id:Optional[str]=None
+    duplicate:bool=False
+    error:Optional[str]=None
+    history:List[JobEvent]=[]
+
+class JobAccepted(BaseModel):
+    job_id:str
+    status_url:str
+
+class DuplicateArticle(BaseModel):
+    article_id:str
+    duplicate:bool=True
@@ -0,0 +1,63 @@
+from datetime import date
+
+from pydantic import BaseModel, Field, field_validator
+
+from ingestion.fingerprint import normalize_article_id
+
+from typing import Dict, List, Literal, Optional, Union
+
+class DateRange(BaseModel):
+    # inclusive bounds, on the normalized publication date
+    gte:Optional[date]=None
+    lte:Optional[date]=None
+
+class ArticleConditions(BaseModel):
+    # every list matches when the article has any of its values
+    field:Optional[List[str]]=None
+    authors:Optional[List[str]]=None
+    year:Optional[List[int]]=None
+    published:Optional[DateRange]=None
+
+class ArticleFilter(BaseModel):
+    # shorthand for exact matches, combined with `must`
+    field:Optional[str]=None
+    authors:Optional[List[str]]=None
+    publication_date:Optional[str]=None
+    must:Optional[ArticleConditions]=None
+    should:Optional[ArticleConditions]=None
+    must_not:Optional[ArticleConditions]=None
+
+class RetrieveReq(BaseModel):
+    ids:List[str]=Field(min_length=1, max_length=256)
+    fields:Optional[List[str]]=None
+    with_vectors:bool=False
+
+    @field_validator('ids')
+    @classmethod
+    def check_ids(cls, ids:List[str]) -> List[str]:
+        return [normalize_article_id(article_id) for article_id in ids]
+
+class ScrollReq(BaseModel):
+    limit:int=Field(default=50, ge=1, le=500)
+    cursor:Optional[str]=None
+    fields:Optional[List[str]]=None
+    filter:Optional[ArticleFilter]=None
+
+class ScrollRes(BaseModel):
+    articles:List[dict]
+    next_cursor:Optional[str]=None
+
+FacetKey = Literal['field', 'authors', 'year']
+
+class FacetReq(BaseModel):
+    keys:List[FacetKey]=Field(default=['field', 'authors', 'year'], min_length=1)
+    limit:int=Field(default=20, ge=1, le=1000)
+    exact:bool=False
+    filter:Optional[ArticleFilter]=None
+
+class FacetValue(BaseModel):
+    value:Union[str, int]
+    count:int
+
+class FacetRes(BaseModel):
+    facets:Dict[str, List[FacetValue]]
@@ -1,7 +1,33 @@
-from pydantic import BaseModel
+from enum import Enum
+from pydantic import BaseModel, ConfigDict, Field
 
-from typing import List 
+from schemas.retrieval_schemas import ArticleFilter
+
+from typing import List, Optional
+
+class SearchMode(str, Enum):
+    FAST='fast'
+    ENRICHED='enriched'
+    SPECULATIVE='speculative'
+    # bm25 only, answered without any openai call
+    SPARSE='sparse'
+    # dense and bm25 candidates fused by qdrant, no enrichment
+    HYBRID='hybrid'
 
 class SemanticSearchReq(BaseModel):
     nb_neighbors:int=3
-    query:str
\ No newline at end of file
+    query:str
+    mode:SearchMode=SearchMode.ENRICHED
+    enrichment_deadline_ms:int=Field(default=800, ge=0)
+    # only ids and scores are returned, the payloads are not even read from qdrant
+    ids_only:bool=False
+    # pushed down to qdrant, the neighbours are searched among the matching articles only
+    filter:Optional[ArticleFilter]=None
+
+class PassageSearchReq(BaseModel):
+    # passages are only searched with the raw query embedding, a `mode` or a `filter` is refused rather than ignored
+    model_config = ConfigDict(extra='forbid')
+
+    nb_neighbors:int=3
+    query:str
+    ids_only:bool=False
@@ -0,0 +1,55 @@
+from datetime import datetime, time, timezone
+
+from qdrant_client import models
+
+from schemas.retrieval_schemas import ArticleConditions, ArticleFilter
+
+from typing import List, Optional, Union
+
+# the payload keys behind the filter and facet names
+FACET_KEYS = {'field': 'field', 'authors': 'authors', 'year': 'publication_year'}
+
+def _as_datetime(value) -> Optional[datetime]:
+    return datetime.combine(value, time.min, tzinfo=timezone.utc) if value is not None else None
+
+def _conditions(article_conditions:Optional[ArticleConditions]) -> List[models.FieldCondition]:
+    if article_conditions is None:
+        return []
+    conditions:List[models.FieldCondition] = []
+    if article_conditions.field:
+        conditions.append(models.FieldCondition(key='field', match=models.MatchAny(any=article_conditions.field)))
+    if article_conditions.authors:
+        conditions.append(models.FieldCondition(key='authors', match=models.MatchAny(any=article_conditions.authors)))
+    if article_conditions.year:
+        conditions.append(models.FieldCondition(key='publication_year', match=models.MatchAny(any=article_conditions.year)))
+    if article_conditions.published is not None:
+        conditions.append(models.FieldCondition(
+            key='published_at',
+            range=models.DatetimeRange(
+                gte=_as_datetime(article_conditions.published.gte),
+                lte=_as_datetime(article_conditions.published.lte),
+            )
+        ))
+    return conditions
+
+def build_filter(article_filter:Optional[ArticleFilter]) -> Optional[models.Filter]:
+    if article_filter is None:
+        return None
+    must = _conditions(article_filter.must)
+    if article_filter.field is not None:
+        must.append(models.FieldCondition(key='field', match=models.MatchValue(value=article_filter.field)))
+    if article_filter.authors:
+        must.append(models.FieldCondition(key='authors', match=models.MatchAny(any=article_filter.authors)))
+    if article_filter.publication_date is not None:
+        must.append(models.FieldCondition(key='publication_date', match=models.MatchValue(value=article_filter.publication_date)))
+    should = _conditions(article_filter.should)
+    must_not = _conditions(article_filter.must_not)
+    if not (must or should or must_not):
+        return None
+    return models.Filter(must=must or None, should=should or None, must_not=must_not or None)
+
+def payload_selector(fields:Optional[List[str]]) -> Union[bool, models.PayloadSelectorInclude]:
+    # only the requested payload keys leave qdrant, None keeps the whole payload
+    if fields is None:
+        return True
+    return models.PayloadSelectorInclude(include=fields)
@@ -0,0 +1,14 @@
+from qdrant_client import models
+
+from typing import Dict, List
+
+def reciprocal_rank_fusion(rankings:List[List[models.ScoredPoint]], limit:int, k:int=60) -> List[models.ScoredPoint]:
+    scores:Dict[str, float] = {}
+    points:Dict[str, models.ScoredPoint] = {}
+    for ranking in rankings:
+        for rank, point in enumerate(ranking):
+            point_id = str(point.id)
+            scores[point_id] = scores.get(point_id, 0.0) + 1.0 / (k + rank + 1)
+            points.setdefault(point_id, point)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [points[point_id] for point_id in ordered[:limit]]
@@ -0,0 +1,169 @@
+import re
+import time
+import sqlite3
+import asyncio
+
+import numpy as np
+
+from collections import OrderedDict
+
+from settings.cache_settings import SearchCacheSettings
+
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+class CacheEntry:
+    def __init__(self, params:Hashable, value:Any, expires_at:float, slot:Optional[int]):
+        self.params = params
+        self.value = value
+        self.expires_at = expires_at
+        self.slot = slot
+
+class SharedVersion:
+    # invalidation counter of the server workers, an upsert on one worker invalidates the cache of all of them
+    def __init__(self, path:str, name:str):
+        self.name = name
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=5.0, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS versions (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        self.connection.execute('INSERT OR IGNORE INTO versions (name, value) VALUES (?, 0)', (name,))
+
+    def get(self) -> int:
+        return self.connection.execute('SELECT value FROM versions WHERE name = ?', (self.name,)).fetchone()[0]
+
+    def bump(self) -> int:
+        with self.connection:
+            self.connection.execute('UPDATE versions SET value = value + 1 WHERE name = ?', (self.name,))
+            return self.get()
+
+    def close(self):
+        self.connection.close()
+
+class SearchCache:
+    def __init__(self, cache_settings:SearchCacheSettings):
+        self.cache_settings = cache_settings
+        self.entries:Dict[Tuple, CacheEntry] = OrderedDict()
+        self.inflight:Dict[Tuple, asyncio.Future] = {}
+        self.shared_version = SharedVersion(cache_settings.version_path, 'search_cache') if cache_settings.version_path else None
+        self.version = self.shared_version.get() if self.shared_version is not None else 0
+        self.version_checked_at = time.monotonic()
+        # unit-normalized query embeddings, one row per cached entry
+        self.matrix:Optional[np.ndarray] = None
+        self.slot_keys:List[Optional[Tuple]] = [None] * cache_settings.max_entries
+        self.free_slots:List[int] = list(range(cache_settings.max_entries - 1, -1, -1))
+        self.stats_ = {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0, 'coalesced': 0, 'invalidations': 0}
+
+    @staticmethod
+    def make_key(query:str, params:Hashable) -> Tuple:
+        return (re.sub(r'\s+', ' ', query).strip().lower(), params)
+
+    def __drop(self, key:Tuple):
+        entry = self.entries.pop(key, None)
+        if entry is not None and entry.slot is not None:
+            self.slot_keys[entry.slot] = None
+            self.free_slots.append(entry.slot)
+
+    def __sync(self):
+        # entries cached before another worker invalidated the cache are dropped
+        # the lookups run on the event loop, the shared file is only read once per interval
+        if self.shared_version is None or time.monotonic() - self.version_checked_at < self.cache_settings.version_check_interval:
+            return
+        self.version_checked_at = time.monotonic()
+        version = self.shared_version.get()
+        if version != self.version:
+            self.version = version
+            self.__clear()
+
+    def __clear(self):
+        for key in list(self.entries):
+            self.__drop(key)
+        # rebuilt by the next put, with the dimension of the embeddings cached from then on
+        self.matrix = None
+
+    def get(self, key:Tuple) -> Optional[Any]:
+        self.__sync()
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            self.__drop(key)
+            return None
+        self.entries.move_to_end(key)
+        self.stats_['exact_hits'] += 1
+        return entry.value
+
+    def get_similar(self, embedding:List[float], params:Hashable) -> Optional[Any]:
+        self.__sync()
+        if self.matrix is None or len(self.entries) == 0:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        similarities = self.matrix @ vector
+        for slot in np.argsort(similarities)[::-1]:
+            if similarities[slot] < self.cache_settings.similarity_threshold:
+                return None
+            key = self.slot_keys[slot]
+            if key is None or key[1] != params:
+                continue
+            value = self.get(key)
+            if value is not None:
+                self.stats_['exact_hits'] -= 1
+                self.stats_['semantic_hits'] += 1
+                return value
+        return None
+
+    def put(self, key:Tuple, value:Any, version:int, embedding:Optional[List[float]]=None):
+        self.__sync()
+        if version != self.version:
+            return
+        self.__drop(key)
+        slot = None
+        if embedding is not None and self.cache_settings.semantic_enabled:
+            vector = np.asarray(embedding, dtype=np.float32)
+            if self.matrix is None:
+                self.matrix = np.zeros((self.cache_settings.max_entries, len(vector)), dtype=np.float32)
+            if self.free_slots:
+                slot = self.free_slots.pop()
+                self.matrix[slot] = vector / (np.linalg.norm(vector) or 1.0)
+                self.slot_keys[slot] = key
+        self.entries[key] = CacheEntry(key[1], value, time.monotonic() + self.cache_settings.ttl, slot)
+        while len(self.entries) > self.cache_settings.max_entries:
+            self.__drop(next(iter(self.entries)))
+
+    async def get_or_compute(self, key:Tuple, compute:Callable[[], Awaitable[Any]], embedding:Optional[List[float]]=None) -> Any:
+        inflight = self.inflight.get(key)
+        if inflight is not None:
+            self.stats_['coalesced'] += 1
+            return await asyncio.shield(inflight)
+
+        self.stats_['misses'] += 1
+        self.__sync()
+        version = self.version
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            value = await compute()
+            future.set_result(value)
+            self.put(key, value, version, embedding)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # the exception is re-raised to every waiter, this avoids the "never retrieved" warning
+            future.exception()
+            raise
+        finally:
+            self.inflight.pop(key, None)
+
+    def invalidate(self):
+        self.version = self.shared_version.bump() if self.shared_version is not None else self.version + 1
+        self.__clear()
+        self.stats_['invalidations'] += 1
+
+    def close(self):
+        if self.shared_version is not None:
+            self.shared_version.close()
+
+    def stats(self) -> dict:
+        return {**self.stats_, 'entries': len(self.entries), 'version': self.version}
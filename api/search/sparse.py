@@ -0,0 +1,63 @@
+import re
+import zlib
+
+from collections import Counter
+
+from qdrant_client import models
+
+from typing import Dict, Iterator
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:[.\-/][a-z0-9]+)*')
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'have', 'in', 'is', 'it', 'its',
+    'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'were', 'which', 'with', 'we', 'our', 'their',
+))
+# terms of the short, precise fields weigh more than those of the summary
+FIELD_WEIGHTS:Dict[str, float] = {'title': 2.0, 'authors': 2.0, 'field': 1.0, 'summary': 1.0}
+
+def tokenize(text:str) -> Iterator[str]:
+    # compound terms (arxiv ids, "covid-19", "gpt-4") are kept whole and also split, so both spellings match
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        parts = re.split(r'[.\-/]', token)
+        if len(parts) > 1:
+            yield token
+        for part in parts:
+            if (len(part) > 1 or part.isdigit()) and part not in STOPWORDS:
+                yield part
+
+def term_index(token:str) -> int:
+    # feature hashing: no vocabulary to build or ship, qdrant sparse indices are u32
+    return zlib.crc32(token.encode())
+
+def _to_sparse_vector(weights:Dict[int, float]) -> models.SparseVector:
+    indices = sorted(weights)
+    return models.SparseVector(indices=indices, values=[weights[index] for index in indices])
+
+class SparseEncoder:
+    # bm25 term frequency part only, the idf is applied by qdrant from its own collection statistics (Modifier.IDF)
+    def __init__(self, k1:float=1.2, b:float=0.75, avg_length:float=256.0):
+        self.k1 = k1
+        self.b = b
+        self.avg_length = avg_length
+
+    def encode_document(self, payload:dict) -> models.SparseVector:
+        frequencies:Counter = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            value = payload.get(field)
+            if isinstance(value, list):
+                value = ' '.join(str(item) for item in value)
+            if value:
+                for token in tokenize(str(value)):
+                    frequencies[token] += weight
+        length = sum(frequencies.values())
+        norm = self.k1 * (1 - self.b + self.b * length / self.avg_length)
+        weights:Dict[int, float] = {}
+        for token, frequency in frequencies.items():
+            index = term_index(token)
+            # two terms hashed to the same index add up, as they would with a vocabulary too small
+            weights[index] = weights.get(index, 0.0) + frequency * (self.k1 + 1) / (frequency + norm)
+        return _to_sparse_vector(weights)
+
+    def encode_query(self, text:str) -> models.SparseVector:
+        return _to_sparse_vector({term_index(token): 1.0 for token in tokenize(text)})
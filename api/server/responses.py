@@ -0,0 +1,141 @@
+import zlib
+
+import msgpack
+import zstandard
+from fastapi import Request
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+MSGPACK_MEDIA_TYPE:str = 'application/msgpack'
+
+class MsgPackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content:Any) -> bytes:
+        return msgpack.packb(content, use_bin_type=True)
+
+class ResponseFactory:
+    # handlers build their responses here, so that the json backend and the negotiation stay in one place
+    def __init__(self):
+        self.json_response_class:Type[Response] = ORJSONResponse
+        self.msgpack_enabled = True
+
+    def configure(self, json_backend:str, msgpack_enabled:bool):
+        self.json_response_class = ORJSONResponse if json_backend == 'orjson' else JSONResponse
+        self.msgpack_enabled = msgpack_enabled
+
+    def wants_msgpack(self, request:Optional[Request]) -> bool:
+        if not self.msgpack_enabled or request is None:
+            return False
+        accept = request.headers.get('accept', '')
+        return any(part.split(';')[0].strip() in (MSGPACK_MEDIA_TYPE, 'application/x-msgpack') for part in accept.split(','))
+
+    def make(self, request:Optional[Request], content:Any, status_code:int=200) -> Response:
+        response_class = MsgPackResponse if self.wants_msgpack(request) else self.json_response_class
+        response = response_class(status_code=status_code, content=content)
+        if self.msgpack_enabled:
+            response.headers['vary'] = 'Accept'
+        return response
+
+response_factory = ResponseFactory()
+
+def _parse_accept_encoding(value:str) -> Dict[str, float]:
+    encodings:Dict[str, float] = {}
+    for part in value.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+class _Compressor:
+    def __init__(self, encoding:str, gzip_level:int, zstd_level:int):
+        if encoding == 'zstd':
+            self.compressor = zstandard.ZstdCompressor(level=zstd_level).compressobj()
+        else:
+            self.compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data:bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush()
+
+class CompressionMiddleware:
+    # pure asgi: bodies under min_size, already encoded or not compressible go through untouched
+    COMPRESSIBLE_TYPES:Tuple[str, ...] = ('application/json', 'application/x-ndjson', MSGPACK_MEDIA_TYPE, 'text/')
+
+    def __init__(self, app, algorithms:List[str], min_size:int=1024, gzip_level:int=6, zstd_level:int=3):
+        self.app = app
+        self.algorithms = algorithms
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.zstd_level = zstd_level
+
+    def __select_encoding(self, scope) -> Optional[str]:
+        headers = dict(scope.get('headers', []))
+        accepted = _parse_accept_encoding(headers.get(b'accept-encoding', b'').decode('latin-1'))
+        for algorithm in self.algorithms:
+            if accepted.get(algorithm, 0.0) > 0:
+                return algorithm
+        return None
+
+    def __is_compressible(self, headers:List[Tuple[bytes, bytes]]) -> bool:
+        content_type = ''
+        for name, value in headers:
+            if name.lower() == b'content-encoding':
+                return False
+            if name.lower() == b'content-type':
+                content_type = value.decode('latin-1')
+        return content_type.startswith(self.COMPRESSIBLE_TYPES)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.algorithms:
+            return await self.app(scope, receive, send)
+        encoding = self.__select_encoding(scope)
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start_message:Optional[dict] = None
+        compressor:Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message['type'] == 'http.response.start':
+                start_message = message
+                return
+            if message['type'] != 'http.response.body' or passthrough:
+                return await send(message)
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if compressor is None:
+                headers = list(start_message.get('headers', []))
+                # a complete small body is cheaper to send as is, a streamed one is always compressed
+                if not self.__is_compressible(headers) or (not more_body and len(body) < self.min_size):
+                    passthrough = True
+                    await send(start_message)
+                    return await send(message)
+                compressor = _Compressor(encoding, self.gzip_level, self.zstd_level)
+                headers = [(name, value) for name, value in headers if name.lower() != b'content-length']
+                headers.append((b'content-encoding', encoding.encode()))
+                headers.append((b'vary', b'Accept-Encoding'))
+                await send({**start_message, 'headers': headers})
+
+            data = compressor.compress(body)
+            if not more_body:
+                data += compressor.flush()
+            if data or not more_body:
+                await send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
+
+        await self.app(scope, receive, send_wrapper)
+        if start_message is not None and compressor is None and not passthrough:
+            # the application ended without any body message
+            await send(start_message)
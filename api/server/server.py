@@ -1,37 +1,68 @@
 import signal 
+import socket
 import asyncio
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, APIRouter
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
 import uvicorn
 import uvicorn.server
 
+from log_handler.log import logger
+
 from settings.server_settings import ServerSettings
 from schemas.main_entry_shemas import healthResponseModel 
 
-from typing import List
+from typing import Awaitable, Callable, List
 
 from mapper.mapper import Mapper
+from metrics.metrics import metrics, MetricsMiddleware
+from server.responses import CompressionMiddleware, response_factory
 
 class ApiServer:
     def __init__(self, server_settings:ServerSettings) -> None:
         self.host = server_settings.host
         self.port = server_settings.port
+        self.server_settings = server_settings
+        self.startup_callbacks:List[Callable[[], Awaitable[None]]] = []
+        self.shutdown_callbacks:List[Callable[[], Awaitable[None]]] = []
+        response_factory.configure(json_backend=server_settings.json_backend, msgpack_enabled=server_settings.msgpack_enabled)
 
         self.api = FastAPI(
             title="Article management API",
             lifespan=self.lifespan(),
             version="1.0.0",
-            description="This is the main entry point for our mini article management application"
+            description="This is the main entry point for our mini article management application",
+            default_response_class=ORJSONResponse if server_settings.json_backend == "orjson" else JSONResponse
+        )
+        self.api.add_middleware(
+            CompressionMiddleware,
+            algorithms=[algorithm.strip() for algorithm in server_settings.compression.split(',') if algorithm.strip()],
+            min_size=server_settings.compression_min_size,
+            gzip_level=server_settings.gzip_level,
+            zstd_level=server_settings.zstd_level
         )
+        self.api.add_middleware(MetricsMiddleware, server_timing=server_settings.server_timing)
         self.api.add_api_route("/health", self.health ,methods=["GET"])
+        self.api.add_api_route("/metrics", self.metrics, methods=["GET"], include_in_schema=False)
 
     def add_router(self, target_router:APIRouter):
         self.api.include_router(target_router)
+    
+    def add_lifespan_callbacks(self, on_startup:Callable[[], Awaitable[None]]=None, on_shutdown:Callable[[], Awaitable[None]]=None):
+        if on_startup is not None:
+            self.startup_callbacks.append(on_startup)
+        if on_shutdown is not None:
+            self.shutdown_callbacks.insert(0, on_shutdown)
         
     async def health(self):
         return healthResponseModel(status="good",host=self.host,port=self.port)
     
-    async def release_resources(self):
+    async def metrics(self):
+        return PlainTextResponse(content=metrics.render(), media_type="text/plain; version=0.0.4")
+    
+    async def cancel_blocked_tasks(self):
         all_tasks = asyncio.all_tasks()
         blocked_tasks:List[asyncio.Task] = []
         for task in all_tasks:
@@ -41,12 +72,18 @@ class ApiServer:
                 blocked_tasks.append(task)
 
         await asyncio.gather(*blocked_tasks, return_exceptions=True)
+    
+    async def release_resources(self):
+        # uvicorn stops accepting connections, lets in-flight requests finish, then runs the
+        # lifespan shutdown callbacks which drain the background work before it gets cancelled
+        logger.info('Shutdown requested, draining...')
         loop = asyncio.get_running_loop()
         loop.remove_signal_handler(sig=signal.SIGINT)
         self.server.should_exit = True 
     
     def lifespan(self):
-        def inner_lifespan(app:FastAPI):
+        @asynccontextmanager
+        async def inner_lifespan(app:FastAPI):
             loop = asyncio.get_running_loop()
             loop.add_signal_handler(
                 sig=signal.SIGTERM,
@@ -56,12 +93,34 @@ class ApiServer:
                 sig=signal.SIGINT,
                 callback=lambda: asyncio.create_task(self.release_resources())
             )
+            for callback in self.startup_callbacks:
+                await callback()
             yield 
+            for callback in self.shutdown_callbacks:
+                await callback()
             loop.remove_signal_handler(sig=signal.SIGTERM)
         
         return inner_lifespan
 
+    def make_shared_socket(self) -> socket.socket:
+        # every worker binds its own listening socket, the kernel balances the connections between them
+        sock = socket.socket(socket.AF_INET6 if ':' in self.host else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.host, self.port))
+        sock.set_inheritable(True)
+        return sock
+
     async def run(self):
-        self.config = uvicorn.Config(app=self.api, host=self.host, port=self.port)
+        self.config = uvicorn.Config(
+            app=self.api,
+            host=self.host,
+            port=self.port,
+            timeout_graceful_shutdown=self.server_settings.graceful_timeout
+        )
         self.server = uvicorn.Server(config=self.config)
-        await self.server.serve()
\ No newline at end of file
+        sockets = [self.make_shared_socket()] if self.server_settings.workers > 1 else None
+        try:
+            await self.server.serve(sockets=sockets)
+        finally:
+            await self.cancel_blocked_tasks()
\ No newline at end of file
@@ -0,0 +1,103 @@
+import os
+import time
+import signal
+
+from multiprocessing import Process
+from multiprocessing.connection import wait
+
+from log_handler.log import logger
+
+from typing import Callable, Dict, List, Optional
+
+def run_worker(target:Callable, args:List):
+    # forked workers must not inherit the supervisor handlers, their event loop installs its own
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    target(*args)
+
+class Supervisor:
+    MIN_RESTART_DELAY:float = 1.0
+    MAX_RESTART_DELAY:float = 30.0
+
+    def __init__(self, target:Callable, args:List, nb_workers:int, shutdown_timeout:float, on_exit:Optional[Callable[[int], None]]=None):
+        self.target = target
+        # called with the pid of every worker that exited, crashed or stopped
+        self.on_exit = on_exit
+        self.args = args
+        self.nb_workers = nb_workers
+        self.shutdown_timeout = shutdown_timeout
+        self.workers:Dict[int, Process] = {}
+        self.restart_delays:Dict[int, float] = {}
+        self.restart_at:Dict[int, float] = {}
+        self.started_at:Dict[int, float] = {}
+        self.stopping = False
+
+    def __spawn(self, worker_id:int):
+        process = Process(target=run_worker, args=[self.target, self.args], name=f'api-worker-{worker_id}')
+        process.start()
+        self.workers[worker_id] = process
+        self.started_at[worker_id] = time.monotonic()
+        logger.info(f'Worker {worker_id} started (pid {process.pid})')
+
+    def __on_signal(self, signum, frame):
+        if not self.stopping:
+            logger.info(f'Supervisor received {signal.Signals(signum).name}, stopping {len(self.workers)} workers...')
+        self.stopping = True
+
+    def __exited(self, process:Process):
+        if self.on_exit is None:
+            return
+        try:
+            self.on_exit(process.pid)
+        except Exception as e:
+            logger.error(f'Error while cleaning up after worker pid {process.pid}: {str(e)}')
+
+    def __schedule_restart(self, worker_id:int, exitcode:Optional[int]):
+        # a worker that crashes right after its start is restarted with an increasing delay
+        lifetime = time.monotonic() - self.started_at[worker_id]
+        previous_delay = self.restart_delays.get(worker_id, 0.0)
+        delay = self.MIN_RESTART_DELAY if lifetime > self.MAX_RESTART_DELAY else min(max(previous_delay * 2, self.MIN_RESTART_DELAY), self.MAX_RESTART_DELAY)
+        self.restart_delays[worker_id] = delay
+        self.restart_at[worker_id] = time.monotonic() + delay
+        logger.warning(f'Worker {worker_id} exited with code {exitcode}, restarting in {delay:.0f}s')
+
+    def __stop_workers(self):
+        for process in self.workers.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.shutdown_timeout
+        for worker_id, process in self.workers.items():
+            process.join(timeout=max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.warning(f'Worker {worker_id} did not stop in {self.shutdown_timeout}s, killing it')
+                process.kill()
+                process.join()
+            self.__exited(process)
+        logger.info('All workers stopped')
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.__on_signal)
+        signal.signal(signal.SIGINT, self.__on_signal)
+        for worker_id in range(self.nb_workers):
+            self.__spawn(worker_id)
+
+        while not self.stopping:
+            alive = {process.sentinel: worker_id for worker_id, process in self.workers.items() if worker_id not in self.restart_at}
+            if alive:
+                wait(list(alive.keys()), timeout=0.5)
+            else:
+                time.sleep(0.5)
+            if self.stopping:
+                break
+            for worker_id, process in self.workers.items():
+                if worker_id not in self.restart_at and not process.is_alive():
+                    process.join()
+                    self.__exited(process)
+                    self.__schedule_restart(worker_id, process.exitcode)
+            for worker_id, restart_at in list(self.restart_at.items()):
+                if time.monotonic() >= restart_at:
+                    del self.restart_at[worker_id]
+                    self.__spawn(worker_id)
+
+        self.__stop_workers()
@@ -0,0 +1,22 @@
+
+from pydantic_settings import BaseSettings
+from pydantic import Field
+
+from typing import Optional
+
+class EmbeddingCacheSettings(BaseSettings):
+    memory_enabled:bool=Field(default=True, validation_alias="EMBEDDING_CACHE_MEMORY_ENABLED")
+    memory_max_entries:int=Field(default=10_000, validation_alias="EMBEDDING_CACHE_MEMORY_MAX_ENTRIES")
+    disk_enabled:bool=Field(default=True, validation_alias="EMBEDDING_CACHE_DISK_ENABLED")
+    disk_path:str=Field(default="embedding_cache.sqlite3", validation_alias="EMBEDDING_CACHE_DISK_PATH")
+
+class SearchCacheSettings(BaseSettings):
+    enabled:bool=Field(default=True, validation_alias="SEARCH_CACHE_ENABLED")
+    max_entries:int=Field(default=1024, validation_alias="SEARCH_CACHE_MAX_ENTRIES")
+    ttl:float=Field(default=300.0, validation_alias="SEARCH_CACHE_TTL")
+    semantic_enabled:bool=Field(default=True, validation_alias="SEARCH_CACHE_SEMANTIC_ENABLED")
+    similarity_threshold:float=Field(default=0.97, validation_alias="SEARCH_CACHE_SIMILARITY_THRESHOLD")
+    # sqlite file holding the invalidation counter, shared by the server workers; none keeps it in memory
+    version_path:Optional[str]=Field(default=None, validation_alias="SEARCH_CACHE_VERSION_PATH")
+    # seconds between two reads of the shared counter, the invalidations of the other workers are seen that late at most
+    version_check_interval:float=Field(default=0.25, validation_alias="SEARCH_CACHE_VERSION_CHECK_INTERVAL")
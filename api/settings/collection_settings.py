@@ -0,0 +1,33 @@
+
+from pydantic_settings import BaseSettings
+from pydantic import Field
+
+from typing import Literal, Optional
+
+class CollectionSettings(BaseSettings):
+    name:str=Field(default="articles_", validation_alias="COLLECTION_NAME")
+    prefix_size:Optional[int]=Field(default=None, validation_alias="COLLECTION_PREFIX_SIZE")
+    prefix_oversampling:int=Field(default=4, validation_alias="COLLECTION_PREFIX_OVERSAMPLING")
+    hnsw_m:int=Field(default=16, validation_alias="COLLECTION_HNSW_M")
+    hnsw_ef_construct:int=Field(default=100, validation_alias="COLLECTION_HNSW_EF_CONSTRUCT")
+    hnsw_ef:Optional[int]=Field(default=None, validation_alias="COLLECTION_HNSW_EF")
+    quantization:Literal["none", "int8", "binary"]=Field(default="none", validation_alias="COLLECTION_QUANTIZATION")
+    quantization_always_ram:bool=Field(default=True, validation_alias="COLLECTION_QUANTIZATION_ALWAYS_RAM")
+    quantization_rescore:bool=Field(default=True, validation_alias="COLLECTION_QUANTIZATION_RESCORE")
+    quantization_oversampling:float=Field(default=2.0, validation_alias="COLLECTION_QUANTIZATION_OVERSAMPLING")
+    on_disk_vectors:bool=Field(default=False, validation_alias="COLLECTION_ON_DISK_VECTORS")
+    on_disk_payload:bool=Field(default=False, validation_alias="COLLECTION_ON_DISK_PAYLOAD")
+    update_existing:bool=Field(default=False, validation_alias="COLLECTION_UPDATE_EXISTING")
+    sparse_vectors:bool=Field(default=True, validation_alias="COLLECTION_SPARSE_VECTORS")
+    sparse_on_disk:bool=Field(default=False, validation_alias="COLLECTION_SPARSE_ON_DISK")
+    bm25_k1:float=Field(default=1.2, validation_alias="COLLECTION_BM25_K1")
+    bm25_b:float=Field(default=0.75, validation_alias="COLLECTION_BM25_B")
+    bm25_avg_length:float=Field(default=256.0, validation_alias="COLLECTION_BM25_AVG_LENGTH")
+    hybrid_oversampling:int=Field(default=4, validation_alias="COLLECTION_HYBRID_OVERSAMPLING")
+    tenancy:Literal["none", "payload", "shard_key"]=Field(default="none", validation_alias="COLLECTION_TENANCY")
+    default_tenant:str=Field(default="default", validation_alias="COLLECTION_DEFAULT_TENANT")
+    shard_number:Optional[int]=Field(default=None, validation_alias="COLLECTION_SHARD_NUMBER")
+    replication_factor:Optional[int]=Field(default=None, validation_alias="COLLECTION_REPLICATION_FACTOR")
+    write_consistency_factor:Optional[int]=Field(default=None, validation_alias="COLLECTION_WRITE_CONSISTENCY_FACTOR")
+    # seconds between two checks of the collection served under the name, a reindex may swap it while the server runs
+    config_refresh_interval:float=Field(default=10.0, validation_alias="COLLECTION_CONFIG_REFRESH_INTERVAL")
@@ -0,0 +1,20 @@
+
+from pydantic_settings import BaseSettings
+from pydantic import Field
+
+from typing import Optional
+
+class IngestionSettings(BaseSettings):
+    nb_workers:int=Field(default=4, validation_alias="INGESTION_WORKERS")
+    queue_address:str=Field(default="inproc://ingestion-jobs", validation_alias="INGESTION_QUEUE_ADDRESS")
+    queue_size:int=Field(default=64, validation_alias="INGESTION_QUEUE_SIZE")
+    drain_timeout:float=Field(default=60.0, validation_alias="INGESTION_DRAIN_TIMEOUT")
+    jobs_history:int=Field(default=1000, validation_alias="INGESTION_JOBS_HISTORY")
+    # sqlite file holding the job statuses, shared by the server workers; none keeps them in memory
+    jobs_path:Optional[str]=Field(default=None, validation_alias="INGESTION_JOBS_PATH")
+    batch_concurrency:int=Field(default=8, validation_alias="INGESTION_BATCH_CONCURRENCY")
+    upsert_batch_size:int=Field(default=64, validation_alias="INGESTION_UPSERT_BATCH_SIZE")
+    dedup_by_text:bool=Field(default=True, validation_alias="INGESTION_DEDUP_BY_TEXT")
+    summary_chunk_tokens:int=Field(default=12_000, validation_alias="INGESTION_SUMMARY_CHUNK_TOKENS")
+    summary_concurrency:int=Field(default=4, validation_alias="INGESTION_SUMMARY_CONCURRENCY")
+    passage_vectors:bool=Field(default=False, validation_alias="INGESTION_PASSAGE_VECTORS")
@@ -0,0 +1,18 @@
+from pydantic_settings import BaseSettings
+from pydantic import Field
+
+from typing import Literal, Optional
+
+class LogSettings(BaseSettings):
+    level:str=Field(default="DEBUG", validation_alias="LOG_LEVEL")
+    # comma separated logger=LEVEL pairs, ex: uvicorn.access=WARNING,httpx=INFO
+    levels:str=Field(default="", validation_alias="LOG_LEVELS")
+    console_format:Literal["color", "json"]=Field(default="color", validation_alias="LOG_CONSOLE_FORMAT")
+    file_path:Optional[str]=Field(default="log_handler/app.log", validation_alias="LOG_FILE")
+    file_format:Literal["text", "json"]=Field(default="json", validation_alias="LOG_FILE_FORMAT")
+    rotation:Literal["size", "time"]=Field(default="size", validation_alias="LOG_ROTATION")
+    max_bytes:int=Field(default=10 * 1024 * 1024, validation_alias="LOG_MAX_BYTES")
+    rotation_when:str=Field(default="midnight", validation_alias="LOG_ROTATION_WHEN")
+    backup_count:int=Field(default=5, validation_alias="LOG_BACKUP_COUNT")
+    debug_sample_rate:float=Field(default=1.0, validation_alias="LOG_DEBUG_SAMPLE_RATE")
+    debug_rate_limit:float=Field(default=0.0, validation_alias="LOG_DEBUG_RATE_LIMIT")
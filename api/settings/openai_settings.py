@@ -4,4 +4,22 @@ from pydantic_settings import BaseSettings
 from pydantic import Field 
 
 class OpenAiSettings(BaseSettings):
-    api_key:str=Field(validation_alias="OPENAI_API_KEY")
\ No newline at end of file
+    api_key:str=Field(validation_alias="OPENAI_API_KEY")
+    embedding_model:str=Field(default="text-embedding-3-small", validation_alias="OPENAI_EMBEDDING_MODEL")
+    embedding_dimensions:int=Field(default=1024, validation_alias="OPENAI_EMBEDDING_DIMENSIONS")
+    embedding_batch_size:int=Field(default=256, validation_alias="OPENAI_EMBEDDING_BATCH_SIZE")
+    embedding_batch_tokens:int=Field(default=100_000, validation_alias="OPENAI_EMBEDDING_BATCH_TOKENS")
+    requests_per_minute:int=Field(default=500, validation_alias="OPENAI_REQUESTS_PER_MINUTE")
+    tokens_per_minute:int=Field(default=200_000, validation_alias="OPENAI_TOKENS_PER_MINUTE")
+    max_concurrency:int=Field(default=16, validation_alias="OPENAI_MAX_CONCURRENCY")
+    max_retries:int=Field(default=6, validation_alias="OPENAI_MAX_RETRIES")
+    backoff_base:float=Field(default=0.5, validation_alias="OPENAI_BACKOFF_BASE")
+    backoff_max:float=Field(default=30.0, validation_alias="OPENAI_BACKOFF_MAX")
+    interactive_reserve:float=Field(default=0.2, validation_alias="OPENAI_INTERACTIVE_RESERVE")
+    timeout:float=Field(default=60.0, validation_alias="OPENAI_TIMEOUT")
+    connect_timeout:float=Field(default=5.0, validation_alias="OPENAI_CONNECT_TIMEOUT")
+    max_connections:int=Field(default=100, validation_alias="OPENAI_MAX_CONNECTIONS")
+    max_keepalive_connections:int=Field(default=20, validation_alias="OPENAI_MAX_KEEPALIVE_CONNECTIONS")
+    keepalive_expiry:float=Field(default=30.0, validation_alias="OPENAI_KEEPALIVE_EXPIRY")
+    http2:bool=Field(default=False, validation_alias="OPENAI_HTTP2")
+    warmup_connections:int=Field(default=2, validation_alias="OPENAI_WARMUP_CONNECTIONS")
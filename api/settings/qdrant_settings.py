@@ -1,7 +1,13 @@
-
 from pydantic_settings import BaseSettings
 from pydantic import Field, BaseModel 
     
 class QdrantSettings(BaseSettings):
     host:str=Field(validation_alias="QDRANT_HOST")
-    port:int=Field(validation_alias="QDRANT_PORT")
\ No newline at end of file
+    port:int=Field(validation_alias="QDRANT_PORT")
+    grpc_port:int=Field(default=6334, validation_alias="QDRANT_GRPC_PORT")
+    prefer_grpc:bool=Field(default=False, validation_alias="QDRANT_PREFER_GRPC")
+    timeout:int=Field(default=10, validation_alias="QDRANT_TIMEOUT")
+    max_connections:int=Field(default=64, validation_alias="QDRANT_MAX_CONNECTIONS")
+    max_keepalive_connections:int=Field(default=32, validation_alias="QDRANT_MAX_KEEPALIVE_CONNECTIONS")
+    keepalive_expiry:float=Field(default=30.0, validation_alias="QDRANT_KEEPALIVE_EXPIRY")
+    warmup_connections:int=Field(default=4, validation_alias="QDRANT_WARMUP_CONNECTIONS")
@@ -0,0 +1,10 @@
+from pydantic_settings import BaseSettings
+from pydantic import Field
+
+class ReindexSettings(BaseSettings):
+    page_size:int=Field(default=512, validation_alias="REINDEX_PAGE_SIZE")
+    tokens_per_minute:int=Field(default=100_000, validation_alias="REINDEX_TOKENS_PER_MINUTE")
+    checkpoint_path:str=Field(default="reindex_checkpoint.json", validation_alias="REINDEX_CHECKPOINT_PATH")
+    validation_samples:int=Field(default=32, validation_alias="REINDEX_VALIDATION_SAMPLES")
+    min_recall:float=Field(default=0.9, validation_alias="REINDEX_MIN_RECALL")
+    green_timeout:float=Field(default=600.0, validation_alias="REINDEX_GREEN_TIMEOUT")
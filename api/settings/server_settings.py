@@ -2,7 +2,29 @@ from pydantic_settings import BaseSettings
 
 from pydantic import Field
 
+from typing import Literal, Optional
+
 class ServerSettings(BaseSettings):
     host: str = Field(validation_alias="HOST")
     port: int = Field(validation_alias="PORT")
-    
\ No newline at end of file
+    server_timing: bool = Field(default=False, validation_alias="SERVER_TIMING")
+    workers: int = Field(default=1, validation_alias="WORKERS")
+    # job statuses and search cache invalidations are shared there when workers > 1
+    state_path: str = Field(default="server_state.sqlite3", validation_alias="SERVER_STATE_PATH")
+    graceful_timeout: float = Field(default=30.0, validation_alias="GRACEFUL_TIMEOUT")
+    json_backend: Literal["orjson", "json"] = Field(default="orjson", validation_alias="SERVER_JSON_BACKEND")
+    msgpack_enabled: bool = Field(default=True, validation_alias="SERVER_MSGPACK")
+    # comma separated, in order of preference, empty disables the compression
+    compression: str = Field(default="zstd,gzip", validation_alias="SERVER_COMPRESSION")
+    compression_min_size: int = Field(default=1024, validation_alias="SERVER_COMPRESSION_MIN_SIZE")
+    gzip_level: int = Field(default=6, validation_alias="SERVER_GZIP_LEVEL")
+    zstd_level: int = Field(default=3, validation_alias="SERVER_ZSTD_LEVEL")
+
+class ExtractorSettings(BaseSettings):
+    pool_size: int = Field(default=2, validation_alias="EXTRACTOR_POOL_SIZE")
+    pages_per_task: int = Field(default=16, validation_alias="EXTRACTOR_PAGES_PER_TASK")
+    max_pages: int = Field(default=500, validation_alias="EXTRACTOR_MAX_PAGES")
+    timeout: float = Field(default=60.0, validation_alias="EXTRACTOR_TIMEOUT")
+    # total time a document may wait on its page ranges, each range is also bounded by `timeout`
+    document_timeout: float = Field(default=300.0, validation_alias="EXTRACTOR_DOCUMENT_TIMEOUT")
+    tmp_dir: Optional[str] = Field(default=None, validation_alias="EXTRACTOR_TMP_DIR")
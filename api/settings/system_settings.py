@@ -16,5 +16,15 @@ article_summarizer_prompt = f"""
     DO NOT ADD EXTRA INFORMATIONS
 """
 
+chunk_summarizer_prompt = """
+    you are an expert in summarizing articles. 
+    you will receive one section of a longer article, summarize it in a few sentences.
+    keep the title, field, authors and publication date if they appear in the section.
+    the response must be in ENGLISH and must be plain text.
+    DO NOT ADD EXTRA INFORMATIONS
+"""
+
+partial_summaries_header = 'the next texts are the summaries of the consecutive sections of one article:'
+
 if __name__ == '__main__':
     print(article_summarizer_prompt)
\ No newline at end of file
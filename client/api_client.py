@@ -0,0 +1,58 @@
+import os
+import random
+import asyncio
+import threading
+import concurrent.futures
+
+import httpx
+
+from typing import Any, Coroutine, Optional
+
+API_URL = os.getenv('API_URL', 'http://fastapi:8100/v1/article')
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def make_client(max_connections: int = 16, timeout: float = 120.0) -> httpx.AsyncClient:
+    # one pool per process: connections to the api and to arxiv are kept alive between requests
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        timeout=httpx.Timeout(timeout, connect=10.0),
+        headers={'accept': 'application/json'},
+        follow_redirects=True,
+    )
+
+def retry_delay(attempt: int, response: Optional[httpx.Response] = None, base_delay: float = 1.0, max_delay: float = 30.0) -> float:
+    if response is not None and 'retry-after' in response.headers:
+        try:
+            return min(float(response.headers['retry-after']), max_delay)
+        except ValueError:
+            pass
+    # full jitter, so that the workers throttled together do not retry together
+    return random.uniform(0, min(base_delay * 2 ** attempt, max_delay))
+
+async def request_with_retries(client: httpx.AsyncClient, method: str, url: str, attempts: int = 5, **kwargs) -> httpx.Response:
+    for attempt in range(attempts):
+        last_attempt = attempt == attempts - 1
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            if last_attempt:
+                raise
+            await asyncio.sleep(retry_delay(attempt))
+            continue
+        if response.status_code not in RETRY_STATUSES or last_attempt:
+            return response
+        await asyncio.sleep(retry_delay(attempt, response))
+
+class BackgroundLoop:
+    # an event loop kept running in its own thread, for callers that are not coroutines themselves
+    def __init__(self, max_connections: int = 16):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='api-client-loop', daemon=True)
+        self.thread.start()
+        self.client = make_client(max_connections=max_connections)
+
+    def submit(self, coroutine: Coroutine) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine: Coroutine, timeout: Optional[float] = None) -> Any:
+        return self.submit(coroutine).result(timeout)
@@ -0,0 +1,286 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+
+import arxiv
+import httpx
+
+from api_client import API_URL, make_client, request_with_retries
+
+from typing import Iterator, List, Optional, Set, Tuple
+
+# python ingest.py --arxiv "quantum error correction" --max-results 200 --dir ./papers
+
+class Document:
+    def __init__(self, key: str, filename: str, url: Optional[str] = None, path: Optional[str] = None):
+        # `key` identifies the document in the manifest: the arxiv id, or the sha256 of a local file
+        self.key = key
+        self.filename = filename
+        self.url = url
+        self.path = path
+        self.content: Optional[bytes] = None
+
+class Manifest:
+    # one json line per ingested document, appended as they complete so that an interrupted run resumes where it stopped
+    def __init__(self, path: str, tenant: Optional[str] = None):
+        self.path = path
+        # the api keeps one copy of a document per tenant, only the lines of the same tenant are skipped
+        self.tenant = tenant
+        self.keys: Set[str] = set()
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                        if entry.get('tenant') == tenant:
+                            self.keys.add(entry['key'])
+                    except (ValueError, KeyError, AttributeError):
+                        continue
+        self.file = open(path, 'a')
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+    def add(self, key: str, article_id: Optional[str], filename: str):
+        self.keys.add(key)
+        self.file.write(json.dumps({'key': key, 'tenant': self.tenant, 'article_id': article_id, 'filename': filename, 'at': time.time()}) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class Stats:
+    def __init__(self):
+        self.start = time.monotonic()
+        self.discovered = 0
+        self.skipped = 0
+        self.downloaded = 0
+        self.nb_bytes = 0
+        self.ingested = 0
+        self.duplicates = 0
+        self.failed = 0
+
+    def report(self) -> str:
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        return (
+            f'{self.discovered} found, {self.skipped} skipped, {self.downloaded} downloaded ({self.nb_bytes / 1e6:.1f} MB), '
+            f'{self.ingested} ingested ({self.duplicates} duplicates), {self.failed} failed in {elapsed:.1f}s: '
+            f'{self.ingested / elapsed:.2f} docs/s, {self.nb_bytes / 1e6 / elapsed:.2f} MB/s downloaded'
+        )
+
+def arxiv_results(query: str, max_results: int) -> Iterator[arxiv.Result]:
+    client = arxiv.Client(page_size=min(max_results, 100), delay_seconds=3, num_retries=3)
+    return client.results(arxiv.Search(query=query, max_results=max_results, sort_by=arxiv.SortCriterion.Relevance))
+
+def local_pdfs(directory: str) -> Iterator[str]:
+    for root, _, filenames in sorted(os.walk(directory)):
+        for filename in sorted(filenames):
+            if filename.lower().endswith('.pdf'):
+                yield os.path.join(root, filename)
+
+def read_file(path: str) -> bytes:
+    with open(path, 'rb') as file:
+        return file.read()
+
+async def produce(args: argparse.Namespace, manifest: Manifest, stats: Stats, download_queue: asyncio.Queue):
+    seen: Set[str] = set()
+    for query in args.arxiv:
+        results = arxiv_results(query, args.max_results)
+        while True:
+            # the arxiv client blocks and sleeps between pages, it is iterated in a thread
+            result = await asyncio.to_thread(next, results, None)
+            if result is None:
+                break
+            short_id = result.get_short_id()
+            key = f'arxiv:{short_id}'
+            stats.discovered += 1
+            if (key in manifest and not args.force) or key in seen:
+                stats.skipped += 1
+                continue
+            seen.add(key)
+            await download_queue.put(Document(key, short_id.replace('/', '_') + '.pdf', url=result.pdf_url))
+    for directory in args.dir:
+        for path in local_pdfs(directory):
+            stats.discovered += 1
+            # local files are keyed by their content, which is only known once read
+            await download_queue.put(Document(path, os.path.basename(path), path=path))
+
+async def download(client: httpx.AsyncClient, args: argparse.Namespace, manifest: Manifest, stats: Stats, download_queue: asyncio.Queue, upload_queue: asyncio.Queue):
+    while (document := await download_queue.get()) is not None:
+        try:
+            if document.url is not None:
+                response = await request_with_retries(client, 'GET', document.url, attempts=args.retries)
+                response.raise_for_status()
+                document.content = response.content
+            else:
+                document.content = await asyncio.to_thread(read_file, document.path)
+                document.key = f'sha256:{hashlib.sha256(document.content).hexdigest()}'
+                if document.key in manifest and not args.force:
+                    stats.skipped += 1
+                    continue
+        except Exception as e:
+            stats.failed += 1
+            print(f'Unable to get {document.filename}: {str(e)}', file=sys.stderr)
+            continue
+        stats.downloaded += 1
+        stats.nb_bytes += len(document.content)
+        await upload_queue.put(document)
+
+async def next_batch(upload_queue: asyncio.Queue, batch_size: int) -> Tuple[List[Document], bool]:
+    # waits for one document only, the batch takes whatever else is already downloaded
+    document = await upload_queue.get()
+    if document is None:
+        return [], True
+    batch = [document]
+    while len(batch) < batch_size:
+        try:
+            document = upload_queue.get_nowait()
+        except asyncio.QueueEmpty:
+            break
+        if document is None:
+            return batch, True
+        batch.append(document)
+    return batch, False
+
+def record(manifest: Manifest, stats: Stats, document: Document, article_id: Optional[str], duplicate: bool):
+    manifest.add(document.key, article_id, document.filename)
+    stats.ingested += 1
+    stats.duplicates += duplicate
+
+async def upload_batches(client: httpx.AsyncClient, args: argparse.Namespace, manifest: Manifest, stats: Stats, upload_queue: asyncio.Queue):
+    done = False
+    while not done:
+        batch, done = await next_batch(upload_queue, args.batch_size)
+        if not batch:
+            continue
+        files = [('files', (document.filename, document.content, 'application/pdf')) for document in batch]
+        try:
+            response = await request_with_retries(
+                client, 'POST', f'{args.api_url}/add-batch',
+                attempts=args.retries, files=files, params={'force': args.force}, headers=args.headers
+            )
+            response.raise_for_status()
+        except Exception as e:
+            stats.failed += len(batch)
+            print(f'Batch of {len(batch)} documents failed: {str(e)}', file=sys.stderr)
+            continue
+        for document, item in zip(batch, response.json()['items']):
+            if item['success']:
+                record(manifest, stats, document, item['article_id'], item['duplicate'])
+            else:
+                stats.failed += 1
+                print(f"Unable to ingest {document.filename}: {item['error']}", file=sys.stderr)
+            document.content = None
+
+async def wait_for_job(client: httpx.AsyncClient, args: argparse.Namespace, status_url: str) -> dict:
+    while True:
+        response = await request_with_retries(client, 'GET', status_url, attempts=args.retries, headers=args.headers)
+        response.raise_for_status()
+        job = response.json()
+        if job['stage'] in ('done', 'failed'):
+            return job
+        await asyncio.sleep(args.poll_interval)
+
+async def upload_jobs(client: httpx.AsyncClient, args: argparse.Namespace, manifest: Manifest, stats: Stats, upload_queue: asyncio.Queue):
+    # each worker holds one job until it is over, the number of jobs queued on the server stays bounded
+    while (document := await upload_queue.get()) is not None:
+        try:
+            response = await request_with_retries(
+                client, 'POST', f'{args.api_url}/add',
+                attempts=args.retries, files={'file': (document.filename, document.content, 'application/pdf')},
+                params={'force': args.force}, headers=args.headers
+            )
+            response.raise_for_status()
+            document.content = None
+            accepted = response.json()
+            if response.status_code == 200:
+                record(manifest, stats, document, accepted['article_id'], True)
+                continue
+            job = await wait_for_job(client, args, str(httpx.URL(args.api_url).join(accepted['status_url'])))
+        except Exception as e:
+            stats.failed += 1
+            print(f'Unable to ingest {document.filename}: {str(e)}', file=sys.stderr)
+            continue
+        if job['stage'] == 'done':
+            record(manifest, stats, document, job['article_id'], job['duplicate'])
+        else:
+            stats.failed += 1
+            print(f"Unable to ingest {document.filename}: {job['error']}", file=sys.stderr)
+
+async def pick_endpoint(client: httpx.AsyncClient, args: argparse.Namespace) -> str:
+    if args.endpoint != 'auto':
+        return args.endpoint
+    api_url = httpx.URL(args.api_url)
+    try:
+        response = await client.get(str(api_url.join('/openapi.json')))
+        response.raise_for_status()
+        paths = response.json()['paths']
+    except Exception as e:
+        print(f'Unable to read the api schema, uploading one file at a time: {str(e)}', file=sys.stderr)
+        return 'async'
+    return 'batch' if f"{api_url.path.rstrip('/')}/add-batch" in paths else 'async'
+
+async def report_progress(stats: Stats, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        print(stats.report(), flush=True)
+
+async def run(args: argparse.Namespace) -> Stats:
+    manifest = Manifest(args.manifest, args.tenant)
+    stats = Stats()
+    # bounded queues between the stages: downloads stop when the uploads fall behind
+    download_queue: asyncio.Queue = asyncio.Queue(maxsize=args.download_concurrency * 2)
+    upload_queue: asyncio.Queue = asyncio.Queue(maxsize=args.upload_concurrency * args.batch_size * 2)
+    async with make_client(max_connections=args.download_concurrency + args.upload_concurrency + 1) as client:
+        endpoint = await pick_endpoint(client, args)
+        upload = upload_batches if endpoint == 'batch' else upload_jobs
+        print(f'Uploading to {args.api_url} through the {endpoint} endpoint', flush=True)
+        downloaders = [asyncio.create_task(download(client, args, manifest, stats, download_queue, upload_queue)) for _ in range(args.download_concurrency)]
+        uploaders = [asyncio.create_task(upload(client, args, manifest, stats, upload_queue)) for _ in range(args.upload_concurrency)]
+        reporter = asyncio.create_task(report_progress(stats, args.report_every))
+        try:
+            await produce(args, manifest, stats, download_queue)
+            for _ in downloaders:
+                await download_queue.put(None)
+            await asyncio.gather(*downloaders)
+            for _ in uploaders:
+                await upload_queue.put(None)
+            await asyncio.gather(*uploaders)
+        finally:
+            for task in [*downloaders, *uploaders, reporter]:
+                task.cancel()
+            await asyncio.gather(*downloaders, *uploaders, reporter, return_exceptions=True)
+            manifest.close()
+    return stats
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Bulk ingest arxiv articles or local pdf files into the article api')
+    parser.add_argument('--arxiv', action='append', default=[], metavar='QUERY', help='arxiv search query, can be repeated')
+    parser.add_argument('--max-results', type=int, default=50, help='articles fetched per arxiv query')
+    parser.add_argument('--dir', action='append', default=[], metavar='PATH', help='directory searched for pdf files, can be repeated')
+    parser.add_argument('--api-url', default=API_URL)
+    parser.add_argument('--tenant', default=None, help='sent as the X-Tenant header')
+    parser.add_argument('--endpoint', choices=['auto', 'batch', 'async'], default='auto', help='`/add-batch`, or `/add` and its job status')
+    parser.add_argument('--download-concurrency', type=int, default=4)
+    parser.add_argument('--upload-concurrency', type=int, default=2)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--retries', type=int, default=5, help='attempts per request, with exponential backoff')
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--manifest', default='ingest_manifest.jsonl', help='documents already ingested, skipped on the next runs')
+    parser.add_argument('--force', action='store_true', help='ingest again the documents the api already has')
+    parser.add_argument('--report-every', type=float, default=10.0, help='seconds between two progress lines')
+    args = parser.parse_args()
+    if not args.arxiv and not args.dir:
+        parser.error('nothing to ingest, give at least one --arxiv query or --dir')
+    args.api_url = args.api_url.rstrip('/')
+    args.headers = {'X-Tenant': args.tenant} if args.tenant else {}
+    return args
+
+if __name__ == '__main__':
+    stats = asyncio.run(run(parse_args()))
+    print(stats.report())
+    sys.exit(1 if stats.failed else 0)
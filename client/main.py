@@ -1,28 +1,94 @@
 import os
+import time
+import hashlib
+import asyncio
+import concurrent.futures
+
 import streamlit as st
 import arxiv
 import httpx
-import asyncio
-from io import BytesIO
 
-API_URL = 'http://fastapi:8100/v1/article'
+from api_client import API_URL, BackgroundLoop, request_with_retries
+
+from typing import Dict, List
+
+SEARCH_TTL = int(os.getenv('SEARCH_TTL', '300'))
+MAX_PARALLEL_UPLOADS = 4
+POLL_INTERVAL = 0.5
+JOB_STAGES = ['queued', 'extracting', 'summarizing', 'embedding', 'indexing', 'done']
+
+# one event loop and one connection pool for the whole streamlit server, shared by every session and rerun
+@st.cache_resource
+def get_background_loop() -> BackgroundLoop:
+    return BackgroundLoop()
+
+async def send_pdf_to_api(client: httpx.AsyncClient, pdf_bytes: bytes, filename: str = "article.pdf") -> dict:
+    files = {'file': (filename, pdf_bytes, 'application/pdf')}
+    response = await request_with_retries(client, 'POST', f'{API_URL}/add', files=files)
+    response.raise_for_status()
+    return response.json()
+
+async def get_job(client: httpx.AsyncClient, job_id: str) -> dict:
+    response = await request_with_retries(client, 'GET', f'{API_URL}/jobs/{job_id}')
+    response.raise_for_status()
+    return response.json()
 
-async def send_pdf_to_api(pdf_bytes: BytesIO, filename: str = "article.pdf"):
-    async with httpx.AsyncClient() as client:
-        files = {'file': (filename, pdf_bytes, 'application/pdf')}
-        headers = {'accept': 'application/json'}
-        response = await client.post(os.path.join(API_URL, 'add'), headers=headers, files=files)
-        return response.json()
+def is_finished(response: dict) -> bool:
+    # a duplicate is answered at once, an accepted upload is a job until it reaches `done` or `failed`
+    return 'job_id' not in response or response.get('stage') in ('done', 'failed')
+
+def job_progress(stage: str) -> float:
+    return JOB_STAGES.index(stage) / (len(JOB_STAGES) - 1) if stage in JOB_STAGES else 1.0
+
+def follow_job(background_loop: BackgroundLoop, job_id: str, label: str) -> dict:
+    progress = st.progress(0.0, text=f"{label}: queued")
+    while True:
+        job = background_loop.run(get_job(background_loop.client, job_id))
+        progress.progress(job_progress(job['stage']), text=f"{label}: {job['stage']}")
+        if is_finished(job):
+            return job
+        time.sleep(POLL_INTERVAL)
 
 # Upload PDF to API manually
-async def handle_manual_upload(uploaded_file: BytesIO):
-    st.write("Processing uploaded article...")
-    file_bytes = uploaded_file.read()
-    response = await send_pdf_to_api(file_bytes)
-    st.write(response)
-    
+def handle_manual_upload(uploaded_file) -> None:
+    background_loop = get_background_loop()
+    file_bytes = uploaded_file.getvalue()
+    digest = hashlib.sha256(file_bytes).hexdigest()
+    # the script is rerun on every interaction while the file stays selected, it is only sent once
+    uploads: Dict[str, dict] = st.session_state.setdefault('uploads', {})
+    if digest not in uploads:
+        st.write("Processing uploaded article...")
+        try:
+            uploads[digest] = background_loop.run(send_pdf_to_api(background_loop.client, file_bytes, uploaded_file.name))
+        except Exception as e:
+            st.error(f"Upload failed: {str(e)}")
+            return
+    if not is_finished(uploads[digest]):
+        # also resumed when a rerun interrupted the previous follow-up
+        uploads[digest] = follow_job(background_loop, uploads[digest]['job_id'], uploaded_file.name)
+    st.write(uploads[digest])
+
+async def ingest_arxiv_result(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, result: arxiv.Result, stages: Dict[str, str]) -> dict:
+    short_id = result.get_short_id()
+    async with semaphore:
+        stages[short_id] = 'downloading'
+        response = await request_with_retries(client, 'GET', result.pdf_url)
+        response.raise_for_status()
+        stages[short_id] = 'uploading'
+        accepted = await send_pdf_to_api(client, response.content, short_id.replace('/', '_') + ".pdf")
+    if is_finished(accepted):
+        stages[short_id] = 'duplicate'
+        return accepted
+    while True:
+        job = await get_job(client, accepted['job_id'])
+        stages[short_id] = job['stage']
+        if is_finished(job):
+            return job
+        await asyncio.sleep(POLL_INTERVAL)
+
 # Upload PDF to API from arXiv
-async def fetch_arxiv_articles(subject: str):
+def fetch_arxiv_articles(subject: str) -> None:
+    background_loop = get_background_loop()
     client = arxiv.Client(
         page_size=10,
         delay_seconds=3,
@@ -34,59 +100,51 @@ async def fetch_arxiv_articles(subject: str):
         max_results=5,
         sort_by=arxiv.SortCriterion.Relevance
     )
-    
-    results_generator = client.results(search)
-    
-    tasks = []
-    
-    async with httpx.AsyncClient() as http_client:
-        for result in results_generator:
-            pdf_url = result.pdf_url
-            st.write(f"Title: {result.title}")
-            
-            try:
-                response = await http_client.get(pdf_url)
-                pdf_bytes = BytesIO(response.content)
-
-                task = send_pdf_to_api(pdf_bytes.getvalue(), result.get_short_id() + ".pdf")
-                tasks.append(task)
-
-            except Exception as e:
-                st.error(f"Error fetching PDF for {result.title}: {str(e)}")
-
-    if tasks:
-        api_responses = await asyncio.gather(*tasks, return_exceptions=True)
-
-        for api_response in api_responses:
-            if isinstance(api_response, Exception):
-                st.error(f"API error: {api_response}")
-            else:
-                st.write(api_response)
-    else:
+
+    results: List[arxiv.Result] = list(client.results(search))
+    if not results:
         st.warning("No articles were fetched.")
-        
-async def search_articles(query: str, nb_neighbors: int = 3):
-    headers = {
-        "accept": "application/json",
-        "Content-Type": "application/json"
+        return
+
+    # downloads, uploads and jobs all run on the background loop, this thread only redraws their stages
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_UPLOADS)
+    stages: Dict[str, str] = {result.get_short_id(): 'waiting' for result in results}
+    futures = {
+        background_loop.submit(ingest_arxiv_result(background_loop.client, semaphore, result, stages)): result
+        for result in results
     }
-    
+    rows = {result.get_short_id(): st.empty() for result in results}
+    progress = st.progress(0.0)
+    pending = set(futures)
+    while True:
+        for result in results:
+            rows[result.get_short_id()].write(f"**{result.title}**: {stages[result.get_short_id()]}")
+        nb_done = len(futures) - len(pending)
+        progress.progress(nb_done / len(futures), text=f"{nb_done}/{len(futures)} articles processed")
+        if not pending:
+            break
+        _, pending = concurrent.futures.wait(pending, timeout=POLL_INTERVAL, return_when=concurrent.futures.FIRST_COMPLETED)
+
+    for future, result in futures.items():
+        if future.exception() is not None:
+            st.error(f"Error while ingesting {result.title}: {str(future.exception())}")
+        else:
+            st.write(future.result())
+
+async def post_search(client: httpx.AsyncClient, query: str, nb_neighbors: int) -> dict:
     payload = {
         "nb_neighbors": nb_neighbors,
         "query": query
     }
-    
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(os.path.join(API_URL, 'search'), headers=headers, json=payload)
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            st.error(f"Error: {e.response.status_code} - {e.response.text}")
-            return None
-        except Exception as e:
-            st.error(f"An error occurred: {str(e)}")
-            return None
+    response = await client.post(f'{API_URL}/search', json=payload)
+    response.raise_for_status()
+    return response.json()
+
+# errors are raised rather than returned, so that they are not cached
+@st.cache_data(ttl=SEARCH_TTL, show_spinner=False)
+def search_articles(query: str, nb_neighbors: int = 3) -> dict:
+    background_loop = get_background_loop()
+    return background_loop.run(post_search(background_loop.client, query, nb_neighbors))
 
 
 st.title("Article Management System")
@@ -95,13 +153,13 @@ st.header("Add Article")
 st.write("You can upload a PDF file to the system.")
 uploaded_file = st.file_uploader("Choose a PDF file", type="pdf")
 if uploaded_file is not None:
-    asyncio.run(handle_manual_upload(uploaded_file))
+    handle_manual_upload(uploaded_file)
 
 st.header("Random Articles")
 st.write("This will fetch 5 random articles from arXiv based on the subject you enter.")
 subject = st.text_input("Enter a subject for article search:")
 if st.button("Fetch Random Articles"):
-    asyncio.run(fetch_arxiv_articles(subject))
+    fetch_arxiv_articles(subject)
 
 st.header("Search Articles")
 st.write("Search for articles based on a query. You can specify the number of articles to return as well.")
@@ -110,7 +168,14 @@ nb_neighbors = st.number_input("Number of articles:", min_value=1, max_value=10,
 
 if st.button("Search"):
     if search_query:
-        results = asyncio.run(search_articles(search_query, nb_neighbors))
+        try:
+            results = search_articles(search_query, int(nb_neighbors))
+        except httpx.HTTPStatusError as e:
+            st.error(f"Error: {e.response.status_code} - {e.response.text}")
+            results = None
+        except Exception as e:
+            st.error(f"An error occurred: {str(e)}")
+            results = None
         if results:
             st.write("Search Results:")
             st.json(results['articles'])